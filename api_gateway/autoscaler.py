@@ -0,0 +1,141 @@
+# AUTOSCALER
+# Decides how many processes a service should run from the load the gateway
+# sees: the p95 upstream latency over a sliding window, requests in flight per
+# instance and requests waiting in a queue. Scaling up needs any signal above
+# its high mark, scaling down needs every signal below its low mark; the gap
+# between the marks, a number of consecutive evaluations and a cooldown after
+# every change keep the instance count from flapping.
+import math
+import time
+from collections import deque
+from typing import Dict, Optional, Tuple
+
+
+class ServiceLoad:
+    """Load signals of one service at one evaluation."""
+
+    def __init__(self, instances: int, in_flight: int, queue_depth: int, p95: Optional[float]):
+        self.instances = instances
+        self.in_flight = in_flight
+        self.queue_depth = queue_depth
+        self.p95 = p95  # seconds, None without recent samples
+
+    @property
+    def in_flight_per_instance(self) -> float:
+        return self.in_flight / max(self.instances, 1)
+
+    def stats(self) -> Dict:
+        return {
+            "instances": self.instances,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "p95_ms": round(self.p95 * 1000, 2) if self.p95 is not None else None,
+        }
+
+
+class Autoscaler:
+    """Scaling decisions for the services in ``bounds`` (service -> (min, max)).
+
+    ``observe(service, latency)`` records every upstream latency;
+    ``evaluate(service, load)`` returns the instance count the service should
+    be scaled to and the reason, or None to leave it alone.
+    """
+
+    def __init__(self, bounds: Dict[str, Tuple[int, int]], p95_high: float, p95_low: float,
+                 in_flight_high: float, in_flight_low: float, queue_high: int = 1, window: float = 10.0,
+                 up_after: int = 2, down_after: int = 5, up_cooldown: float = 10.0, down_cooldown: float = 60.0,
+                 max_samples: int = 4096):
+        self.bounds = bounds
+        self.p95_high = p95_high
+        self.p95_low = p95_low
+        self.in_flight_high = in_flight_high
+        self.in_flight_low = in_flight_low
+        self.queue_high = queue_high
+        self.window = window
+        self.up_after = up_after
+        self.down_after = down_after
+        self.up_cooldown = up_cooldown
+        self.down_cooldown = down_cooldown
+        # service -> (monotonic time, latency) of the most recent requests
+        self.samples: Dict[str, deque] = {service: deque(maxlen=max_samples) for service in bounds}
+        self.scaled_at: Dict[str, float] = {service: 0.0 for service in bounds}
+        self.last_load: Dict[str, ServiceLoad] = {}
+        # Consecutive evaluations asking for more (positive) or fewer (negative) instances
+        self._streak: Dict[str, int] = {service: 0 for service in bounds}
+
+    def observe(self, service: str, latency: float):
+        samples = self.samples.get(service)
+        if samples is not None:
+            samples.append((time.monotonic(), latency))
+
+    # 95th percentile latency over the window, None without samples
+    def p95(self, service: str) -> Optional[float]:
+        samples = self.samples[service]
+        cutoff = time.monotonic() - self.window
+        while samples and samples[0][0] < cutoff:
+            samples.popleft()
+        if not samples:
+            return None
+        latencies = sorted(latency for _, latency in samples)
+        return latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+
+    # Start the cooldown after a change of the instance count (manual or automatic)
+    def scaled(self, service: str):
+        if service in self.scaled_at:
+            self.scaled_at[service] = time.monotonic()
+            self._streak[service] = 0
+
+    def _pressure(self, load: ServiceLoad) -> Optional[str]:
+        if load.queue_depth >= self.queue_high:
+            return f"{load.queue_depth} requests queued"
+        if load.in_flight_per_instance > self.in_flight_high:
+            return f"{load.in_flight_per_instance:.1f} in flight per instance > {self.in_flight_high}"
+        if load.p95 is not None and load.p95 > self.p95_high:
+            return f"p95 {load.p95 * 1000:.0f} ms > {self.p95_high * 1000:.0f} ms"
+        return None
+
+    def _idle(self, load: ServiceLoad) -> bool:
+        return (load.queue_depth == 0
+                and load.in_flight_per_instance < self.in_flight_low
+                and (load.p95 is None or load.p95 < self.p95_low))
+
+    def evaluate(self, service: str, load: ServiceLoad) -> Optional[Tuple[int, str]]:
+        low, high = self.bounds[service]
+        self.last_load[service] = load
+        now = time.monotonic()
+        current = load.instances
+
+        if current < low:
+            return low, f"below the minimum of {low}"
+        if current > high:
+            return high, f"above the maximum of {high}"
+
+        reason = self._pressure(load)
+        if reason:
+            self._streak[service] = max(self._streak[service], 0) + 1
+            if (self._streak[service] >= self.up_after and current < high
+                    and now - self.scaled_at[service] >= self.up_cooldown):
+                # Enough instances to bring in-flight requests under the high mark
+                wanted = math.ceil(load.in_flight / self.in_flight_high) if self.in_flight_high else current + 1
+                return min(high, max(current + 1, wanted)), reason
+        elif self._idle(load):
+            self._streak[service] = min(self._streak[service], 0) - 1
+            if (-self._streak[service] >= self.down_after and current > low
+                    and now - self.scaled_at[service] >= self.down_cooldown):
+                return current - 1, "idle"
+        else:
+            self._streak[service] = 0
+        return None
+
+    def stats(self) -> Dict:
+        now = time.monotonic()
+        return {
+            service: {
+                "min": low,
+                "max": high,
+                "load": self.last_load[service].stats() if service in self.last_load else None,
+                "streak": self._streak[service],
+                "since_last_scale_s": round(now - self.scaled_at[service], 1) if self.scaled_at[service] else None,
+            }
+            for service, (low, high) in self.bounds.items()
+        }
@@ -0,0 +1,216 @@
+# LOAD BALANCER FOR MULTI-INSTANCE SERVICES
+# Each service holds a pool of real instances (host:port); a pluggable policy
+# picks which healthy instance serves the next request, in proportion to the
+# instances' weights.
+import math
+import random
+import time
+from typing import Dict, List, Optional
+
+
+class Instance:
+    """One running copy of a service and the load it is currently carrying."""
+
+    # Weight of the newest sample in the latency moving average
+    EWMA_ALPHA = 0.3
+    # Latency recorded for a request that got no response (connect or reset
+    # error), so an instance that only fails does not look fast
+    ERROR_PENALTY = 1.0  # seconds
+    # Time constant of the decay of the latency estimate while an instance
+    # gets no requests (as in peak EWMA). An instance ranked last after a slow
+    # or failed request is tried again once its estimate drops below the
+    # others', instead of being left out for good
+    LATENCY_DECAY = 2.0  # seconds
+
+    def __init__(self, host: str, port: int, weight: int = 1, metadata: Optional[Dict] = None):
+        self.host = host
+        self.port = port
+        self.url = f"http://{host}:{port}"
+        self.weight = weight
+        self.metadata = metadata or {}
+        self.healthy = True
+        self.draining = False  # leaving the pool: no new requests, in-flight ones finish
+        self.breaker = None
+        self.process = None
+        self.slot = None  # stable index within the service (shared state, health checks)
+        self.lease = None  # registry lease of a dynamically registered instance
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.ewma_latency = 0.0  # seconds, 0 until the first sample
+        self.last_latency = 0.0
+        self.sampled_at = 0.0  # time.monotonic() of the last sample
+
+    # Mark a request as started on this instance
+    def begin(self) -> float:
+        self.in_flight += 1
+        self.requests += 1
+        return time.monotonic()
+
+    # Record the upstream latency of a request (time until the response head)
+    def observe(self, latency: float):
+        now = time.monotonic()
+        self.last_latency = latency
+        if self.ewma_latency == 0.0:
+            self.ewma_latency = latency
+        else:
+            ewma = self.expected_latency(now)
+            self.ewma_latency = ewma + self.EWMA_ALPHA * (latency - ewma)
+        self.sampled_at = now
+
+    # Latency estimate used to rank the instance: the moving average, decayed
+    # by the time since the last sample. 0 without samples
+    def expected_latency(self, now: float) -> float:
+        if self.ewma_latency == 0.0:
+            return 0.0
+        return self.ewma_latency * math.exp(-max(now - self.sampled_at, 0.0) / self.LATENCY_DECAY)
+
+    # Forget the latency history (the instance recovered, e.g. its circuit
+    # breaker closed again)
+    def reset_latency(self):
+        self.ewma_latency = 0.0
+
+    # Record a request that failed before any response arrived
+    def penalize(self, latency: float):
+        self.observe(max(latency, self.ERROR_PENALTY, self.ewma_latency * 2))
+
+    # Mark a request as finished on this instance
+    def end(self, ok: bool = True):
+        self.in_flight -= 1
+        if not ok:
+            self.errors += 1
+
+    def stats(self) -> Dict:
+        return {
+            "url": self.url,
+            "weight": self.weight,
+            "healthy": self.healthy,
+            "draining": self.draining,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "errors": self.errors,
+            "ewma_latency_ms": round(self.ewma_latency * 1000, 2),
+            "last_latency_ms": round(self.last_latency * 1000, 2),
+            "breaker": self.breaker.state if self.breaker else None,
+            "pid": self.process.pid if self.process else None,
+            "lease_id": self.lease.id if self.lease else None,
+            "metadata": self.metadata,
+        }
+
+
+# LOAD BALANCING POLICIES
+# A policy picks one instance from a non-empty list of healthy candidates.
+class RoundRobinPolicy:
+    name = "round_robin"
+
+    def __init__(self):
+        self.cursor = 0
+        # Optional callable returning the next cursor value (shared between
+        # gateway workers); the local cursor is used when it is None
+        self.counter = None
+
+    def pick(self, candidates: List[Instance]) -> Instance:
+        if any(i.weight != 1 for i in candidates):
+            # Each instance takes as many turns as its weight
+            candidates = [i for i in candidates for _ in range(i.weight)]
+        if self.counter is not None:
+            return candidates[self.counter() % len(candidates)]
+        instance = candidates[self.cursor % len(candidates)]
+        self.cursor += 1
+        return instance
+
+
+class LeastOutstandingPolicy:
+    name = "least_outstanding"
+
+    def pick(self, candidates: List[Instance]) -> Instance:
+        return min(candidates, key=lambda i: i.in_flight / i.weight)
+
+
+class PowerOfTwoChoicesPolicy:
+    name = "power_of_two"
+
+    def pick(self, candidates: List[Instance]) -> Instance:
+        if len(candidates) == 1:
+            return candidates[0]
+        a, b = random.sample(candidates, 2)
+        now = time.monotonic()
+        return a if ((a.in_flight / a.weight, a.expected_latency(now))
+                     <= (b.in_flight / b.weight, b.expected_latency(now))) else b
+
+
+class EwmaLatencyPolicy:
+    name = "ewma"
+
+    # Expected cost of sending one more request: latency scaled by queue length
+    # per unit of weight. Instances without samples are assumed to be as fast
+    # as the pool's average, so a new instance gets its share without winning
+    # every pick until its first sample arrives.
+    def pick(self, candidates: List[Instance]) -> Instance:
+        now = time.monotonic()
+        latencies = {i: i.expected_latency(now) for i in candidates}
+        sampled = [latency for latency in latencies.values() if latency]
+        default = sum(sampled) / len(sampled) if sampled else 0.0
+        return min(candidates, key=lambda i: (latencies[i] or default) * (i.in_flight + 1) / i.weight)
+
+
+POLICIES = {
+    policy.name: policy
+    for policy in (RoundRobinPolicy, LeastOutstandingPolicy, PowerOfTwoChoicesPolicy, EwmaLatencyPolicy)
+}
+
+
+class LoadBalancer:
+    """Pool of instances for one service plus the policy used to choose between them."""
+
+    def __init__(self, instances: List[Instance], policy: str = "round_robin"):
+        self.instances = instances
+        self.counter = None
+        self.set_policy(policy)
+
+    def set_policy(self, policy: str):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown load balancing policy '{policy}'. Choose from: {', '.join(POLICIES)}")
+        self.policy = POLICIES[policy]()
+        if hasattr(self.policy, "counter"):
+            self.policy.counter = self.counter
+
+    # Add or remove an instance. The list is replaced rather than changed in
+    # place, so a pick running concurrently sees either the old or the new pool.
+    def add(self, instance: Instance):
+        self.instances = self.instances + [instance]
+
+    def remove(self, instance: Instance):
+        self.instances = [i for i in self.instances if i is not instance]
+
+    # Use a shared cursor for round robin (multi-worker gateway)
+    def share_cursor(self, counter):
+        self.counter = counter
+        if hasattr(self.policy, "counter"):
+            self.policy.counter = counter
+
+    # Pick a healthy instance that is not draining and whose circuit breaker
+    # admits requests, or None
+    def pick(self, exclude: Optional[Instance] = None) -> Optional[Instance]:
+        candidates = [
+            i for i in self.instances
+            if i.healthy and not i.draining and i is not exclude and (i.breaker is None or i.breaker.available())
+        ]
+        if not candidates:
+            return None
+        return self.policy.pick(candidates)
+
+    @property
+    def healthy(self) -> bool:
+        return any(i.healthy for i in self.instances)
+
+    def set_healthy(self, healthy: bool):
+        for instance in self.instances:
+            instance.healthy = healthy
+
+    def stats(self) -> Dict:
+        return {
+            "policy": self.policy.name,
+            "healthy_instances": sum(1 for i in self.instances if i.healthy),
+            "instances": [i.stats() for i in self.instances],
+        }
@@ -0,0 +1,80 @@
+# Benchmark: ChatOps connection bookkeeping with many sockets
+#   python api_gateway/bench_connections.py [connections]
+# Connects `connections` (10000 by default) simulated WebSockets to the
+# ConnectionManager, counts the managers among them, then disconnects them
+# in random order. The time per operation is reported for every tenth of the
+# connections and should stay flat as the number of connections grows.
+import asyncio
+import contextlib
+import gc
+import os
+import random
+import statistics
+import sys
+import time
+
+from connections import ConnectionManager
+
+
+class FakeWebSocket:
+    """Just enough of a starlette WebSocket for the manager and its outbox."""
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message: str):
+        pass
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        pass
+
+
+def report(label: str, chunks):
+    per_op = [seconds / count * 1e6 for seconds, count in chunks]
+    print(f"{label:>10}: " + " ".join(f"{us:6.1f}" for us in per_op)
+          + f"   µs/op per tenth (spread {max(per_op) / min(per_op):.2f}x)")
+
+
+async def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    tenth = max(total // 10, 1)
+    manager = ConnectionManager(queue_size=256, overflow_policy="drop_oldest")
+    sockets = [FakeWebSocket() for _ in range(total)]
+
+    connects, disconnects, role_counts = [], [], []
+    # Like timeit, keep garbage collection pauses out of the timings; the
+    # manager prints every connect and disconnect
+    gc.collect()
+    gc.disable()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for start in range(0, total, tenth):
+            began = time.perf_counter()
+            for index in range(start, min(start + tenth, total)):
+                await manager.connect(sockets[index], f"user_{index}", "manager" if index % 10 == 0 else "client")
+            connects.append((time.perf_counter() - began, tenth))
+
+            began = time.perf_counter()
+            for _ in range(100):
+                manager.role_count("manager")
+            role_counts.append((time.perf_counter() - began, 100))
+
+        # Let the writer tasks start before they are cancelled
+        await asyncio.sleep(0)
+        random.shuffle(sockets)
+        for start in range(0, total, tenth):
+            began = time.perf_counter()
+            for websocket in sockets[start:start + tenth]:
+                manager.disconnect(websocket)
+            disconnects.append((time.perf_counter() - began, tenth))
+    gc.enable()
+
+    print(f"{total} connections, {len(manager)} left after disconnecting them all")
+    report("connect", connects)
+    report("role count", role_counts)
+    report("disconnect", disconnects)
+    print(f"median: connect {statistics.median(s / n for s, n in connects) * 1e6:.1f} µs, "
+          f"disconnect {statistics.median(s / n for s, n in disconnects) * 1e6:.1f} µs")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,71 @@
+# Benchmark: cold service starts vs starts forked from a warm zygote
+#   python api_gateway/bench_zygote.py [service] [runs]
+# Starts the service (product by default) `runs` times each way on a free
+# port and reports the time from spawn until /health answers.
+import asyncio
+import os
+import statistics
+import sys
+import urllib.request
+
+from supervisor import SupervisedProcess, free_port
+from zygote import Zygote
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+async def ready(url: str) -> bool:
+    def probe():
+        with urllib.request.urlopen(f"{url}/health", timeout=1) as response:
+            return response.status == 200
+    try:
+        return await asyncio.to_thread(probe)
+    except OSError:
+        return False
+
+
+async def start_once(command, zygote) -> float:
+    port = free_port()
+    url = f"http://localhost:{port}"
+    process = SupervisedProcess(f"bench@{url}", command, {**os.environ, "SERVICE_PORT": str(port)},
+                                lambda: ready(url), restart=False, zygote=zygote)
+    try:
+        if not await process.start():
+            raise RuntimeError(f"{url} did not become ready")
+        return process.start_latency
+    finally:
+        await process.stop()
+
+
+def report(label: str, latencies):
+    print(f"{label:>7}: mean {statistics.mean(latencies) * 1000:7.1f} ms   "
+          f"median {statistics.median(latencies) * 1000:7.1f} ms   "
+          f"min {min(latencies) * 1000:7.1f} ms   max {max(latencies) * 1000:7.1f} ms")
+
+
+async def main():
+    service = sys.argv[1] if len(sys.argv) > 1 else "product"
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    command = [sys.executable, os.path.join(project_root, f"{service}_service", "server.py")]
+
+    cold = [await start_once(command, None) for _ in range(runs)]
+    report("cold", cold)
+
+    if not Zygote.supported():
+        print("zygote: not supported on this platform (no fork)")
+        return
+    zygote = Zygote(service, command)
+    if not await zygote.start():
+        print("zygote: did not start")
+        return
+    print(f"zygote: imports preloaded once in {zygote.preload_time * 1000:.1f} ms")
+    try:
+        warm = [await start_once(command, zygote) for _ in range(runs)]
+    finally:
+        await zygote.stop()
+    report("zygote", warm)
+    print(f"speedup: {statistics.median(cold) / statistics.median(warm):.1f}x (median)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
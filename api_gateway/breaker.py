@@ -0,0 +1,154 @@
+# CIRCUIT BREAKER
+# Closed/open/half-open state machine that trips on a rolling error rate or
+# slow-call rate and lets a limited number of probe requests through once the
+# open period is over.
+import time
+from collections import deque
+from typing import Callable, Dict, Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Circuit breaker for one service or one service instance.
+
+    ``on_transition(breaker, old_state, new_state)`` is called on every state
+    change.
+    """
+
+    def __init__(self, name: str, window: float = 10.0, min_calls: int = 10, error_rate: float = 0.5,
+                 slow_call_duration: float = 2.0, slow_call_rate: float = 0.8, open_duration: float = 5.0,
+                 half_open_probes: int = 3, on_transition: Optional[Callable] = None):
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call_duration = slow_call_duration
+        self.slow_call_rate = slow_call_rate
+        self.open_duration = open_duration
+        self.half_open_probes = half_open_probes
+        self.on_transition = on_transition
+
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.probes_in_flight = 0
+        self.probe_successes = 0
+        self.times_opened = 0
+        self.rejected = 0
+        # Rolling window of one-second buckets: [second, calls, errors, slow]
+        self._buckets: deque = deque()
+
+    # Whether a request could be let through right now (no side effects)
+    def available(self) -> bool:
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            return time.monotonic() - self.opened_at >= self.open_duration
+        return self.probes_in_flight < self.half_open_probes
+
+    # Ask to send one request; every granted request must be followed by record()
+    def try_acquire(self) -> bool:
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.open_duration:
+            self._transition(HALF_OPEN)
+        if self.state == CLOSED:
+            return True
+        if self.state == HALF_OPEN and self.probes_in_flight < self.half_open_probes:
+            self.probes_in_flight += 1
+            return True
+        self.rejected += 1
+        return False
+
+    # Give back a permit from try_acquire() for a request that was never sent
+    def cancel(self):
+        if self.state == HALF_OPEN:
+            self.probes_in_flight = max(0, self.probes_in_flight - 1)
+
+    # Seconds until an open breaker lets probes through again
+    def retry_after(self) -> float:
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.open_duration - (time.monotonic() - self.opened_at))
+
+    # Record the outcome of a request granted by try_acquire()
+    def record(self, ok: bool, latency: float = 0.0):
+        slow = latency >= self.slow_call_duration
+        if self.state == HALF_OPEN:
+            self.probes_in_flight = max(0, self.probes_in_flight - 1)
+            if not ok or slow:
+                self._open()
+            else:
+                self.probe_successes += 1
+                if self.probe_successes >= self.half_open_probes:
+                    self._transition(CLOSED)
+            return
+        if self.state == OPEN:
+            # A request that was already in flight when the breaker opened
+            return
+
+        self._add(ok, slow)
+        calls, errors, slow_calls = self._totals()
+        if calls >= self.min_calls and (errors / calls >= self.error_rate or slow_calls / calls >= self.slow_call_rate):
+            self._open()
+
+    def _add(self, ok: bool, slow: bool):
+        second = int(time.monotonic())
+        if not self._buckets or self._buckets[-1][0] != second:
+            self._buckets.append([second, 0, 0, 0])
+        bucket = self._buckets[-1]
+        bucket[1] += 1
+        if not ok:
+            bucket[2] += 1
+        if slow:
+            bucket[3] += 1
+
+    # Calls, errors and slow calls over the rolling window
+    def _totals(self):
+        horizon = time.monotonic() - self.window
+        while self._buckets and self._buckets[0][0] < horizon:
+            self._buckets.popleft()
+        calls = errors = slow = 0
+        for _, bucket_calls, bucket_errors, bucket_slow in self._buckets:
+            calls += bucket_calls
+            errors += bucket_errors
+            slow += bucket_slow
+        return calls, errors, slow
+
+    def _open(self):
+        self.opened_at = time.monotonic()
+        self.times_opened += 1
+        self._transition(OPEN)
+
+    # Force the breaker open (e.g. simulated failure) or closed (recovery)
+    def force_open(self):
+        self._open()
+
+    def reset(self):
+        self._transition(CLOSED)
+
+    # Take over a state decided elsewhere (another gateway worker)
+    def adopt(self, state: str, opened_at: float):
+        self.opened_at = opened_at
+        self._transition(state)
+
+    def _transition(self, new_state: str):
+        old_state = self.state
+        self.state = new_state
+        self.probes_in_flight = 0
+        self.probe_successes = 0
+        if new_state == CLOSED:
+            self._buckets.clear()
+        if old_state != new_state and self.on_transition:
+            self.on_transition(self, old_state, new_state)
+
+    def stats(self) -> Dict:
+        calls, errors, slow = self._totals()
+        return {
+            "state": self.state,
+            "window_calls": calls,
+            "window_error_rate": round(errors / calls, 3) if calls else 0.0,
+            "window_slow_rate": round(slow / calls, 3) if calls else 0.0,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+        }
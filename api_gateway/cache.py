@@ -0,0 +1,181 @@
+# IN-PROCESS RESPONSE CACHE FOR THE API GATEWAY
+# LRU cache of upstream GET responses with a TTL per route template, a memory
+# cap and hit/miss counters. Writes to an entity invalidate its cached reads
+# and bump the entity's generation: a read that started before the write
+# compares generations before caching what it got, so it cannot put pre-write
+# data back. Every entry remembers the generation it was cached under and is
+# only served while that generation is current; with several gateway workers
+# the generations live in the shared segment (see share_generations), so a
+# write handled by one worker also invalidates what the others cached.
+import re
+import time
+import zlib
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Set, Tuple
+
+from upstream import UpstreamResponse
+
+
+class CacheRule:
+    """Caches GETs whose path exactly matches ``template`` for ``ttl`` seconds.
+
+    ``{name}`` matches a single path segment, as in the route table.
+    """
+
+    def __init__(self, template: str, ttl: float):
+        self.template = template
+        self.ttl = ttl
+        pattern = re.sub(r"\\\{\w+\\\}", "[^/]+", re.escape(template))
+        self._exact = re.compile(f"^{pattern}$")
+        self._prefix = re.compile(f"^{pattern}(?=/|$)")
+
+    def matches(self, path: str) -> bool:
+        return self._exact.match(path) is not None
+
+    # The cached entity path a write request affects, e.g.
+    # /products/1/purchase -> /products/1
+    def entity_path(self, path: str) -> Optional[str]:
+        match = self._prefix.match(path)
+        return match.group(0) if match else None
+
+
+class _Entry:
+    __slots__ = ("response", "expires_at", "size", "path", "origin", "generation")
+
+    def __init__(self, response: UpstreamResponse, expires_at: float, size: int, path: str,
+                 origin: Optional[str], generation: int):
+        self.response = response
+        self.expires_at = expires_at
+        self.size = size
+        self.path = path
+        self.origin = origin  # url of the instance that served the response
+        self.generation = generation  # of the entity path when the read started
+
+
+class ResponseCache:
+    """LRU response cache bounded by the total size of the cached responses."""
+
+    # Generation counters are striped by path hash, so memory stays fixed; two
+    # paths sharing a stripe only cost a skipped put or an early miss
+    GENERATION_STRIPES = 4096
+
+    def __init__(self, rules: Dict[str, float], max_bytes: int, max_entry_bytes: Optional[int] = None):
+        self.rules = [CacheRule(template, ttl) for template, ttl in rules.items()]
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes or max_bytes // 16
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._keys_by_path: Dict[str, Set[str]] = {}
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.stale_puts = 0
+        self._generations = [0] * self.GENERATION_STRIPES
+        self._read_generation: Callable[[int], int] = self._generations.__getitem__
+        self._bump_generation: Callable[[int], None] = self._bump_local
+
+    # Keep the generations elsewhere (the shared segment of a multi-worker
+    # gateway): read(stripe) returns one, bump(stripe) changes it
+    def share_generations(self, read: Callable[[int], int], bump: Callable[[int], None]):
+        self._read_generation = read
+        self._bump_generation = bump
+
+    def _bump_local(self, stripe: int):
+        self._generations[stripe] += 1
+
+    # Stripe of a path; crc32 rather than hash(), which differs between processes
+    def _stripe(self, path: str) -> int:
+        return zlib.crc32(path.encode()) % self.GENERATION_STRIPES
+
+    # The rule that makes a GET path cacheable, if any
+    def rule_for(self, path: str) -> Optional[CacheRule]:
+        for rule in self.rules:
+            if rule.matches(path):
+                return rule
+        return None
+
+    # The cached response and the url of the instance that served it
+    def get(self, key: str) -> Optional[Tuple[UpstreamResponse, Optional[str]]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry.expires_at <= time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return None
+        if entry.generation != self.generation(entry.path):
+            # Written since, possibly through another worker
+            self._remove(key)
+            self.invalidations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry.response, entry.origin
+
+    # Changes whenever a write touches the entity at path
+    def generation(self, path: str) -> int:
+        return self._read_generation(self._stripe(path))
+
+    # generation is the entity's generation when the read started; the
+    # response is not cached if a write happened since
+    def put(self, key: str, path: str, response: UpstreamResponse, ttl: float, origin: Optional[str] = None,
+            generation: Optional[int] = None):
+        current = self.generation(path)
+        if generation is not None and generation != current:
+            self.stale_puts += 1
+            return
+        size = len(key) + len(response.content) + sum(len(k) + len(v) for k, v in response.headers)
+        if size > self.max_entry_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = _Entry(response, time.monotonic() + ttl, size, path, origin, current)
+        self._keys_by_path.setdefault(path, set()).add(key)
+        self.size += size
+        # Evict least recently used entries until we are under the memory cap
+        while self.size > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    # Drop every cached variant (query string) of the entity a write touched
+    def invalidate_for_write(self, path: str):
+        for rule in self.rules:
+            entity_path = rule.entity_path(path)
+            if entity_path is None:
+                continue
+            self._bump_generation(self._stripe(entity_path))
+            for key in list(self._keys_by_path.get(entity_path, ())):
+                self._remove(key)
+                self.invalidations += 1
+
+    def clear(self):
+        self._entries.clear()
+        self._keys_by_path.clear()
+        self.size = 0
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        self.size -= entry.size
+        keys = self._keys_by_path.get(entry.path)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_path[entry.path]
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "size_bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "stale_puts": self.stale_puts,
+        }
@@ -1,3 +1,214 @@
 # Configuration settings
-HEALTH_CHECK_INTERVAL = 10  # seconds
-REQUEST_TIMEOUT = 5  # seconds
\ No newline at end of file
+import os
+
+HEALTH_CHECK_INTERVAL = 10  # seconds between health probes of each instance
+REQUEST_TIMEOUT = 5  # seconds
+
+# Upstream connection pool settings (one pool per service)
+UPSTREAM_POOL_SIZE = 20  # max keep-alive connections and in-flight requests per service
+UPSTREAM_CONNECT_TIMEOUT = 2  # seconds
+UPSTREAM_READ_TIMEOUT = REQUEST_TIMEOUT  # seconds
+UPSTREAM_POOL_TIMEOUT = 5  # seconds to wait for a free connection before failing
+UPSTREAM_KEEPALIVE_EXPIRY = 4  # seconds an idle connection is kept (below uvicorn's 5s keep-alive)
+
+# Forward upstream status, headers and body bytes unchanged; gateway annotations
+# go in X- response headers. Set to False to merge them into JSON bodies instead.
+PROXY_PASSTHROUGH = True
+
+# Instances (ports on localhost) started for each service, and the policy used
+# to spread requests across them: round_robin, least_outstanding, power_of_two, ewma.
+# Every service process keeps its data in memory, so instances of a service do
+# not share data: with more than one, a write lands on one instance only and
+# reads differ depending on which instance answers. One instance per service
+# by default; add ports here (or use `scale`) only for stateless demos and
+# load tests, e.g. GATEWAY_PRODUCT_PORTS=8002,8004
+SERVICE_INSTANCES = {
+    "user": [8001],
+    "product": [int(port) for port in os.environ.get("GATEWAY_PRODUCT_PORTS", "8002").split(",")],
+    "order": [8003],
+}
+LOAD_BALANCER_POLICIES = {
+    "user": "round_robin",
+    "product": "power_of_two",
+    "order": "least_outstanding",
+}
+
+# Gateway response cache: GET paths (route templates) cached with their TTL in seconds.
+# The same paths are coalesced: identical concurrent GETs share one upstream call.
+CACHE_ENABLED = True
+CACHE_MAX_BYTES = 16 * 1024 * 1024
+CACHE_TTLS = {
+    "/users/{user_id}": 30,
+    "/products/{product_id}": 5,
+    "/orders/{order_id}": 10,
+}
+COALESCE_ENABLED = True
+
+# Circuit breakers (one per service and one per instance)
+BREAKER_WINDOW = 10  # seconds of history used for the error and slow-call rates
+BREAKER_MIN_CALLS = 5  # calls in the window before an instance breaker may trip
+SERVICE_BREAKER_MIN_CALLS = 20  # larger, so one bad instance trips its own breaker first
+BREAKER_ERROR_RATE = 0.5  # trip when this share of calls fail (transport errors and 5xx)
+BREAKER_SLOW_CALL_DURATION = 2  # seconds; slower calls count as slow
+BREAKER_SLOW_CALL_RATE = 0.8  # trip when this share of calls are slow
+BREAKER_OPEN_DURATION = 5  # seconds to stay open before probing
+BREAKER_HALF_OPEN_PROBES = 3  # concurrent probes allowed (and successes needed to close)
+
+# Retries and hedged requests for idempotent GETs. Replayable requests that fail
+# are retried once on another instance; GET-by-id reads on hedged routes also
+# send a second copy to another instance once the first is slower than
+# HEDGE_DELAY (seconds, or "p95" for the service's observed 95th percentile).
+# Both draw from a per-service token bucket: every request adds
+# RETRY_BUDGET_RATIO tokens, plus RETRY_BUDGET_MIN_PER_SEC per second.
+RETRY_ENABLED = True
+HEDGE_ENABLED = True
+HEDGE_DELAY = "p95"
+HEDGE_FALLBACK_DELAY = 0.1  # seconds, used until enough latencies were observed
+RETRY_BUDGET_RATIO = 0.1
+RETRY_BUDGET_MIN_PER_SEC = 1
+RETRY_BUDGET_MAX_TOKENS = 20
+
+# Adaptive concurrency limit per upstream service. The limit moves between MIN
+# and MAX with the observed latency ("gradient" or "aimd"); requests over it
+# wait up to CONCURRENCY_QUEUE_TIMEOUT seconds in a queue of
+# CONCURRENCY_QUEUE_SIZE and are otherwise rejected with 503.
+CONCURRENCY_LIMIT_ALGORITHM = "gradient"
+CONCURRENCY_INITIAL_LIMIT = 20
+CONCURRENCY_MIN_LIMIT = 2
+CONCURRENCY_MAX_LIMIT = 100
+CONCURRENCY_QUEUE_SIZE = 50
+CONCURRENCY_QUEUE_TIMEOUT = 0.5  # seconds
+
+# Multi-worker mode: number of gateway worker processes (1 = single process).
+# Workers share service state through shared memory; one elected leader worker
+# runs the health checks and starts/stops the service processes.
+GATEWAY_WORKERS = int(os.environ.get("GATEWAY_WORKERS", 1))
+SHARED_STATE_SYNC_INTERVAL = 0.1  # seconds between syncs of each worker with the shared state
+SHARED_STATE_STALE_AFTER = 10  # seconds without a heartbeat before a worker or the leader is replaced
+SHARED_STATE_COMMAND_TIMEOUT = 30  # seconds a worker waits for the leader to start/stop a service
+
+# Health checks: every instance is probed on its own jittered schedule. An
+# instance goes down after HEALTH_CHECK_FALL consecutive failed probes and back
+# up after HEALTH_CHECK_RISE successful ones; probes repeat every
+# HEALTH_CHECK_FAST_INTERVAL while a change is being confirmed and back off (up
+# to HEALTH_CHECK_MAX_BACKOFF) while an instance stays down.
+HEALTH_CHECK_SERVICE_INTERVALS = {}  # per-service interval overrides, e.g. {"order": 5}
+HEALTH_CHECK_FAST_INTERVAL = 1  # seconds
+HEALTH_CHECK_JITTER = 0.1  # +/- share of the interval
+HEALTH_CHECK_TIMEOUT = 2  # seconds
+HEALTH_CHECK_RISE = 2
+HEALTH_CHECK_FALL = 2
+HEALTH_CHECK_MAX_BACKOFF = 60  # seconds
+
+# Heartbeats: service processes started by the gateway send a UDP heartbeat to
+# HEARTBEAT_HOST:HEARTBEAT_PORT every HEARTBEAT_INTERVAL seconds. An instance
+# is marked down after HEARTBEAT_MISSED_BEATS missed beats, and healthy
+# instances with fresh heartbeats are not polled on /health.
+HEARTBEAT_ENABLED = True
+HEARTBEAT_HOST = "127.0.0.1"
+HEARTBEAT_PORT = 8099
+HEARTBEAT_INTERVAL = 0.25  # seconds
+HEARTBEAT_MISSED_BEATS = 3
+
+# Dynamic service registry: extra instances register with
+# POST /management/registry/{service} and renew their lease with
+# PUT /management/registry/leases/{lease_id} before the TTL runs out.
+REGISTRY_CAPACITY = 8  # registered instances per service
+REGISTRY_DEFAULT_TTL = 10  # seconds
+REGISTRY_MIN_TTL = 1
+REGISTRY_MAX_TTL = 300
+REGISTRY_SWEEP_INTERVAL = 0.5  # seconds between checks for expired leases
+
+# Service processes: a started process is ready once its /health answers,
+# polled every SERVICE_READY_POLL_INTERVAL seconds, doubling up to
+# SERVICE_READY_MAX_POLL_INTERVAL, for at most SERVICE_READY_TIMEOUT seconds.
+# Processes that exit on their own are restarted after SERVICE_RESTART_BACKOFF
+# seconds, doubling on every crash up to SERVICE_RESTART_MAX_BACKOFF.
+SERVICE_READY_TIMEOUT = 15
+SERVICE_READY_POLL_INTERVAL = 0.05
+SERVICE_READY_MAX_POLL_INTERVAL = 1
+SERVICE_AUTO_RESTART = True
+SERVICE_RESTART_BACKOFF = 1
+SERVICE_RESTART_MAX_BACKOFF = 30
+SERVICE_STOP_TIMEOUT = 5  # seconds to wait after SIGTERM before killing a process
+
+# Output of the service processes is kept in a ring buffer per service
+SERVICE_LOG_LINES = 1000  # lines kept per service
+SERVICE_LOG_LINE_BYTES = 256  # bytes per line, longer lines are cut
+
+# Scaling: "scale <service> <n>" runs n processes of a service. Processes
+# beyond the configured instances get free ports and count against
+# REGISTRY_CAPACITY.
+SCALE_MAX_INSTANCES = 8
+
+# Draining: an instance that is scaled away, replaced or stopped gets no new
+# requests and up to SERVICE_DRAIN_TIMEOUT seconds to finish the ones in
+# flight before it is sent SIGTERM
+SERVICE_DRAIN_TIMEOUT = 30  # seconds
+
+# Autoscaling (optional, GATEWAY_AUTOSCALE=1): every AUTOSCALE_INTERVAL seconds
+# the services in AUTOSCALE_SERVICES ({service: (min, max) instances}) are
+# scaled up when requests queue, the in-flight requests per instance exceed
+# AUTOSCALE_IN_FLIGHT_HIGH or the p95 latency over the last AUTOSCALE_WINDOW
+# seconds exceeds AUTOSCALE_P95_HIGH, for AUTOSCALE_UP_AFTER evaluations in a
+# row. They are scaled down one instance at a time when every signal stayed
+# under its low mark for AUTOSCALE_DOWN_AFTER evaluations. No change is made
+# within the cooldown after the previous one (manual scaling included).
+AUTOSCALE_ENABLED = os.environ.get("GATEWAY_AUTOSCALE", "0") == "1"
+AUTOSCALE_SERVICES = {"product": (1, 4)}
+AUTOSCALE_INTERVAL = 1  # seconds
+AUTOSCALE_WINDOW = 10  # seconds of latency samples
+AUTOSCALE_P95_HIGH = 0.25  # seconds
+AUTOSCALE_P95_LOW = 0.05
+AUTOSCALE_IN_FLIGHT_HIGH = 8  # requests per instance
+AUTOSCALE_IN_FLIGHT_LOW = 2
+AUTOSCALE_QUEUE_HIGH = 1  # queued requests
+AUTOSCALE_UP_AFTER = 2  # evaluations
+AUTOSCALE_DOWN_AFTER = 10
+AUTOSCALE_UP_COOLDOWN = 10  # seconds
+AUTOSCALE_DOWN_COOLDOWN = 60
+
+# Zygotes: service processes are forked from a warm interpreter per service
+# that has already imported fastapi, pydantic and uvicorn (POSIX only; cold
+# starts otherwise, or when the zygote is not ready within ZYGOTE_START_TIMEOUT)
+ZYGOTE_ENABLED = True
+ZYGOTE_START_TIMEOUT = 30  # seconds
+
+# Graceful gateway shutdown (SIGTERM or Ctrl+C): /health answers 503 for
+# GATEWAY_DRAIN_DELAY seconds before the gateway stops accepting connections,
+# ChatOps clients are closed with code 1012 and told to reconnect after a
+# random delay between WS_RECONNECT_MIN_DELAY_MS and WS_RECONNECT_MAX_DELAY_MS,
+# and in-flight requests get GATEWAY_SHUTDOWN_TIMEOUT seconds to finish
+GATEWAY_DRAIN_DELAY = 0  # seconds
+GATEWAY_SHUTDOWN_TIMEOUT = 30  # seconds
+WS_RECONNECT_MIN_DELAY_MS = 1000
+WS_RECONNECT_MAX_DELAY_MS = 5000
+
+# ChatOps WebSocket send queues: every connection queues up to
+# WS_SEND_QUEUE_SIZE outgoing messages, sent by its own writer task. When a
+# client reads slower than messages arrive, WS_OVERFLOW_POLICY decides:
+# "drop_oldest", "coalesce" (a newer event about the same breaker or instance
+# replaces the queued one, otherwise drop_oldest) or "disconnect" (close the
+# client with 1008 so it reconnects). Closing a connection waits at most
+# WS_CLOSE_TIMEOUT seconds for its queue to be sent
+WS_SEND_QUEUE_SIZE = 256
+WS_OVERFLOW_POLICY = os.environ.get("GATEWAY_WS_OVERFLOW_POLICY", "coalesce")
+WS_CLOSE_TIMEOUT = 5  # seconds
+
+# ChatOps topics: clients only get the messages of the topics they subscribe
+# to (?topics=health.product,alerts when connecting, or the subscribe and
+# unsubscribe commands). Topics: health.<service> (instances, breakers,
+# processes, scaling), <service>s.events (writes routed to the service, e.g.
+# orders.events), commands, alerts and presence; "prefix.*" and "*" match
+# several. Clients that name no topics get WS_DEFAULT_TOPICS
+WS_DEFAULT_TOPICS = ["*"]
+WS_MAX_SUBSCRIPTIONS = 64
+
+# Dashboard status stream (GET /management/status/stream, server-sent
+# events): the status view is rebuilt every STATUS_STREAM_INTERVAL seconds
+# while someone listens, and each client gets at most one delta every
+# STATUS_STREAM_MIN_INTERVAL seconds. Idle streams get a keep-alive comment
+# every STATUS_STREAM_KEEPALIVE seconds so proxies do not close them
+STATUS_STREAM_INTERVAL = 0.5  # seconds
+STATUS_STREAM_MIN_INTERVAL = 1  # seconds
+STATUS_STREAM_KEEPALIVE = 15  # seconds
@@ -0,0 +1,217 @@
+# CHATOPS CONNECTION REGISTRY
+# Every WebSocket gets one Connection (id, user, role, send queue), indexed by
+# connection id and by socket, and the ids of each role are kept in a set of
+# their own. Connecting, disconnecting, looking up a client and counting the
+# clients of a role cost the same with ten or ten thousand connections.
+# Compare with `python api_gateway/bench_connections.py 10000`.
+#
+# Messages are published to topics (health.product, commands, orders.events,
+# alerts, ...) and only reach the connections subscribed to them: an index
+# maps every topic to the ids of its subscribers, so the cost of a message
+# depends on how many clients want it rather than on how many are connected.
+# A subscription is a topic, a "prefix.*" pattern matching every topic below
+# the prefix, or "*" for everything.
+import asyncio
+import itertools
+import json
+import random
+import re
+import time
+from typing import Dict, Iterable, Iterator, Optional, Sequence, Set
+
+from outbox import Outbox
+
+TOPIC_PATTERN = re.compile(r"^(\*|[a-z0-9_-]+(\.[a-z0-9_-]+)*(\.\*)?)$")
+
+
+class Connection:
+    """State of one ChatOps WebSocket."""
+
+    __slots__ = ("id", "websocket", "user_id", "role", "outbox", "topics", "connected_at")
+
+    def __init__(self, connection_id: int, websocket, user_id: str, role: str, outbox: Outbox):
+        self.id = connection_id
+        self.websocket = websocket
+        self.user_id = user_id
+        self.role = role
+        self.outbox = outbox
+        self.topics: Set[str] = set()
+        self.connected_at = time.time()
+
+
+class ConnectionManager:
+    """Connected ChatOps clients; every message goes through the client's
+    bounded send queue (see outbox.py)."""
+
+    def __init__(self, queue_size: int, overflow_policy: str, close_timeout: float = 5.0,
+                 max_subscriptions: int = 64):
+        self.queue_size = queue_size
+        self.overflow_policy = overflow_policy
+        self.close_timeout = close_timeout
+        self.max_subscriptions = max_subscriptions
+        self._ids = itertools.count(1)
+        # Connection id -> connection, and the same connections by socket
+        self.connections: Dict[int, Connection] = {}
+        self.by_socket: Dict[object, Connection] = {}
+        # Role -> ids of the connections with that role
+        self.roles: Dict[str, Set[int]] = {}
+        # Topic, pattern or "*" -> ids of the subscribed connections
+        self.subscribers: Dict[str, Set[int]] = {}
+        # Connections closed because their queue overflowed
+        self.slow_disconnects = 0
+
+    def __len__(self) -> int:
+        return len(self.connections)
+
+    # Connect a new WebSocket client, subscribed to these topics
+    async def connect(self, websocket, user_id: str, role: str = "client",
+                      topics: Iterable[str] = ("*",)) -> Connection:
+        await websocket.accept()
+        outbox = Outbox(websocket, self.queue_size, self.overflow_policy, name=user_id,
+                        close_timeout=self.close_timeout)
+        connection = Connection(next(self._ids), websocket, user_id, role, outbox)
+        self.connections[connection.id] = connection
+        self.by_socket[websocket] = connection
+        self.roles.setdefault(role, set()).add(connection.id)
+        for topic in topics:
+            try:
+                self.subscribe(websocket, topic)
+            except ValueError as e:
+                print(f"WebSocket {user_id}: {e}")
+        print(f"WebSocket connected for user {user_id} with role {role}. Total: {len(self.connections)}")
+        return connection
+
+    # Disconnect a WebSocket client
+    def disconnect(self, websocket):
+        connection = self.by_socket.pop(websocket, None)
+        if connection is None:
+            return
+        del self.connections[connection.id]
+        self.roles[connection.role].discard(connection.id)
+        for topic in connection.topics:
+            self._unindex(topic, connection.id)
+        connection.outbox.cancel()
+        print(f"WebSocket disconnected for user {connection.user_id}. Total: {len(self.connections)}")
+
+    def get(self, websocket) -> Optional[Connection]:
+        return self.by_socket.get(websocket)
+
+    # Queue a message for a client; it is sent by the client's writer task.
+    # Messages with the same key may be coalesced when the client falls behind
+    def _send(self, connection: Connection, message: str, key: Optional[str] = None):
+        outbox = connection.outbox
+        if not outbox.closed and not outbox.put(message, key):
+            # Only an overflow with the disconnect policy refuses an open outbox
+            self.slow_disconnects += 1
+
+    # Send a message to a specific WebSocket client
+    def send_personal_message(self, message: str, websocket):
+        connection = self.by_socket.get(websocket)
+        if connection:
+            self._send(connection, message)
+
+    # Subscribe a client to a topic. Raises ValueError for an invalid topic
+    # or when the client has too many subscriptions
+    def subscribe(self, websocket, topic: str) -> bool:
+        connection = self.by_socket.get(websocket)
+        if connection is None:
+            return False
+        if not TOPIC_PATTERN.match(topic):
+            raise ValueError(f"Invalid topic {topic!r}")
+        if topic in connection.topics:
+            return False
+        if len(connection.topics) >= self.max_subscriptions:
+            raise ValueError(f"At most {self.max_subscriptions} subscriptions per connection")
+        connection.topics.add(topic)
+        self.subscribers.setdefault(topic, set()).add(connection.id)
+        return True
+
+    def unsubscribe(self, websocket, topic: str) -> bool:
+        connection = self.by_socket.get(websocket)
+        if connection is None or topic not in connection.topics:
+            return False
+        connection.topics.discard(topic)
+        self._unindex(topic, connection.id)
+        return True
+
+    def _unindex(self, topic: str, connection_id: int):
+        subscribed = self.subscribers.get(topic)
+        if subscribed is not None:
+            subscribed.discard(connection_id)
+            if not subscribed:
+                del self.subscribers[topic]
+
+    # Subscription keys matching a topic: the topic, the pattern of every
+    # prefix (a.b.c -> a.b.*, a.*) and "*"
+    @staticmethod
+    def _matching(topic: str) -> Iterator[str]:
+        yield topic
+        parts = topic.split(".")
+        for depth in range(len(parts) - 1, 0, -1):
+            yield ".".join(parts[:depth]) + ".*"
+        yield "*"
+
+    def has_subscribers(self, topic: str) -> bool:
+        return any(key in self.subscribers for key in self._matching(topic))
+
+    # Queue a message for every client subscribed to any of these topics
+    # (once each, however many of its subscriptions match). Never waits on a
+    # slow client. Returns the number of recipients
+    def publish(self, topics: Sequence[str], message: str, exclude=None, key: Optional[str] = None) -> int:
+        recipients: Set[int] = set()
+        for topic in topics:
+            for subscription in self._matching(topic):
+                subscribed = self.subscribers.get(subscription)
+                if subscribed:
+                    recipients |= subscribed
+        for connection_id in recipients:
+            connection = self.connections[connection_id]
+            if connection.websocket is not exclude:
+                self._send(connection, message, key)
+        return len(recipients)
+
+    # Topics of a client
+    def topics_of(self, websocket) -> Set[str]:
+        connection = self.by_socket.get(websocket)
+        return set(connection.topics) if connection else set()
+
+    # Get the role of a WebSocket client
+    def get_user_role(self, websocket) -> str:
+        connection = self.by_socket.get(websocket)
+        return connection.role if connection else "client"
+
+    # Number of connected clients with this role
+    def role_count(self, role: str) -> int:
+        return len(self.roles.get(role, ()))
+
+    # Close every connection with 1012 (service restart) and a reconnect hint,
+    # spread over a range so clients do not all come back at once
+    async def close_all(self, min_delay_ms: int, max_delay_ms: int):
+        async def close(outbox: Outbox):
+            delay_ms = random.randint(min_delay_ms, max_delay_ms)
+            outbox.put(json.dumps({
+                "type": "system",
+                "message": f"🔁 Gateway is restarting, reconnecting in {delay_ms / 1000:.1f}s",
+                "user_id": "system",
+                "timestamp": time.time(),
+                "reconnect_after_ms": delay_ms
+            }))
+            await outbox.close(code=1012, reason=f"reconnect_after_ms={delay_ms}")
+        await asyncio.gather(*(close(c.outbox) for c in list(self.connections.values())))
+
+    # Send queue depth and drop counts of every connection
+    def stats(self) -> Dict:
+        clients = {c.user_id: {"role": c.role, "topics": sorted(c.topics), **c.outbox.stats()}
+                   for c in self.connections.values()}
+        return {
+            "connections": len(self.connections),
+            "roles": {role: len(ids) for role, ids in self.roles.items() if ids},
+            "subscribers": {topic: len(ids) for topic, ids in sorted(self.subscribers.items())},
+            "send_queue_size": self.queue_size,
+            "overflow_policy": self.overflow_policy,
+            "queued": sum(stats["depth"] for stats in clients.values()),
+            "dropped": sum(stats["dropped"] for stats in clients.values()),
+            "coalesced": sum(stats["coalesced"] for stats in clients.values()),
+            "slow_disconnects": self.slow_disconnects,
+            "clients": clients,
+        }
@@ -0,0 +1,139 @@
+# ASYNC HEALTH CHECKER
+# Every target (service instance) is probed by its own task on its own
+# jittered schedule. A target only changes state after `rise` consecutive
+# successes or `fall` consecutive failures; probes run faster while a change
+# is being confirmed and back off while the target stays down.
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional
+
+
+class HealthCheck:
+    """Schedule and consecutive-result counters for one target."""
+
+    def __init__(self, key: Hashable, name: Optional[str] = None, interval: float = 10.0, fast_interval: float = 1.0,
+                 jitter: float = 0.1, rise: int = 2, fall: int = 2, max_backoff: float = 60.0):
+        self.key = key
+        self.name = name or str(key)
+        self.interval = interval
+        self.fast_interval = fast_interval
+        self.jitter = jitter
+        self.rise = rise
+        self.fall = fall
+        self.max_backoff = max_backoff
+        self.successes = 0
+        self.failures = 0
+        self.last_probe = 0.0
+        self.last_ok: Optional[bool] = None
+        self.next_probe_in = 0.0
+
+    # Count a probe result; returns the new state when the target changes
+    # state (up is the state before the probe), otherwise None
+    def record(self, ok: bool, up: bool) -> Optional[bool]:
+        self.last_probe = time.time()
+        self.last_ok = ok
+        if ok:
+            self.successes += 1
+            self.failures = 0
+            if not up and self.successes >= self.rise:
+                return True
+        else:
+            self.failures += 1
+            self.successes = 0
+            if up and self.failures >= self.fall:
+                return False
+        return None
+
+    # Seconds until the next probe
+    def next_delay(self, up: bool) -> float:
+        if up and self.failures:
+            delay = self.fast_interval  # confirming a failure
+        elif not up and self.successes:
+            delay = self.fast_interval  # confirming a recovery
+        elif not up and self.failures >= self.fall:
+            # Back off while the target stays down
+            delay = min(self.max_backoff, self.interval * 2 ** (self.failures - self.fall))
+        else:
+            delay = self.interval
+        self.next_probe_in = delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+        return self.next_probe_in
+
+    def stats(self) -> Dict:
+        return {
+            "target": self.name,
+            "interval_s": self.interval,
+            "consecutive_successes": self.successes,
+            "consecutive_failures": self.failures,
+            "last_ok": self.last_ok,
+            "last_probe": self.last_probe,
+            "next_probe_in_s": round(self.next_probe_in, 2),
+        }
+
+
+class HealthChecker:
+    """Runs one probing task per HealthCheck.
+
+    ``probe(key)`` returns True/False, or None to skip the target this round;
+    ``is_up(key)`` reads the target's current state and ``on_change(key, up)``
+    is called when it changes.
+    """
+
+    def __init__(self, probe: Callable[[Hashable], Awaitable[Optional[bool]]],
+                 is_up: Callable[[Hashable], bool], on_change: Callable[[Hashable, bool], None]):
+        self.probe = probe
+        self.is_up = is_up
+        self.on_change = on_change
+        self.checks: List[HealthCheck] = []
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+        self._running = False
+
+    # Add a target; it is probed right away if the checker is running
+    def add(self, check: HealthCheck):
+        self.checks.append(check)
+        if self._running:
+            self._tasks[check.key] = asyncio.create_task(self._run(check))
+
+    def remove(self, key: Hashable):
+        self.checks = [check for check in self.checks if check.key != key]
+        task = self._tasks.pop(key, None)
+        if task:
+            task.cancel()
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._tasks = {check.key: asyncio.create_task(self._run(check)) for check in self.checks}
+
+    async def stop(self):
+        self._running = False
+        tasks, self._tasks = list(self._tasks.values()), {}
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run(self, check: HealthCheck):
+        # Spread the first probes over the interval so targets don't fire together
+        await asyncio.sleep(random.uniform(0, check.jitter * check.interval))
+        while True:
+            try:
+                ok = await self.probe(check.key)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                ok = False
+            up = self.is_up(check.key)
+            if ok is not None:
+                new_state = check.record(ok, up)
+                if new_state is not None:
+                    self.on_change(check.key, new_state)
+                    up = new_state
+            await asyncio.sleep(check.next_delay(up))
+
+    def stats(self) -> List[Dict]:
+        return [check.stats() for check in self.checks]
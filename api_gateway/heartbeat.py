@@ -0,0 +1,113 @@
+# HEARTBEAT MONITOR
+# Services push a JSON heartbeat over UDP every few hundred milliseconds (see
+# shared/heartbeat.py). A target that misses `missed_beats` beats in a row is
+# marked down right away, and the next beat marks it up again. Targets that
+# never sent a beat, and targets taken down for another reason (failed probes,
+# simulated failures), are left to the polling health checks.
+import asyncio
+import json
+import time
+from typing import Callable, Dict, Hashable, Optional
+
+
+class HeartbeatMonitor(asyncio.DatagramProtocol):
+    """Tracks the latest heartbeat of every target.
+
+    ``targets`` maps the port a service instance listens on to its key;
+    ``is_up(key)`` and ``on_change(key, up)`` are the same callbacks the
+    HealthChecker uses.
+    """
+
+    def __init__(self, targets: Dict[int, Hashable], is_up: Callable[[Hashable], bool],
+                 on_change: Callable[[Hashable, bool], None], interval: float = 0.5, missed_beats: int = 3):
+        self.targets = targets
+        self.is_up = is_up
+        self.on_change = on_change
+        self.interval = interval
+        self.missed_beats = missed_beats
+        self.last_seen: Dict[Hashable, float] = {}
+        self.payloads: Dict[Hashable, Dict] = {}
+        self.beats = 0
+        self.ignored = 0
+        # Targets this monitor marked down; they are not marked down again
+        # until a new beat arrives
+        self._lost = set()
+        self._transport: Optional[asyncio.DatagramTransport] = None
+        self._watchdog: Optional[asyncio.Task] = None
+
+    @property
+    def timeout(self) -> float:
+        return self.interval * self.missed_beats
+
+    @property
+    def running(self) -> bool:
+        return self._transport is not None
+
+    async def start(self, host: str, port: int):
+        if self._transport:
+            return
+        loop = asyncio.get_running_loop()
+        self._transport, _ = await loop.create_datagram_endpoint(lambda: self, local_addr=(host, port))
+        self._watchdog = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._watchdog:
+            self._watchdog.cancel()
+            await asyncio.gather(self._watchdog, return_exceptions=True)
+            self._watchdog = None
+        if self._transport:
+            self._transport.close()
+            self._transport = None
+        self.last_seen.clear()
+        self._lost.clear()
+
+    # Stop tracking the target listening on a port
+    def remove(self, port: int):
+        key = self.targets.pop(port, None)
+        self.last_seen.pop(key, None)
+        self.payloads.pop(key, None)
+        self._lost.discard(key)
+
+    # True while the target's heartbeats arrive on time
+    def fresh(self, key: Hashable) -> bool:
+        last = self.last_seen.get(key)
+        return last is not None and time.monotonic() - last <= self.timeout
+
+    def datagram_received(self, data: bytes, addr):
+        try:
+            payload = json.loads(data)
+            key = self.targets[int(payload["port"])]
+        except (ValueError, KeyError, TypeError):
+            self.ignored += 1
+            return
+        self.beats += 1
+        self.last_seen[key] = time.monotonic()
+        self.payloads[key] = payload
+        if key in self._lost:
+            self._lost.discard(key)
+            if not self.is_up(key):
+                self.on_change(key, True)
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            for key, last in list(self.last_seen.items()):
+                if now - last > self.timeout and key not in self._lost:
+                    self._lost.add(key)
+                    if self.is_up(key):
+                        self.on_change(key, False)
+
+    # Latest payload and age of every target that sent a heartbeat
+    def stats(self) -> Dict:
+        now = time.monotonic()
+        return {
+            "interval_s": self.interval,
+            "missed_beats": self.missed_beats,
+            "beats": self.beats,
+            "ignored": self.ignored,
+            "targets": [
+                {**self.payloads[key], "age_s": round(now - last, 3), "fresh": now - last <= self.timeout}
+                for key, last in self.last_seen.items()
+            ],
+        }
@@ -0,0 +1,120 @@
+# RETRY BUDGETS AND HEDGED REQUESTS
+# A hedge is a second copy of an idempotent request sent to another instance
+# when the first one is slow; whichever answers first wins. Hedges and retries
+# draw from a token-bucket budget so they cannot amplify an outage.
+import bisect
+import time
+from collections import deque
+from typing import Dict, Optional
+
+
+class RetryBudget:
+    """Token bucket limiting retries and hedges.
+
+    Every original request deposits ``ratio`` tokens and the bucket also
+    refills at ``min_per_second``, so extra attempts are capped at roughly
+    ``ratio`` of the traffic plus a small floor for low-traffic periods.
+    """
+
+    def __init__(self, ratio: float = 0.1, min_per_second: float = 1.0, max_tokens: float = 20.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self._last_refill = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.max_tokens, self.tokens + (now - self._last_refill) * self.min_per_second)
+        self._last_refill = now
+
+    # Called once per original request
+    def deposit(self):
+        self._refill()
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    # Take a token for a retry or hedge; False when the budget is exhausted
+    def withdraw(self) -> bool:
+        self._refill()
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+
+class LatencyTracker:
+    """Keeps the most recent latencies to estimate percentiles.
+
+    The window is also kept sorted, updated on every ``record`` (one bisect
+    removal and insertion), and percentiles are cached until the next
+    ``record``, so a hedged request never sorts the window.
+    """
+
+    def __init__(self, size: int = 512, min_samples: int = 20):
+        self.samples: deque = deque(maxlen=size)
+        self.min_samples = min_samples
+        self._sorted = []
+        self._percentiles: Dict[float, float] = {}
+
+    def record(self, latency: float):
+        if len(self.samples) == self.samples.maxlen:
+            del self._sorted[bisect.bisect_left(self._sorted, self.samples[0])]
+        self.samples.append(latency)
+        bisect.insort(self._sorted, latency)
+        self._percentiles.clear()
+
+    # The q-th percentile (0-100), or None until enough samples were seen
+    def percentile(self, q: float) -> Optional[float]:
+        if len(self.samples) < self.min_samples:
+            return None
+        value = self._percentiles.get(q)
+        if value is None:
+            value = self._percentiles[q] = self._sorted[min(len(self._sorted) - 1, int(len(self._sorted) * q / 100))]
+        return value
+
+
+class HedgePolicy:
+    """Retry budget, hedge delay and counters for one service.
+
+    ``delay`` is a number of seconds, or "p95" to hedge after the observed
+    95th percentile latency (falling back to ``fallback_delay`` until there
+    are enough samples).
+    """
+
+    def __init__(self, budget: RetryBudget, delay="p95", fallback_delay: float = 0.1, min_delay: float = 0.005):
+        self.budget = budget
+        self.delay = delay
+        self.fallback_delay = fallback_delay
+        self.min_delay = min_delay
+        self.latency = LatencyTracker()
+        self.hedges_sent = 0
+        self.hedges_won = 0
+        self.retries = 0
+        self.budget_exhausted = 0
+
+    def hedge_delay(self) -> float:
+        if isinstance(self.delay, str) and self.delay.startswith("p"):
+            observed = self.latency.percentile(float(self.delay[1:]))
+            delay = observed if observed is not None else self.fallback_delay
+        else:
+            delay = float(self.delay)
+        return max(self.min_delay, delay)
+
+    # Take a budget token for an extra attempt, counting refusals
+    def allow_extra_attempt(self) -> bool:
+        if self.budget.withdraw():
+            return True
+        self.budget_exhausted += 1
+        return False
+
+    def stats(self) -> Dict:
+        p95 = self.latency.percentile(95)
+        return {
+            "hedge_delay_ms": round(self.hedge_delay() * 1000, 2),
+            "observed_p95_ms": round(p95 * 1000, 2) if p95 is not None else None,
+            "hedges_sent": self.hedges_sent,
+            "hedges_won": self.hedges_won,
+            "retries": self.retries,
+            "budget_exhausted": self.budget_exhausted,
+            "budget_tokens": round(self.budget.tokens, 2),
+        }
@@ -0,0 +1,156 @@
+# ADAPTIVE CONCURRENCY LIMITER
+# Caps the requests in flight to one upstream service. The limit follows the
+# service's observed latency (AIMD or gradient), requests over the limit wait
+# in a short queue and are rejected once their deadline passes.
+import asyncio
+import math
+from collections import deque
+from typing import Dict
+
+
+# LIMIT ALGORITHMS
+# update() gets the current limit and one finished request and returns the new limit.
+class AimdLimit:
+    """Additive increase while latency stays under ``latency_threshold``,
+    multiplicative decrease on errors and slow responses."""
+
+    name = "aimd"
+
+    def __init__(self, backoff_ratio: float = 0.9, latency_threshold: float = 1.0):
+        self.backoff_ratio = backoff_ratio
+        self.latency_threshold = latency_threshold
+
+    def update(self, limit: float, latency: float, ok: bool, in_flight: int) -> float:
+        if not ok or latency > self.latency_threshold:
+            return limit * self.backoff_ratio
+        # Only grow when the current limit is actually being used
+        if in_flight * 2 >= limit:
+            return limit + 1
+        return limit
+
+
+class GradientLimit:
+    """Scales the limit by the ratio of no-load latency to current latency.
+
+    The no-load latency is the lowest latency seen, allowed to creep up by
+    ``drift`` per sample so it follows genuine changes in the service. While
+    current latency stays within ``tolerance`` times it the limit grows by
+    about sqrt(limit) per update; queueing shrinks it proportionally.
+    """
+
+    name = "gradient"
+
+    def __init__(self, tolerance: float = 1.5, smoothing: float = 0.2, drift: float = 0.001):
+        self.tolerance = tolerance
+        self.smoothing = smoothing
+        self.drift = drift
+        self.no_load_latency = 0.0
+        self.short_latency = 0.0
+
+    def update(self, limit: float, latency: float, ok: bool, in_flight: int) -> float:
+        if self.no_load_latency == 0.0:
+            self.no_load_latency = self.short_latency = latency
+        self.no_load_latency = min(latency, self.no_load_latency * (1 + self.drift))
+        self.short_latency += 0.5 * (latency - self.short_latency)
+        if not ok:
+            return limit * 0.9
+        gradient = max(0.5, min(1.0, self.tolerance * self.no_load_latency / max(self.short_latency, 1e-6)))
+        new_limit = limit * (1 - self.smoothing) + (limit * gradient + math.sqrt(limit)) * self.smoothing
+        # Don't grow the limit while it is not being used
+        if in_flight * 2 < limit:
+            return min(limit, new_limit)
+        return new_limit
+
+
+LIMIT_ALGORITHMS = {algorithm.name: algorithm for algorithm in (AimdLimit, GradientLimit)}
+
+
+class ConcurrencyLimiter:
+    """Adaptive in-flight limit plus a bounded wait queue for one service."""
+
+    def __init__(self, algorithm: str = "gradient", initial_limit: int = 20, min_limit: int = 1,
+                 max_limit: int = 200, max_queue: int = 50, **algorithm_options):
+        if algorithm not in LIMIT_ALGORITHMS:
+            raise ValueError(f"Unknown concurrency limit algorithm '{algorithm}'. Choose from: {', '.join(LIMIT_ALGORITHMS)}")
+        self.algorithm = LIMIT_ALGORITHMS[algorithm](**algorithm_options)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.max_queue = max_queue
+        self._limit = float(initial_limit)
+        self.in_flight = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._waiters: deque = deque()
+
+    @property
+    def limit(self) -> int:
+        return max(self.min_limit, int(self._limit))
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    # Take a slot, waiting up to ``timeout`` seconds in the queue.
+    # Returns False when the request should be rejected.
+    async def acquire(self, timeout: float) -> bool:
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            return True
+        if len(self._waiters) >= self.max_queue or timeout <= 0:
+            self.rejected += 1
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            # A released slot is handed over by resolving the future
+            await asyncio.wait_for(waiter, timeout)
+            return True
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            self.timed_out += 1
+            return False
+        except asyncio.CancelledError:
+            # The slot may have been handed over just as the caller went away
+            if waiter.done() and not waiter.cancelled():
+                self._release_slot()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    # Give back a slot from acquire() and feed the request's latency and
+    # outcome into the limit algorithm
+    def release(self, latency: float, ok: bool = True):
+        new_limit = self.algorithm.update(self._limit, latency, ok, self.in_flight)
+        self._limit = min(float(self.max_limit), max(float(self.min_limit), new_limit))
+        self._release_slot()
+        # A larger limit may admit more of the queue
+        while self._waiters and self.in_flight < self.limit:
+            self.in_flight += 1
+            if not self._hand_over():
+                self.in_flight -= 1
+
+    def _release_slot(self):
+        if self.in_flight <= self.limit and self._hand_over():
+            return
+        self.in_flight -= 1
+
+    # Pass a slot to the oldest live waiter; False when nobody is waiting
+    def _hand_over(self) -> bool:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return True
+        return False
+
+    def stats(self) -> Dict:
+        return {
+            "algorithm": self.algorithm.name,
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "rejected": self.rejected,
+            "queue_timeouts": self.timed_out,
+        }
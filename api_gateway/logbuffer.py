@@ -0,0 +1,63 @@
+# BOUNDED LOG RING BUFFER
+# Output lines of service processes are kept in fixed-size records in a
+# preallocated buffer, overwriting the oldest, so memory use stays constant
+# however chatty a process is. The buffer is a plain bytearray, or a region of
+# the shared memory segment in multi-worker mode so every worker can serve the
+# logs written by the leader.
+import struct
+import time
+from typing import Dict, List, Optional
+
+# Record header: timestamp, stream (0 stdout, 1 stderr), instance port, text length
+RECORD_HEADER = struct.Struct("<dBHH")
+COUNTER = struct.Struct("<Q")  # records written so far, at the start of the buffer
+STREAMS = ["stdout", "stderr"]
+
+
+class LogBuffer:
+    """Last ``lines`` output lines of one service, ``line_bytes`` bytes per record."""
+
+    def __init__(self, lines: int, line_bytes: int = 256, buffer=None):
+        self.lines = lines
+        self.line_bytes = line_bytes
+        self.text_bytes = line_bytes - RECORD_HEADER.size
+        self.buffer = buffer if buffer is not None else bytearray(self.size(lines, line_bytes))
+
+    # Bytes needed for a buffer of this shape
+    @staticmethod
+    def size(lines: int, line_bytes: int) -> int:
+        return COUNTER.size + lines * line_bytes
+
+    @property
+    def written(self) -> int:
+        return COUNTER.unpack_from(self.buffer, 0)[0]
+
+    def append(self, port: int, stream: str, line: str):
+        text = line.encode(errors="replace")[:self.text_bytes]
+        written = self.written
+        offset = COUNTER.size + (written % self.lines) * self.line_bytes
+        RECORD_HEADER.pack_into(self.buffer, offset, time.time(), STREAMS.index(stream), port, len(text))
+        self.buffer[offset + RECORD_HEADER.size:offset + RECORD_HEADER.size + len(text)] = text
+        COUNTER.pack_into(self.buffer, 0, written + 1)
+
+    # The last n lines, oldest first, optionally of one stream only
+    def tail(self, n: int, stream: Optional[str] = None) -> List[Dict]:
+        written = self.written
+        result = []
+        for index in range(written - 1, max(written - self.lines, 0) - 1, -1):
+            offset = COUNTER.size + (index % self.lines) * self.line_bytes
+            timestamp, stream_index, port, length = RECORD_HEADER.unpack_from(self.buffer, offset)
+            if stream and STREAMS[stream_index] != stream:
+                continue
+            text = bytes(self.buffer[offset + RECORD_HEADER.size:offset + RECORD_HEADER.size + length])
+            result.append({
+                "timestamp": timestamp,
+                "stream": STREAMS[stream_index],
+                "port": port,
+                # A cut in the middle of a multi-byte character is replaced
+                "line": text.decode(errors="replace"),
+            })
+            if len(result) >= n:
+                break
+        result.reverse()
+        return result
@@ -1,109 +1,421 @@
 from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, Request
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-import requests
-import threading
+from fastapi.responses import FileResponse, StreamingResponse
+from pydantic import BaseModel
+import asyncio
+import signal
 import time
-from typing import Dict, List
+from typing import Dict, List, Optional
 import os
 import json
 import uuid
-import subprocess
-
-# CREATE THE MAIN FASTAPI APPLICATION
-app = FastAPI(title="MicroNet Manager API Gateway")
+import sys
 
 # GET THE PROJECT ROOT DIRECTORY FOR ABSOLUTE PATH
 current_dir = os.path.dirname(os.path.abspath(__file__))
 project_root = os.path.dirname(current_dir)
 
+# Add gateway directory to path for local modules when started via uvicorn,
+# and the project root for modules shared with the services
+if current_dir not in sys.path:
+    sys.path.append(current_dir)
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+import config
+from upstream import UpstreamClient, UpstreamError
+from proxy import MethodNotAllowed, ProxyEngine, Route, RouteTable
+from balancer import POLICIES, Instance, LoadBalancer
+from cache import ResponseCache
+from singleflight import SingleFlight
+from breaker import CircuitBreaker
+from hedging import HedgePolicy, RetryBudget
+from limiter import ConcurrencyLimiter
+from shared.metrics import instrument
+from shared_state import COMMAND_RESTART, COMMAND_SCALE, COMMAND_START, COMMAND_STOP, SharedState, StateSync
+from health import HealthCheck, HealthChecker
+from heartbeat import HeartbeatMonitor
+from registry import Lease, ServiceRegistry
+from supervisor import SupervisedProcess, free_port
+from logbuffer import LogBuffer
+from autoscaler import Autoscaler, ServiceLoad
+from zygote import Zygote
+from connections import TOPIC_PATTERN, ConnectionManager
+from status_stream import StatusStream
+from shared.heartbeat import HEARTBEAT_ADDR_ENV, HEARTBEAT_INTERVAL_ENV
+
+# CREATE THE MAIN FASTAPI APPLICATION
+app = FastAPI(title="MicroNet Manager API Gateway")
+
+# Circuit breaker with the thresholds from config
+def make_breaker(name: str, min_calls: int = config.BREAKER_MIN_CALLS) -> CircuitBreaker:
+    return CircuitBreaker(
+        name,
+        window=config.BREAKER_WINDOW,
+        min_calls=min_calls,
+        error_rate=config.BREAKER_ERROR_RATE,
+        slow_call_duration=config.BREAKER_SLOW_CALL_DURATION,
+        slow_call_rate=config.BREAKER_SLOW_CALL_RATE,
+        open_duration=config.BREAKER_OPEN_DURATION,
+        half_open_probes=config.BREAKER_HALF_OPEN_PROBES,
+        on_transition=announce_breaker_transition,
+    )
+
+# Build the instance pool and load balancer for a service from config
+def make_balancer(service_name: str) -> LoadBalancer:
+    instances = []
+    for index, port in enumerate(config.SERVICE_INSTANCES[service_name]):
+        instance = Instance("localhost", port)
+        instance.slot = index
+        instance.breaker = make_breaker(f"{service_name}@{instance.url}")
+        instances.append(instance)
+    return LoadBalancer(instances, config.LOAD_BALANCER_POLICIES.get(service_name, "round_robin"))
+
+# Push a system event to the ChatOps clients subscribed to any of its topics
+# (no-op outside the event loop). Events with the same key replace each other
+# in the queue of a slow client under the coalesce overflow policy
+def broadcast_system_event(text: str, *topics: str, key: Optional[str] = None):
+    message = {
+        "type": "system_broadcast",
+        "topic": topics[0],
+        "message": text,
+        "user_id": "system",
+        "timestamp": time.time()
+    }
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    manager.publish(topics, json.dumps(message), key=key)
+
+# Push circuit breaker state changes to the subscribers of the service's
+# health topic, and breakers opening to the alerts topic
+def announce_breaker_transition(breaker: CircuitBreaker, old_state: str, new_state: str):
+    print(f"Circuit breaker {breaker.name}: {old_state} -> {new_state}")
+    # Named after the service, or service@instance url
+    service_name = breaker.name.split("@")[0]
+    if new_state == "closed" and service_name in services:
+        # The instance recovered: drop the latency penalties of its failures
+        for instance in services[service_name]["balancer"].instances:
+            if instance.breaker is breaker:
+                instance.reset_latency()
+    topics = (f"health.{service_name}", "alerts") if new_state == "open" else (f"health.{service_name}",)
+    broadcast_system_event(f"⚡ Circuit breaker {breaker.name}: {old_state} → {new_state}", *topics,
+                           key=f"breaker:{breaker.name}")
+
 # 3 MICROSERVICE DETAILS (SUCH AS THEIR ADDRESS/PORT, THEIR LOCATION, DEFINED HERE)
+# "host"/"port" describe the first instance; the balancer holds the full pool
 services: Dict = {
     "user": {
         "host": "http://localhost:8001", 
         "type": "rest", 
         "healthy": True,
-        "process": None,
         "port": 8001,
         "command": ["python", os.path.join(project_root, "user_service", "server.py")],
-        "status": "stopped"
+        "status": "stopped",
+        "balancer": make_balancer("user"),
+        "breaker": make_breaker("user", config.SERVICE_BREAKER_MIN_CALLS)
     },
     "product": {
         "host": "http://localhost:8002", 
         "type": "rest", 
         "healthy": True,
-        "process": None,
         "port": 8002,
         "command": ["python", os.path.join(project_root, "product_service", "server.py")],
-        "status": "stopped"
+        "status": "stopped",
+        "balancer": make_balancer("product"),
+        "breaker": make_breaker("product", config.SERVICE_BREAKER_MIN_CALLS)
     },
     "order": {
         "host": "http://localhost:8003", 
         "type": "rest", 
         "healthy": True,
-        "process": None,
         "port": 8003,
         "command": ["python", os.path.join(project_root, "order_service", "server.py")],
-        "status": "stopped"
+        "status": "stopped",
+        "balancer": make_balancer("order"),
+        "breaker": make_breaker("order", config.SERVICE_BREAKER_MIN_CALLS)
     }
 }
 
-# LOAD BALANCING INITIAL STATE
-current_product_instance = 0
-request_count = 0
+# Fire-and-forget tasks (kept referenced until they finish)
+background_tasks = set()
 
-# WEBSOCKECT CONNECTION MANAGER
-class ConnectionManager:
-    def __init__(self):
-        # Store all active WebSocket connections
-        self.active_connections: List[WebSocket] = []
-        # Map WebSocket connections to user IDs
-        self.connection_users: Dict[WebSocket, str] = {}
-        # Track user roles for each connection
-        self.user_roles: Dict[WebSocket, str] = {}
-
-    # Connect a new WebSocket client
-    async def connect(self, websocket: WebSocket, user_id: str, role: str = "client"):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-        self.connection_users[websocket] = user_id
-        self.user_roles[websocket] = role
-        print(f"WebSocket connected for user {user_id} with role {role}. Total: {len(self.active_connections)}")
-
-    # Disconnect a WebSocket client
-    def disconnect(self, websocket: WebSocket):
-        user_id = self.connection_users.get(websocket, "Unknown")
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-        if websocket in self.connection_users:
-            del self.connection_users[websocket]
-        if websocket in self.user_roles:
-            del self.user_roles[websocket]
-        print(f"WebSocket disconnected for user {user_id}. Total: {len(self.active_connections)}")
-
-    # Send a message to a specific WebSocket client
-    async def send_personal_message(self, message: str, websocket: WebSocket):
-        await websocket.send_text(message)
-
-    # Broadcast a message to all connected WebSocket clients
-    async def broadcast(self, message: str, exclude: WebSocket = None):
-        disconnected = []
-        for connection in self.active_connections:
-            if connection != exclude:
-                try:
-                    await connection.send_text(message)
-                except:
-                    disconnected.append(connection)
-        
-        # Clean up disconnected clients
-        for connection in disconnected:
-            self.disconnect(connection)
+# ROUTE TABLE: WHICH SERVICE HANDLES EACH PATH PREFIX/METHOD
+# First match wins, so more specific prefixes must come first.
+# {name} matches a single path segment.
+PROXY_METHODS = ["GET", "POST", "PUT", "DELETE"]
+route_table = RouteTable([
+    Route(["GET"], "/users/{user_id}/orders", "order"),
+    Route(PROXY_METHODS, "/users/", "user", hedge=True),
+    Route(["GET"], "/search/users/", "user"),
+    Route(PROXY_METHODS, "/products/", "product", hedge=True),
+    Route(["GET"], "/search/products/", "product"),
+    Route(PROXY_METHODS, "/orders/", "order", hedge=True),
+    Route(["GET"], "/stats/user", "user", upstream_prefix="/stats"),
+    Route(["GET"], "/stats/product", "product", upstream_prefix="/stats"),
+    Route(["GET"], "/stats/order", "order", upstream_prefix="/stats"),
+])
+
+# SHARED KEEP-ALIVE CONNECTION POOLS FOR ALL UPSTREAM CALLS
+upstream = UpstreamClient(
+    max_connections=config.UPSTREAM_POOL_SIZE,
+    connect_timeout=config.UPSTREAM_CONNECT_TIMEOUT,
+    read_timeout=config.UPSTREAM_READ_TIMEOUT,
+    pool_timeout=config.UPSTREAM_POOL_TIMEOUT,
+    keepalive_expiry=config.UPSTREAM_KEEPALIVE_EXPIRY,
+)
+proxy_engine = ProxyEngine(upstream, passthrough=config.PROXY_PASSTHROUGH)
+
+# GATEWAY RESPONSE CACHE FOR GET-BY-ID ROUTES
+response_cache = ResponseCache(config.CACHE_TTLS, max_bytes=config.CACHE_MAX_BYTES)
+
+# COALESCES IDENTICAL IN-FLIGHT GET-BY-ID REQUESTS INTO ONE UPSTREAM CALL
+singleflight = SingleFlight()
 
-    # Get the role of a WebSocket client
-    def get_user_role(self, websocket: WebSocket) -> str:
-        return self.user_roles.get(websocket, "client")
+# RETRY BUDGET, HEDGE DELAY AND HEDGING COUNTERS FOR EACH SERVICE
+hedge_policies = {
+    service_name: HedgePolicy(
+        RetryBudget(config.RETRY_BUDGET_RATIO, config.RETRY_BUDGET_MIN_PER_SEC, config.RETRY_BUDGET_MAX_TOKENS),
+        delay=config.HEDGE_DELAY,
+        fallback_delay=config.HEDGE_FALLBACK_DELAY,
+    )
+    for service_name in services
+}
+
+# ADAPTIVE CONCURRENCY LIMIT FOR EACH UPSTREAM SERVICE
+limiters = {
+    service_name: ConcurrencyLimiter(
+        config.CONCURRENCY_LIMIT_ALGORITHM,
+        initial_limit=config.CONCURRENCY_INITIAL_LIMIT,
+        min_limit=config.CONCURRENCY_MIN_LIMIT,
+        max_limit=config.CONCURRENCY_MAX_LIMIT,
+        max_queue=config.CONCURRENCY_QUEUE_SIZE,
+    )
+    for service_name in services
+}
+
+# PROMETHEUS-STYLE METRICS SERVED ON GET /metrics
+metrics_registry = instrument(app)
+proxied_requests = metrics_registry.counter(
+    "gateway_proxied_requests_total", "Requests routed to a service", ("service",))
+upstream_requests = metrics_registry.counter(
+    "gateway_upstream_requests_total", "Upstream attempts by service, instance, method and status",
+    ("service", "instance", "method", "status"))
+upstream_latency = metrics_registry.histogram(
+    "gateway_upstream_duration_seconds", "Time until the upstream response head arrived",
+    ("service", "instance"))
+metrics_registry.gauge(
+    "gateway_instance_in_flight", "Requests in flight per service instance",
+    lambda: {(name, i.url): i.in_flight for name, info in services.items() for i in info["balancer"].instances},
+    ("service", "instance"))
+metrics_registry.gauge(
+    "gateway_concurrency_limit", "Current adaptive concurrency limit per service",
+    lambda: {(name,): limiter.limit for name, limiter in limiters.items()}, ("service",))
+metrics_registry.gauge(
+    "gateway_concurrency_queue_depth", "Requests waiting for a concurrency slot per service",
+    lambda: {(name,): limiter.queue_depth for name, limiter in limiters.items()}, ("service",))
+metrics_registry.gauge(
+    "gateway_hedges_sent", "Hedged copies of requests sent per service",
+    lambda: {(name,): policy.hedges_sent for name, policy in hedge_policies.items()}, ("service",))
+metrics_registry.gauge(
+    "gateway_hedges_won", "Hedged copies that answered before the original per service",
+    lambda: {(name,): policy.hedges_won for name, policy in hedge_policies.items()}, ("service",))
+metrics_registry.gauge(
+    "gateway_retries", "Requests retried on another instance per service",
+    lambda: {(name,): policy.retries for name, policy in hedge_policies.items()}, ("service",))
+metrics_registry.gauge(
+    "gateway_retry_budget_exhausted", "Retries and hedges refused because the retry budget was empty per service",
+    lambda: {(name,): policy.budget_exhausted for name, policy in hedge_policies.items()}, ("service",))
+
+# HEALTH CHECKS: ONE PROBE SCHEDULE PER SERVICE INSTANCE
+# Targets are (service name, instance)
+async def probe_instance(target) -> Optional[bool]:
+    service_name, instance = target
+    service = services[service_name]
+    # Skip configured instances without a process (service stopped by a
+    # manager, or instance scaled away); registered instances run on their
+    # own and are always probed
+    if instance.lease is None and instance.process is None:
+        return None
+    # No need to poll an instance whose heartbeats arrive on time
+    if instance.healthy and heartbeat_monitor.fresh(target):
+        return None
+    try:
+        response = await asyncio.wait_for(upstream.get(f"{instance.url}/health"), config.HEALTH_CHECK_TIMEOUT)
+    except (UpstreamError, asyncio.TimeoutError):
+        return False
+    return response.status_code == 200
+
+def instance_is_up(target) -> bool:
+    return target[1].healthy
+
+# Apply and publish an instance health change
+def instance_health_changed(target, up: bool):
+    service_name, instance = target
+    service_info = services[service_name]
+    instance.healthy = up
+    # Only update status if service is not manually stopped by manager
+    if service_info["status"] != "stopped":
+        is_healthy = service_info["balancer"].healthy
+        service_info["healthy"] = is_healthy
+        service_info["status"] = "running" if is_healthy else "stopped"
+    state = "UP" if up else "DOWN"
+    print(f"Health: {service_name} instance {instance.url} is {state}")
+    topics = (f"health.{service_name}",) if up else (f"health.{service_name}", "alerts")
+    broadcast_system_event(f"{'💚' if up else '💔'} {service_name} instance {instance.url} is {state}", *topics,
+                           key=f"health:{instance.url}")
+
+health_checker = HealthChecker(probe_instance, instance_is_up, instance_health_changed)
 
-manager = ConnectionManager()
+def add_health_check(service_name: str, instance: Instance):
+    health_checker.add(HealthCheck(
+        (service_name, instance),
+        name=f"{service_name}@{instance.url}",
+        interval=config.HEALTH_CHECK_SERVICE_INTERVALS.get(service_name, config.HEALTH_CHECK_INTERVAL),
+        fast_interval=config.HEALTH_CHECK_FAST_INTERVAL,
+        jitter=config.HEALTH_CHECK_JITTER,
+        rise=config.HEALTH_CHECK_RISE,
+        fall=config.HEALTH_CHECK_FALL,
+        max_backoff=config.HEALTH_CHECK_MAX_BACKOFF,
+    ))
+
+for service_name, service_info in services.items():
+    for instance in service_info["balancer"].instances:
+        add_health_check(service_name, instance)
+
+# HEARTBEATS PUSHED BY THE SERVICE INSTANCES OVER UDP
+# Instances are identified by the port they listen on
+heartbeat_monitor = HeartbeatMonitor(
+    {instance.port: (service_name, instance)
+     for service_name, service_info in services.items()
+     for instance in service_info["balancer"].instances},
+    instance_is_up,
+    instance_health_changed,
+    interval=config.HEARTBEAT_INTERVAL,
+    missed_beats=config.HEARTBEAT_MISSED_BEATS,
+)
+
+# Start the health checks and the heartbeat listener (in the leader only)
+async def start_health_monitoring():
+    health_checker.start()
+    if not config.HEARTBEAT_ENABLED:
+        return
+    try:
+        await heartbeat_monitor.start(config.HEARTBEAT_HOST, config.HEARTBEAT_PORT)
+    except OSError as e:
+        print(f"⚠️ Heartbeat listener not started on port {config.HEARTBEAT_PORT}: {e}")
+
+async def stop_health_monitoring():
+    await health_checker.stop()
+    await heartbeat_monitor.stop()
+
+# SHARED STATE BETWEEN GATEWAY WORKERS
+# When the gateway runs as several worker processes (config.GATEWAY_WORKERS > 1)
+# the parent creates a shared memory segment and passes its name in this
+# environment variable. None in single-process mode.
+SHARED_STATE_ENV = "GATEWAY_SHARED_STATE"
+
+def make_shared_state(name: str, create: bool = False) -> SharedState:
+    # Instance slots: the configured instances, then one per registry lease
+    layout = {service_name: len(config.SERVICE_INSTANCES[service_name]) + config.REGISTRY_CAPACITY
+              for service_name in services}
+    return SharedState(name, layout, list(POLICIES), config.GATEWAY_WORKERS,
+                       log_shape=(config.SERVICE_LOG_LINES, config.SERVICE_LOG_LINE_BYTES),
+                       generation_stripes=ResponseCache.GENERATION_STRIPES, create=create)
+
+shared_state = make_shared_state(os.environ[SHARED_STATE_ENV]) if os.environ.get(SHARED_STATE_ENV) else None
+state_sync = StateSync(shared_state, services) if shared_state else None
+# The leader runs health checks and owns the service processes (always this
+# process in single-process mode)
+is_leader = shared_state is None
+if shared_state:
+    for service_name, service_info in services.items():
+        service_info["balancer"].share_cursor(lambda name=service_name: shared_state.next_cursor(name))
+    # A write through any worker invalidates the responses every worker cached
+    response_cache.share_generations(shared_state.generation, shared_state.bump_generation)
+
+# OUTPUT OF THE SERVICE PROCESSES: LAST LINES PER SERVICE IN A RING BUFFER
+# (in the shared segment in multi-worker mode, where the leader writes them)
+service_logs = {
+    service_name: (shared_state.log_buffer(service_name) if shared_state
+                   else LogBuffer(config.SERVICE_LOG_LINES, config.SERVICE_LOG_LINE_BYTES))
+    for service_name in services
+}
+
+# DYNAMIC SERVICE REGISTRY
+# Extra instances register under a lease (see registry.py); each one joins the
+# service's pool, gets a health check and leaves the pool when its lease ends
+def add_registered_instance(lease: Lease):
+    instance = Instance(lease.host, lease.port, lease.weight, lease.metadata)
+    instance.slot = lease.slot
+    instance.lease = lease
+    instance.breaker = make_breaker(f"{lease.service}@{instance.url}")
+    service_info = services[lease.service]
+    service_info["balancer"].add(instance)
+    service_info["healthy"] = service_info["balancer"].healthy
+    add_health_check(lease.service, instance)
+    if lease.managed:
+        # Processes run by the gateway send heartbeats like the configured ones
+        heartbeat_monitor.targets[lease.port] = (lease.service, instance)
+    expiry = "managed" if lease.managed else f"ttl {lease.ttl}s"
+    print(f"Registry: {lease.service} instance {instance.url} registered (lease {lease.id}, {expiry})")
+    broadcast_system_event(f"🆕 {lease.service} instance {instance.url} registered", f"health.{lease.service}")
+
+def update_registered_instance(lease: Lease):
+    for instance in services[lease.service]["balancer"].instances:
+        if instance.lease is lease:
+            instance.weight = lease.weight
+            instance.metadata = lease.metadata
+
+def remove_registered_instance(lease: Lease, reason: str):
+    service_info = services[lease.service]
+    balancer = service_info["balancer"]
+    for instance in balancer.instances:
+        if instance.lease is lease:
+            balancer.remove(instance)
+            health_checker.remove((lease.service, instance))
+            if lease.managed:
+                heartbeat_monitor.remove(lease.port)
+            break
+    service_info["healthy"] = balancer.healthy
+    if state_sync:
+        state_sync.forget(lease.service, lease.slot)
+    print(f"Registry: {lease.service} instance http://{lease.host}:{lease.port} {reason} (lease {lease.id})")
+    broadcast_system_event(f"🗑️ {lease.service} instance http://{lease.host}:{lease.port} {reason}",
+                           f"health.{lease.service}")
+
+registry = ServiceRegistry(
+    {service_name: len(config.SERVICE_INSTANCES[service_name]) for service_name in services},
+    config.REGISTRY_CAPACITY,
+    add_registered_instance,
+    remove_registered_instance,
+    update_registered_instance,
+    default_ttl=config.REGISTRY_DEFAULT_TTL,
+    min_ttl=config.REGISTRY_MIN_TTL,
+    max_ttl=config.REGISTRY_MAX_TTL,
+    state=shared_state,
+    configured={(host, port) for ports in config.SERVICE_INSTANCES.values() for port in ports
+                for host in ("localhost", "127.0.0.1")},
+)
+
+# Evict registry leases that were not renewed (single-process mode; workers
+# do this in sync_shared_state)
+async def expire_leases():
+    while True:
+        registry.expire()
+        await asyncio.sleep(config.REGISTRY_SWEEP_INTERVAL)
+
+# WEBSOCKECT CONNECTION MANAGER
+manager = ConnectionManager(config.WS_SEND_QUEUE_SIZE, config.WS_OVERFLOW_POLICY, config.WS_CLOSE_TIMEOUT,
+                            config.WS_MAX_SUBSCRIPTIONS)
+metrics_registry.gauge(
+    "gateway_websocket_send_queue_depth", "Messages waiting in the send queue of each ChatOps connection",
+    lambda: {(c.user_id,): c.outbox.depth for c in manager.connections.values()},
+    ("user",))
+metrics_registry.gauge(
+    "gateway_websocket_dropped_messages", "Messages dropped or coalesced because a ChatOps client fell behind",
+    lambda: sum(c.outbox.dropped + c.outbox.coalesced for c in manager.connections.values()))
 
 # Get the absolute path to the frontend directory
 frontend_path = os.path.join(project_root, "frontend")
@@ -136,9 +448,96 @@ async def serve_frontend():
     else:
         return {"error": "Frontend not found", "path": index_path}
 
+# Start health checks, or join the shared state when running as one of
+# several workers (the leader worker then runs the health checks)
+@app.on_event("startup")
+async def join_shared_state():
+    if config.AUTOSCALE_ENABLED:
+        task = asyncio.create_task(autoscale())
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+    if shared_state is None:
+        await start_health_monitoring()
+        warm_zygotes()
+        task = asyncio.create_task(expire_leases())
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+        return
+    slot = shared_state.register_worker(config.SHARED_STATE_STALE_AFTER)
+    registry.sync()
+    state_sync.sync()
+    print(f"Gateway worker {os.getpid()} joined shared state (slot {slot})")
+    task = asyncio.create_task(sync_shared_state())
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+# Stop health checks, the supervised service processes (leader) and the
+# zygotes, and close pooled upstream connections on shutdown. By now uvicorn
+# has let the in-flight requests finish.
+@app.on_event("shutdown")
+async def close_upstream_pools():
+    await stop_health_monitoring()
+    if is_leader:
+        await stop_all_processes()
+    await asyncio.gather(*(zygote.stop() for zygote in zygotes.values()))
+    await upstream.aclose()
+
+# GRACEFUL SHUTDOWN
+# On SIGTERM or Ctrl+C the gateway first reports draining on /health for
+# GATEWAY_DRAIN_DELAY seconds (for load balancers in front of it) and closes
+# every ChatOps WebSocket with a reconnect hint; only then does uvicorn stop
+# accepting connections and wait for in-flight requests (at most
+# GATEWAY_SHUTDOWN_TIMEOUT seconds) before the shutdown hook runs. A second
+# signal skips the drain.
+gateway_draining = False
+
+@app.on_event("startup")
+async def install_drain_handlers():
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        server_handler = signal.getsignal(sig)  # uvicorn's
+        if not callable(server_handler):
+            continue
+        
+        def handler(signum, frame, server_handler=server_handler):
+            if gateway_draining:
+                server_handler(signum, frame)
+                return
+            loop.call_soon_threadsafe(start_drain, lambda: server_handler(signum, frame))
+        signal.signal(sig, handler)
+
+def start_drain(stop_server):
+    global gateway_draining
+    gateway_draining = True
+    status_stream.close()
+    # A service process exiting from now on stays down; the shutdown hook
+    # stops the others
+    for service_info in services.values():
+        for instance in service_info["balancer"].instances:
+            if instance.process:
+                instance.process.stop_restarting()
+    task = asyncio.create_task(drain_gateway(stop_server))
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+async def drain_gateway(stop_server):
+    print(f"🛑 Gateway {os.getpid()} draining: closing {len(manager)} WebSocket connections")
+    try:
+        await asyncio.sleep(config.GATEWAY_DRAIN_DELAY)
+        await asyncio.wait_for(
+            manager.close_all(config.WS_RECONNECT_MIN_DELAY_MS, config.WS_RECONNECT_MAX_DELAY_MS),
+            config.GATEWAY_SHUTDOWN_TIMEOUT)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        stop_server()
+
 # Health check endpoint for the API gateway
 @app.get("/health")
 def health():
+    if gateway_draining:
+        # Load balancers in front of the gateway stop sending it new requests
+        raise HTTPException(status_code=503, detail="draining")
     return {"status": "healthy", "service": "api_gateway"}
 
 # WebSocket endpoint for real-time ChatOps
@@ -153,8 +552,13 @@ async def websocket_endpoint(websocket: WebSocket):
             role = websocket.query_params.get("role")
     except:
         pass
+
+    # Topics to subscribe to, comma separated (everything by default)
+    topics = config.WS_DEFAULT_TOPICS
+    if websocket.query_params.get("topics"):
+        topics = [t.strip() for t in websocket.query_params["topics"].split(",") if t.strip()]
         
-    await manager.connect(websocket, user_id, role)
+    await manager.connect(websocket, user_id, role, topics)
     
     try:
         # Send welcome message
@@ -164,16 +568,16 @@ async def websocket_endpoint(websocket: WebSocket):
             "user_id": "system",
             "timestamp": time.time()
         }
-        await manager.send_personal_message(json.dumps(welcome_msg), websocket)
+        manager.send_personal_message(json.dumps(welcome_msg), websocket)
         
         # Send connection info
         info_msg = {
             "type": "system",
-            "message": f"Your User ID: {user_id} | Role: {role} | Type 'help' for commands",
+            "message": f"Your User ID: {user_id} | Role: {role} | Topics: {', '.join(sorted(manager.topics_of(websocket)))} | Type 'help' for commands",
             "user_id": "system", 
             "timestamp": time.time()
         }
-        await manager.send_personal_message(json.dumps(info_msg), websocket)
+        manager.send_personal_message(json.dumps(info_msg), websocket)
         
         while True:
             data = await websocket.receive_text()
@@ -182,14 +586,17 @@ async def websocket_endpoint(websocket: WebSocket):
             
     except WebSocketDisconnect:
         manager.disconnect(websocket)
+        if gateway_draining:
+            return
         # Notify other clients about disconnection
         disconnect_msg = {
             "type": "system",
+            "topic": "presence",
             "message": f"User {user_id} disconnected",
             "user_id": "system",
             "timestamp": time.time()
         }
-        await manager.broadcast(json.dumps(disconnect_msg))
+        manager.publish(("presence",), json.dumps(disconnect_msg))
     except Exception as e:
         print(f"WebSocket error: {e}")
         manager.disconnect(websocket)
@@ -208,33 +615,38 @@ async def handle_chatops_command(command: str, websocket: WebSocket, user_id: st
             "user_id": user_id,
             "timestamp": time.time()
         }
-        await manager.send_personal_message(json.dumps(echo_msg), websocket)
+        manager.send_personal_message(json.dumps(echo_msg), websocket)
         
         # Broadcast command to other clients (only if not sensitive)
         if not command.startswith(('start ', 'stop ', 'create ', 'update ', 'delete ')):
             broadcast_msg = {
                 "type": "command_received", 
+                "topic": "commands",
                 "message": f"User {user_id} executed: {command}",
                 "user_id": user_id,
                 "timestamp": time.time()
             }
-            await manager.broadcast(json.dumps(broadcast_msg), websocket)
+            manager.publish(("commands",), json.dumps(broadcast_msg), websocket)
         
-        # Process the command
-        response = await process_command(command, user_id, user_role)
+        # Process the command (subscriptions belong to the connection)
+        if command.lower().startswith(("subscribe ", "unsubscribe ")) or command.lower() == "topics":
+            response = process_topic_command(command, websocket)
+        else:
+            response = await process_command(command, user_id, user_role)
         
         # Send response back to sender
-        await manager.send_personal_message(json.dumps(response), websocket)
+        manager.send_personal_message(json.dumps(response), websocket)
         
         # Broadcast response to other clients if it's a status-changing command
-        if command.startswith(('fail ', 'recover ', 'start ', 'stop ')):
+        if command.startswith(('fail ', 'recover ', 'start ', 'stop ', 'restart ', 'scale ')):
             broadcast_response = {
                 "type": "system_broadcast",
+                "topic": "commands",
                 "message": f"System updated by {user_id}: {response['message']}",
                 "user_id": "system",
                 "timestamp": time.time()
             }
-            await manager.broadcast(json.dumps(broadcast_response), websocket)
+            manager.publish(("commands",), json.dumps(broadcast_response), websocket)
             
     except Exception as e:
         error_response = {
@@ -243,7 +655,38 @@ async def handle_chatops_command(command: str, websocket: WebSocket, user_id: st
             "user_id": "system",
             "timestamp": time.time()
         }
-        await manager.send_personal_message(json.dumps(error_response), websocket)
+        manager.send_personal_message(json.dumps(error_response), websocket)
+
+# Subscribe, unsubscribe or list the topics of a ChatOps connection
+def process_topic_command(command: str, websocket: WebSocket) -> Dict:
+    parts = command.split()
+    action = parts[0].lower()
+    if action == "topics":
+        available = ", ".join([f"health.{name}" for name in services] + [f"{name}s.events" for name in services]
+                              + ["commands", "alerts", "presence"])
+        message = (f"📡 Subscribed to: {', '.join(sorted(manager.topics_of(websocket))) or 'nothing'}\n"
+                   f"Topics: {available} (prefix.* and * match several)")
+    elif len(parts) < 2:
+        message = f"❌ Usage: {action} <topic> [topic ...]"
+    elif action == "subscribe" and not all(TOPIC_PATTERN.match(topic) for topic in parts[1:]):
+        invalid = [topic for topic in parts[1:] if not TOPIC_PATTERN.match(topic)]
+        message = f"❌ Invalid topic {', '.join(invalid)}: use names like health.product, prefix.* or *"
+    else:
+        changed = []
+        try:
+            for topic in parts[1:]:
+                if manager.subscribe(websocket, topic) if action == "subscribe" else manager.unsubscribe(websocket, topic):
+                    changed.append(topic)
+        except ValueError as e:
+            return {"type": "error", "message": f"❌ {e}", "user_id": "system", "timestamp": time.time()}
+        verb = "Subscribed to" if action == "subscribe" else "Unsubscribed from"
+        message = f"📡 {verb} {', '.join(changed)}" if changed else "📡 Nothing changed"
+    return {
+        "type": "command_response",
+        "message": message,
+        "user_id": "system",
+        "timestamp": time.time()
+    }
 
 # Process and execute ChatOps commands
 async def process_command(command: str, user_id: str, user_role: str) -> Dict:
@@ -253,19 +696,36 @@ async def process_command(command: str, user_id: str, user_role: str) -> Dict:
     if command_lower == "status":
         # Create serializable status data
         status_data = {
-            "services": {k: {"status": v["status"], "healthy": v["healthy"]} for k, v in services.items()},
-            "total_requests": request_count,
-            "load_balancer_state": current_product_instance
+            "services": {k: {"status": v["status"], "healthy": v["healthy"], "breaker": v["breaker"].state} for k, v in services.items()},
+            "total_requests": total_requests(),
+            "load_balancer_state": load_balancer_state()
         }
         
         message = "=== NETWORK STATUS ===\n"
         for service, info in status_data["services"].items():
             status = "✅ RUNNING" if info["status"] == "running" else "❌ STOPPED"
             health = "HEALTHY" if info["healthy"] else "UNHEALTHY"
-            message += f"{service.upper():<10}: {status} ({health})\n"
+            limiter = limiters[service]
+            message += (f"{service.upper():<10}: {status} ({health}) breaker={info['breaker']} "
+                        f"limit={limiter.in_flight}/{limiter.limit} queued={limiter.queue_depth} "
+                        f"rejected={limiter.rejected}\n")
+            for instance in services[service]["balancer"].instances:
+                instance_health = "up" if instance.healthy else "down"
+                message += (f"  {instance.url:<24} {instance_health:<5} breaker={instance.breaker.state} "
+                            f"in-flight={instance.in_flight} ewma={instance.ewma_latency * 1000:.1f}ms\n")
         
         message += f"\nTotal Requests: {status_data['total_requests']}"
         message += f"\nLoad Balancer State: {status_data['load_balancer_state']}"
+        cache_stats = response_cache.stats()
+        message += (f"\nCache: {cache_stats['entries']} entries, {cache_stats['size_bytes']} bytes, "
+                    f"hits={cache_stats['hits']} misses={cache_stats['misses']} (hit ratio {cache_stats['hit_ratio']:.0%})")
+        message += f"\nCoalesced Requests: {singleflight.coalesced}"
+        hedges_sent = sum(policy.hedges_sent for policy in hedge_policies.values())
+        hedges_won = sum(policy.hedges_won for policy in hedge_policies.values())
+        retries = sum(policy.retries for policy in hedge_policies.values())
+        exhausted = sum(policy.budget_exhausted for policy in hedge_policies.values())
+        message += (f"\nHedging: sent={hedges_sent} won={hedges_won} retries={retries} "
+                    f"budget exhausted={exhausted}")
         
         return {
             "type": "command_response",
@@ -344,6 +804,7 @@ async def process_command(command: str, user_id: str, user_role: str) -> Dict:
         service_name = command_lower.split(" ")[1].lower()
         if service_name in services:
             services[service_name]["healthy"] = False
+            services[service_name]["balancer"].set_healthy(False)
             return {
                 "type": "command_response", 
                 "message": f"✅ Simulated failure for {service_name} service",
@@ -361,6 +822,8 @@ async def process_command(command: str, user_id: str, user_role: str) -> Dict:
         service_name = command_lower.split(" ")[1].lower()
         if service_name in services:
             services[service_name]["healthy"] = True
+            services[service_name]["balancer"].set_healthy(True)
+            reset_breakers(service_name)
             return {
                 "type": "command_response",
                 "message": f"✅ Recovered {service_name} service", 
@@ -383,10 +846,9 @@ async def process_command(command: str, user_id: str, user_role: str) -> Dict:
             try:
                 # Create user through API gateway
                 user_data = {"name": name, "email": email}
-                response = requests.post(
+                response = await upstream.post(
                     f"{services['user']['host']}/users/",
-                    json=user_data,
-                    timeout=5
+                    json_body=user_data
                 )
                 if response.status_code == 200:
                     user_data = response.json()
@@ -418,24 +880,144 @@ async def process_command(command: str, user_id: str, user_role: str) -> Dict:
                 "timestamp": time.time()
             }
             
+    elif command_lower.startswith("balance "):
+        if user_role != "manager":
+            return {
+                "type": "error",
+                "message": "❌ Only managers can change load balancing",
+                "user_id": "system",
+                "timestamp": time.time()
+            }
+        
+        parts = command_lower.split()
+        if len(parts) != 3 or parts[1] not in services:
+            return {
+                "type": "error",
+                "message": f"❌ Usage: balance <service> <{'|'.join(POLICIES)}>",
+                "user_id": "system",
+                "timestamp": time.time()
+            }
+        try:
+            services[parts[1]]["balancer"].set_policy(parts[2])
+        except ValueError as e:
+            return {
+                "type": "error",
+                "message": f"❌ {e}",
+                "user_id": "system",
+                "timestamp": time.time()
+            }
+        return {
+            "type": "command_response",
+            "message": f"✅ {parts[1]} service now balanced with {parts[2]}",
+            "user_id": "system",
+            "timestamp": time.time()
+        }
+
+    elif command_lower.startswith("restart "):
+        if user_role != "manager":
+            return {
+                "type": "error",
+                "message": "❌ Only managers can restart services",
+                "user_id": "system",
+                "timestamp": time.time()
+            }
+        
+        parts = command_lower.split()
+        if len(parts) not in (2, 3) or parts[1] not in services or parts[2:] not in ([], ["--rolling"]):
+            return {
+                "type": "error",
+                "message": "❌ Usage: restart <service> [--rolling]",
+                "user_id": "system",
+                "timestamp": time.time()
+            }
+        success, msg = await restart_service(parts[1], rolling=len(parts) == 3)
+        return {
+            "type": "command_response" if success else "error",
+            "message": f"{'✅' if success else '❌'} {msg}",
+            "user_id": "system",
+            "timestamp": time.time()
+        }
+
+    elif command_lower.startswith("scale "):
+        if user_role != "manager":
+            return {
+                "type": "error",
+                "message": "❌ Only managers can scale services",
+                "user_id": "system",
+                "timestamp": time.time()
+            }
+        
+        parts = command_lower.split()
+        if len(parts) != 3 or parts[1] not in services or not parts[2].isdigit():
+            return {
+                "type": "error",
+                "message": "❌ Usage: scale <service> <n>",
+                "user_id": "system",
+                "timestamp": time.time()
+            }
+        success, msg = await scale_service(parts[1], int(parts[2]))
+        return {
+            "type": "command_response" if success else "error",
+            "message": f"{'✅' if success else '❌'} {msg}",
+            "user_id": "system",
+            "timestamp": time.time()
+        }
+
+    elif command_lower.startswith("logs "):
+        parts = command_lower.split()
+        if len(parts) not in (2, 3) or parts[1] not in services or (len(parts) == 3 and not parts[2].isdigit()):
+            return {
+                "type": "error",
+                "message": "❌ Usage: logs <service> [n]",
+                "user_id": "system",
+                "timestamp": time.time()
+            }
+        count = min(int(parts[2]) if len(parts) == 3 else 20, config.SERVICE_LOG_LINES)
+        entries = service_logs[parts[1]].tail(max(count, 1))
+        message = f"=== {parts[1].upper()} LOGS (last {len(entries)} lines) ===\n"
+        for entry in entries:
+            stamp = time.strftime("%H:%M:%S", time.localtime(entry["timestamp"]))
+            marker = " [stderr]" if entry["stream"] == "stderr" else ""
+            message += f"{stamp} :{entry['port']}{marker} {entry['line']}\n"
+        return {
+            "type": "command_response",
+            "message": message,
+            "user_id": "system",
+            "timestamp": time.time()
+        }
+
     elif command_lower == "help":
         help_text = """=== AVAILABLE COMMANDS ===
 status                    - Show service health status
 start <service>          - Start a service (Manager only)
 stop <service>           - Stop a service (Manager only)
+restart <service> [--rolling] - Restart a service; --rolling replaces
+                           one instance at a time without downtime (Manager only)
 fail <service>           - Simulate service failure  
 recover <service>        - Recover a service
 create user <name> <email> - Create a new user
+balance <service> <policy> - Set load balancing policy (Manager only)
+scale <service> <n>      - Run n instances of a service (Manager only)
+logs <service> [n]       - Show the last n output lines of a service
 help                     - Show this help
 clear                    - Clear chat history
 users                    - Show connected users
+subscribe <topic> ...    - Receive messages of these topics
+unsubscribe <topic> ...  - Stop receiving messages of these topics
+topics                   - Show your subscriptions and the topics
 
 Examples:
   start user
   stop product
+  restart product --rolling
   fail user
   recover product
   create user John john@example.com
+  balance product ewma
+  scale product 4
+  logs order 50
+  unsubscribe *
+  subscribe health.product alerts
   status
 """
         return {
@@ -446,8 +1028,8 @@ Examples:
         }
             
     elif command_lower == "users":
-        user_count = len(manager.active_connections)
-        manager_count = sum(1 for role in manager.user_roles.values() if role == "manager")
+        user_count = len(manager)
+        manager_count = manager.role_count("manager")
         client_count = user_count - manager_count
         
         return {
@@ -472,68 +1054,141 @@ Examples:
             "timestamp": time.time()
         }
 
+# Environment telling a service process where to send heartbeats
+def heartbeat_env() -> Dict[str, str]:
+    if not config.HEARTBEAT_ENABLED:
+        return {}
+    return {
+        HEARTBEAT_ADDR_ENV: f"{config.HEARTBEAT_HOST}:{config.HEARTBEAT_PORT}",
+        HEARTBEAT_INTERVAL_ENV: str(config.HEARTBEAT_INTERVAL),
+    }
+
+# Readiness probe of a starting service process
+async def instance_ready(url: str) -> bool:
+    try:
+        response = await asyncio.wait_for(upstream.get(f"{url}/health"), config.HEALTH_CHECK_TIMEOUT)
+    except (UpstreamError, asyncio.TimeoutError):
+        return False
+    return response.status_code == 200
+
+# Crash and restart notices of supervised processes
+def process_event(service_name: str, text: str):
+    print(text)
+    broadcast_system_event(text, f"health.{service_name}", "alerts")
+
+# WARM ZYGOTES: ONE PER SERVICE WITH THE SERVICE'S IMPORTS ALREADY LOADED
+# Service processes are forked from the zygote, which makes them ready in a
+# fraction of a cold start. The leader starts the zygotes in the background
+# when it takes over; without fork() (Windows) processes are started cold.
+zygotes = {
+    service_name: Zygote(service_name, service_info["command"], config.ZYGOTE_START_TIMEOUT)
+    for service_name, service_info in services.items()
+} if config.ZYGOTE_ENABLED and Zygote.supported() else {}
+
+def warm_zygotes():
+    for zygote in zygotes.values():
+        task = asyncio.create_task(zygote.start())
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+
+# Supervised process for one instance of a service
+def make_process(service_name: str, port: int) -> SupervisedProcess:
+    url = f"http://localhost:{port}"
+    return SupervisedProcess(
+        f"{service_name}@{url}",
+        services[service_name]["command"],
+        # Unbuffered UTF-8 output, so lines (and emoji) reach the log right away
+        {**os.environ, **heartbeat_env(), "SERVICE_PORT": str(port),
+         "PYTHONUNBUFFERED": "1", "PYTHONIOENCODING": "utf-8"},
+        lambda: instance_ready(url),
+        ready_timeout=config.SERVICE_READY_TIMEOUT,
+        poll_interval=config.SERVICE_READY_POLL_INTERVAL,
+        max_poll_interval=config.SERVICE_READY_MAX_POLL_INTERVAL,
+        restart=config.SERVICE_AUTO_RESTART,
+        restart_backoff=config.SERVICE_RESTART_BACKOFF,
+        max_restart_backoff=config.SERVICE_RESTART_MAX_BACKOFF,
+        on_event=lambda text: process_event(service_name, text),
+        on_output=lambda stream, line: service_logs[service_name].append(port, stream, line),
+        zygote=zygotes.get(service_name),
+    )
+
 # Start a service as a subprocess
 async def start_service_process(service_name: str):
-    """Start a service as a subprocess"""
+    """Start one supervised subprocess per configured instance of a service"""
     service = services[service_name]
+    # Registered instances run on their own
+    instances = [i for i in service["balancer"].instances if i.lease is None]
     
-    if service["status"] == "running":
-        return False, f"{service_name} service is already running"
+    if service["status"] in ("running", "starting"):
+        return False, f"{service_name} service is already {service['status']}"
+    
+    if not is_leader:
+        return await run_on_leader(service_name, COMMAND_START)
     
     try:
         service["status"] = "starting"
         print(f"Starting service {service_name} with command: {service['command']}")
         
-        # Start the service process
-        process = subprocess.Popen(
-            service["command"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-        service["process"] = process
+        # Start one process per instance, each listening on its own port, and
+        # wait for all of them to answer /health (or time out)
+        for instance in instances:
+            instance.process = make_process(service_name, instance.port)
+        ready = await asyncio.gather(*(instance.process.start() for instance in instances))
         service["status"] = "running"
         
-        # Wait a bit for service to start
-        time.sleep(3)
+        for instance, ok in zip(instances, ready):
+            instance.healthy = ok
+            instance.draining = False
+        service["healthy"] = service["balancer"].healthy
+        reset_breakers(service_name)
         
-        # Check if service started successfully
-        try:
-            response = requests.get(f"{service['host']}/health", timeout=2)
-            service["healthy"] = response.status_code == 200
-            return True, f"Started {service_name} service"
-        except:
-            service["healthy"] = False
+        healthy_count = sum(ready)
+        if healthy_count == 0:
             return False, f"Service {service_name} started but not responding"
+        latency = max(instance.process.start_latency for instance, ok in zip(instances, ready) if ok)
+        return True, (f"Started {service_name} service ({healthy_count}/{len(instances)} instances, "
+                      f"ready in {latency:.2f}s)")
         
     except Exception as e:
+        for instance in instances:
+            if instance.process:
+                await instance.process.stop(timeout=0)
+                instance.process = None
         service["status"] = "stopped"
-        service["process"] = None
         return False, f"Failed to start {service_name}: {str(e)}"
 
 # Stop a service process
 async def stop_service_process(service_name: str):
-    """Stop a service process"""
+    """Stop every process of a service"""
     service = services[service_name]
     
     if service["status"] != "running":
         return False, f"{service_name} service is not running"
     
+    if not is_leader:
+        return await run_on_leader(service_name, COMMAND_STOP)
+    
     try:
         service["status"] = "stopping"
         
-        # Terminate the process if we started it
-        if service["process"]:
-            service["process"].terminate()
-            try:
-                service["process"].wait(timeout=5)
-            except subprocess.TimeoutExpired:
-                service["process"].kill()
-                service["process"].wait()
-            service["process"] = None
+        # Drain the processes we started, then terminate them
+        running = service_processes(service_name)
+        for instance in running:
+            begin_drain(service_name, instance)
+        await asyncio.gather(*(drain_and_stop(service_name, instance) for instance in running))
+        for instance in running:
+            # Extra processes from scaling leave the pool
+            if instance.lease and instance.lease.managed:
+                registry.deregister(instance.lease.id)
+            elif instance.lease is None:
+                add_health_check(service_name, instance)  # skipped until it has a process again
         
         service["status"] = "stopped"
-        service["healthy"] = False
+        # Registered instances run on their own and stay in the pool
+        for instance in service["balancer"].instances:
+            if instance.lease is None:
+                instance.healthy = False
+        service["healthy"] = service["balancer"].healthy
         
         return True, f"Stopped {service_name} service"
         
@@ -541,200 +1196,316 @@ async def stop_service_process(service_name: str):
         service["status"] = "running"  # Revert status if failed to stop
         return False, f"Failed to stop {service_name}: {str(e)}"
 
-# Background health check for all services
-def health_check():
-    """Background health check for all services"""
-    while True:
-        for service_name, service_info in services.items():
-            # Skip health check for services that are stopped by manager and don't have a process
-            if service_info["status"] == "stopped" and service_info["process"] is None:
-                continue
-                
-            try:
-                response = requests.get(f"{service_info['host']}/health", timeout=2)
-                is_healthy = response.status_code == 200
-                
-                # Only update status if service is not manually stopped by manager
-                if service_info["status"] != "stopped":
-                    service_info["healthy"] = is_healthy
-                    service_info["status"] = "running" if is_healthy else "stopped"
-                
-                print(f"Health check for {service_name}: reachable={is_healthy}, status={service_info['status']}")
-                
-            except Exception as e:
-                # Service is not reachable
-                if service_info["status"] != "stopped":
-                    service_info["healthy"] = False
-                    service_info["status"] = "stopped"
-                print(f"Health check failed for {service_name}: {e}")
-        
-        # Log status without process objects
-        status_summary = {k: {'status': v['status'], 'healthy': v['healthy']} for k, v in services.items()}
-        print(f"Health status: {status_summary}")
-        time.sleep(10)
-
-# Get a specific user by ID
-@app.get("/users/{user_id}")
-def get_user(user_id: str):
-    global request_count
-    request_count += 1
-    
-    # Check if service is marked as stopped in gateway
-    if services["user"]["status"] == "stopped":
-        raise HTTPException(status_code=503, detail="User service has been stopped by manager")
-    
-    if not services["user"]["healthy"]:
-        raise HTTPException(status_code=503, detail="User service unavailable")
-    
-    try:
-        response = requests.get(f"{services['user']['host']}/users/{user_id}")
-        return response.json()
-    except Exception as e:
-        services["user"]["healthy"] = False
-        raise HTTPException(status_code=503, detail=f"User service error: {e}")
-
-# Create a new user
-@app.post("/users/")
-def create_user(user_data: dict):
-    global request_count
-    request_count += 1
-    
-    # Check if service is marked as stopped in gateway
-    if services["user"]["status"] == "stopped":
-        raise HTTPException(status_code=503, detail="User service has been stopped by manager")
-    
-    if not services["user"]["healthy"]:
-        raise HTTPException(status_code=503, detail="User service unavailable")
-    
-    try:
-        response = requests.post(f"{services['user']['host']}/users/", json=user_data)
-        return response.json()
-    except Exception as e:
-        services["user"]["healthy"] = False
-        raise HTTPException(status_code=503, detail=f"User service error: {e}")
-
-# Get a specific product by ID with load balancing
-@app.get("/products/{product_id}")
-def get_product(product_id: str):
-    global request_count, current_product_instance
-    request_count += 1
-    
-    # Check if service is marked as stopped in gateway
-    if services["product"]["status"] == "stopped":
-        raise HTTPException(status_code=503, detail="Product service has been stopped by manager")
-    
-    if not services["product"]["healthy"]:
-        raise HTTPException(status_code=503, detail="Product service unavailable")
-    
-    instance = current_product_instance
-    current_product_instance = (current_product_instance + 1) % 2
-    
-    try:
-        response = requests.get(f"{services['product']['host']}/products/{product_id}")
-        return {**response.json(), "load_balanced_instance": instance}
-    except Exception as e:
-        services["product"]["healthy"] = False
-        raise HTTPException(status_code=503, detail=f"Product service error: {e}")
-
-# Create a new product
-@app.post("/products/")
-def create_product(product_data: dict):
-    global request_count
-    request_count += 1
-    
-    # Check if service is marked as stopped in gateway
-    if services["product"]["status"] == "stopped":
-        raise HTTPException(status_code=503, detail="Product service has been stopped by manager")
-    
-    if not services["product"]["healthy"]:
-        raise HTTPException(status_code=503, detail="Product service unavailable")
-    
-    try:
-        response = requests.post(f"{services['product']['host']}/products/", json=product_data)
-        return response.json()
-    except Exception as e:
-        services["product"]["healthy"] = False
-        raise HTTPException(status_code=503, detail=f"Product service error: {e}")
-
-# Purchase a product
-@app.post("/products/{product_id}/purchase")
-def purchase_product(product_id: str, purchase_data: dict):
-    global request_count
-    request_count += 1
-    
-    # Check if service is marked as stopped in gateway
-    if services["product"]["status"] == "stopped":
-        raise HTTPException(status_code=503, detail="Product service has been stopped by manager")
-    
-    if not services["product"]["healthy"]:
-        raise HTTPException(status_code=503, detail="Product service unavailable")
-    
-    try:
-        response = requests.post(f"{services['product']['host']}/products/{product_id}/purchase", json=purchase_data)
-        return response.json()
-    except Exception as e:
-        services["product"]["healthy"] = False
-        raise HTTPException(status_code=503, detail=f"Product service error: {e}")
-
-# Get a specific order by ID
-@app.get("/orders/{order_id}")
-def get_order(order_id: str):
-    global request_count
-    request_count += 1
-    
-    # Check if service is marked as stopped in gateway
-    if services["order"]["status"] == "stopped":
-        raise HTTPException(status_code=503, detail="Order service has been stopped by manager")
-    
-    if not services["order"]["healthy"]:
-        raise HTTPException(status_code=503, detail="Order service unavailable")
-    
-    try:
-        response = requests.get(f"{services['order']['host']}/orders/{order_id}")
-        return response.json()
-    except Exception as e:
-        services["order"]["healthy"] = False
-        raise HTTPException(status_code=503, detail=f"Order service error: {e}")
-
-# Create a new order
-@app.post("/orders/")
-def create_order(order_data: dict):
-    global request_count
-    request_count += 1
+# Stop every supervised service process (gateway shutdown)
+async def stop_all_processes():
+    processes = [instance.process for service_info in services.values()
+                 for instance in service_info["balancer"].instances if instance.process]
+    await asyncio.gather(*(process.stop(config.SERVICE_STOP_TIMEOUT) for process in processes))
+
+# SCALING: NUMBER OF PROCESSES THE GATEWAY RUNS FOR A SERVICE
+# The configured instances come first; every process beyond them gets a free
+# port and joins the pool as a managed registry lease (so every gateway worker
+# sees it). Scaling down drains the most recently started instances and then
+# stops them; configured instances stay in the pool without a process.
+scale_locks = {service_name: asyncio.Lock() for service_name in services}
+
+# Instances of a service with a process run by this gateway, in start order
+def service_processes(service_name: str) -> List[Instance]:
+    return [i for i in services[service_name]["balancer"].instances if i.process]
+
+async def scale_service(service_name: str, count: int):
+    service = services[service_name]
+    if service["status"] != "running":
+        return False, f"{service_name} service is not running (start it first)"
+    if not 1 <= count <= config.SCALE_MAX_INSTANCES:
+        return False, f"Instance count must be between 1 and {config.SCALE_MAX_INSTANCES}"
     
-    # Check if service is marked as stopped in gateway
-    if services["order"]["status"] == "stopped":
-        raise HTTPException(status_code=503, detail="Order service has been stopped by manager")
+    if not is_leader:
+        return await run_on_leader(service_name, COMMAND_SCALE, count)
     
-    if not services["order"]["healthy"]:
-        raise HTTPException(status_code=503, detail="Order service unavailable")
+    async with scale_locks[service_name]:
+        running = service_processes(service_name)
+        if count > len(running):
+            # Restart configured instances without a process before adding new ones
+            parked = [i for i in service["balancer"].instances if i.lease is None and i.process is None]
+            missing = count - len(running)
+            results = await asyncio.gather(
+                *(start_instance_process(service_name, instance) for instance in parked[:missing]),
+                *(start_extra_instance(service_name) for _ in range(missing - len(parked[:missing]))))
+            failed = results.count(False)
+        else:
+            await asyncio.gather(*(retire_instance(service_name, instance) for instance in running[count:]))
+            failed = 0
+        service["healthy"] = service["balancer"].healthy
+        autoscaler.scaled(service_name)
     
+    now = len(service_processes(service_name))
+    if failed:
+        return False, f"Scaled {service_name} to {now} instances ({failed} failed to start, see logs {service_name})"
+    return True, f"Scaled {service_name} to {now} instances"
+
+# Start the process of a configured instance that has none
+async def start_instance_process(service_name: str, instance: Instance) -> bool:
+    instance.process = make_process(service_name, instance.port)
+    ok = await instance.process.start()
+    instance.breaker.reset()
+    instance.healthy = ok
+    return ok
+
+# Start one more process on a free port and add it to the pool once ready
+async def start_extra_instance(service_name: str) -> bool:
+    port = free_port()
+    process = make_process(service_name, port)
+    if not await process.start():
+        await process.stop(timeout=0)
+        return False
     try:
-        response = requests.post(f"{services['order']['host']}/orders/", json=order_data)
-        return response.json()
-    except Exception as e:
-        services["order"]["healthy"] = False
-        raise HTTPException(status_code=503, detail=f"Order service error: {e}")
-
-# Update an existing order
-@app.put("/orders/{order_id}")
-def update_order(order_id: str, order_data: dict):
-    global request_count
-    request_count += 1
+        lease = registry.register(service_name, "localhost", port, managed=True)
+    except ValueError as e:
+        print(f"Scaling {service_name}: {e}")
+        await process.stop(config.SERVICE_STOP_TIMEOUT)
+        return False
+    for instance in services[service_name]["balancer"].instances:
+        if instance.lease is lease:
+            instance.process = process
+    return True
+
+# Take an instance out of the pool: the balancer sends it no new requests
+# (other workers see it unhealthy) and it is no longer health checked
+def begin_drain(service_name: str, instance: Instance):
+    health_checker.remove((service_name, instance))
+    instance.draining = True
+    instance.healthy = False
+    print(f"{service_name} instance {instance.url} draining")
+    broadcast_system_event(f"🚰 {service_name} instance {instance.url} draining", f"health.{service_name}")
+
+# Drain an instance and stop its process: SIGTERM once its in-flight requests
+# finished (or SERVICE_DRAIN_TIMEOUT passed), SIGKILL after SERVICE_STOP_TIMEOUT
+async def drain_and_stop(service_name: str, instance: Instance):
+    if not await drain_instance(service_name, instance):
+        print(f"{service_name} instance {instance.url} still busy after {config.SERVICE_DRAIN_TIMEOUT}s, stopping it")
+    await instance.process.stop(config.SERVICE_STOP_TIMEOUT)
+    instance.process = None
+    instance.draining = False
+
+# Take an instance out of the pool, let its in-flight requests finish and
+# stop its process
+async def retire_instance(service_name: str, instance: Instance):
+    begin_drain(service_name, instance)
+    await drain_and_stop(service_name, instance)
+    if instance.lease:
+        registry.deregister(instance.lease.id)
+    else:
+        add_health_check(service_name, instance)  # skipped until it has a process again
+
+# Wait until an instance that left the pool has no requests in flight: the
+# gateway's own count and, from its heartbeats, the count seen by the service
+# itself (which includes requests from the other gateway workers)
+async def drain_instance(service_name: str, instance: Instance) -> bool:
+    deadline = time.monotonic() + config.SERVICE_DRAIN_TIMEOUT
+    if shared_state:
+        # Let the other workers see the instance leave the pool
+        await asyncio.sleep(config.SHARED_STATE_SYNC_INTERVAL * 2)
+    left_at = time.time()
+    target = (service_name, instance)
+    while time.monotonic() < deadline:
+        beat = heartbeat_monitor.payloads.get(target) if heartbeat_monitor.fresh(target) else None
+        if instance.in_flight == 0 and (beat is None or (beat["sent_at"] > left_at and beat["in_flight"] == 0)):
+            return True
+        await asyncio.sleep(0.05)
+    return False
+
+# RESTARTS
+# A rolling restart replaces the processes of a service one at a time: the
+# replacement starts on a free port and joins the pool once it is ready, and
+# only then is the old instance drained and stopped, so the service never runs
+# with fewer instances than before. A plain restart stops and starts the service.
+async def restart_service(service_name: str, rolling: bool = True):
+    service = services[service_name]
+    if service["status"] != "running":
+        return False, f"{service_name} service is not running"
     
-    # Check if service is marked as stopped in gateway
-    if services["order"]["status"] == "stopped":
-        raise HTTPException(status_code=503, detail="Order service has been stopped by manager")
+    if not is_leader:
+        return await run_on_leader(service_name, COMMAND_RESTART, int(rolling))
     
-    if not services["order"]["healthy"]:
-        raise HTTPException(status_code=503, detail="Order service unavailable")
+    if not rolling:
+        ok, message = await stop_service_process(service_name)
+        if not ok:
+            return False, message
+        ok, message = await start_service_process(service_name)
+        return ok, message.replace("Started", "Restarted", 1)
     
-    try:
-        response = requests.put(f"{services['order']['host']}/orders/{order_id}", json=order_data)
-        return response.json()
-    except Exception as e:
-        services["order"]["healthy"] = False
-        raise HTTPException(status_code=503, detail=f"Order service error: {e}")
+    async with scale_locks[service_name]:
+        old = service_processes(service_name)
+        print(f"Rolling restart of {service_name}: replacing {len(old)} instances")
+        for replaced, instance in enumerate(old):
+            if not await start_extra_instance(service_name):
+                return False, (f"Rolling restart of {service_name} stopped: the replacement for {instance.url} "
+                               f"did not become ready ({replaced}/{len(old)} replaced, see logs {service_name})")
+            await retire_instance(service_name, instance)
+        service["healthy"] = service["balancer"].healthy
+        autoscaler.scaled(service_name)
+    return True, f"Restarted {service_name} service ({len(old)} instances replaced one at a time)"
+
+# AUTOSCALING (OPTIONAL, LEADER ONLY)
+# The services in config.AUTOSCALE_SERVICES are scaled between their bounds
+# from the upstream latency this gateway observes and the in-flight requests
+# and queue depth reported by the instances' heartbeats. In multi-worker mode
+# the leader's latency samples stand in for all workers.
+autoscaler = Autoscaler(
+    config.AUTOSCALE_SERVICES,
+    p95_high=config.AUTOSCALE_P95_HIGH,
+    p95_low=config.AUTOSCALE_P95_LOW,
+    in_flight_high=config.AUTOSCALE_IN_FLIGHT_HIGH,
+    in_flight_low=config.AUTOSCALE_IN_FLIGHT_LOW,
+    queue_high=config.AUTOSCALE_QUEUE_HIGH,
+    window=config.AUTOSCALE_WINDOW,
+    up_after=config.AUTOSCALE_UP_AFTER,
+    down_after=config.AUTOSCALE_DOWN_AFTER,
+    up_cooldown=config.AUTOSCALE_UP_COOLDOWN,
+    down_cooldown=config.AUTOSCALE_DOWN_COOLDOWN,
+)
+
+# Current load of a service: heartbeats count the requests of every gateway
+# worker, this worker's own counts are the fallback without a fresh beat
+def service_load(service_name: str) -> ServiceLoad:
+    running = service_processes(service_name)
+    in_flight = 0
+    queue_depth = limiters[service_name].queue_depth
+    for instance in running:
+        target = (service_name, instance)
+        if heartbeat_monitor.fresh(target):
+            beat = heartbeat_monitor.payloads[target]
+            in_flight += beat["in_flight"]
+            queue_depth += beat["queue_depth"]
+        else:
+            in_flight += instance.in_flight
+    return ServiceLoad(len(running), in_flight, queue_depth, autoscaler.p95(service_name))
+
+async def autoscale():
+    while True:
+        await asyncio.sleep(config.AUTOSCALE_INTERVAL)
+        if not is_leader:
+            continue
+        for service_name in autoscaler.bounds:
+            if services[service_name]["status"] != "running" or scale_locks[service_name].locked():
+                continue
+            load = service_load(service_name)
+            decision = autoscaler.evaluate(service_name, load)
+            if decision is None:
+                continue
+            count, reason = decision
+            text = (f"{'📈' if count > load.instances else '📉'} Autoscaler: scaling {service_name} "
+                    f"from {load.instances} to {count} instances ({reason})")
+            print(text)
+            broadcast_system_event(text, f"health.{service_name}")
+            # Draining can take a while; the other services are not held up
+            task = asyncio.create_task(autoscale_service(service_name, count))
+            background_tasks.add(task)
+            task.add_done_callback(background_tasks.discard)
+
+async def autoscale_service(service_name: str, count: int):
+    ok, message = await scale_service(service_name, count)
+    if not ok:
+        print(f"Autoscaler: {message}")
+        broadcast_system_event(f"⚠️ Autoscaler: {message}", f"health.{service_name}", "alerts")
+
+# Hand a start/stop/scale command to the leader worker and wait for it to finish
+async def run_on_leader(service_name: str, command: int, arg: int = 0):
+    verb = {COMMAND_START: "start", COMMAND_STOP: "stop", COMMAND_SCALE: "scale", COMMAND_RESTART: "restart"}[command]
+    seq = shared_state.send_command(service_name, command, arg)
+    deadline = time.monotonic() + config.SHARED_STATE_COMMAND_TIMEOUT
+    while True:
+        ok = shared_state.command_result(service_name, seq)
+        if ok is not None:
+            break
+        if time.monotonic() > deadline:
+            return False, f"Timed out waiting for the leader worker to {verb} {service_name}"
+        await asyncio.sleep(config.SHARED_STATE_SYNC_INTERVAL)
+    registry.sync()  # processes added or removed by scaling
+    state_sync.sync()
+    if not ok:
+        return False, f"Failed to {verb} {service_name} (see the leader worker's log)"
+    if command == COMMAND_STOP:
+        return True, f"Stopped {service_name} service"
+    if command == COMMAND_SCALE:
+        return True, f"Scaled {service_name} to {arg} instances"
+    if command == COMMAND_RESTART:
+        return True, f"Restarted {service_name} service{' (rolling)' if arg else ''}"
+    instances = services[service_name]["balancer"].instances
+    healthy_count = sum(1 for i in instances if i.healthy)
+    return True, f"Started {service_name} service ({healthy_count}/{len(instances)} instances)"
+
+# Run a command handed over by another worker (leader only)
+async def run_leader_command(service_name: str, command: int, seq: int):
+    if command == COMMAND_START:
+        ok, message = await start_service_process(service_name)
+    elif command == COMMAND_SCALE:
+        ok, message = await scale_service(service_name, shared_state.command_arg(service_name))
+    elif command == COMMAND_RESTART:
+        ok, message = await restart_service(service_name, bool(shared_state.command_arg(service_name)))
+    else:
+        ok, message = await stop_service_process(service_name)
+    print(message)
+    shared_state.finish_command(service_name, seq, ok)
+
+# Keep this worker in step with the other workers: heartbeat, leader
+# election, state sync, shared counters and commands for the leader
+async def sync_shared_state():
+    global is_leader
+    handled = {}
+    while True:
+        shared_state.heartbeat()
+        leader = shared_state.elect_leader(config.SHARED_STATE_STALE_AFTER)
+        if leader and not is_leader:
+            is_leader = True
+            print(f"Gateway worker {os.getpid()} is the leader: running health checks and service processes")
+            # Commands sent before this worker took over are not replayed
+            handled = {service_name: shared_state.command(service_name)[1] for service_name in services}
+            await start_health_monitoring()
+            warm_zygotes()
+        elif not leader and is_leader:
+            print(f"Gateway worker {os.getpid()} lost leadership")
+            is_leader = False
+            await stop_health_monitoring()
+
+        registry.expire()
+        state_sync.sync()
+        proxied = proxied_requests.values()
+        for service_name in services:
+            shared_state.set_proxied(service_name, proxied.get((service_name,), 0))
+
+        if is_leader:
+            for service_name in services:
+                command, seq = shared_state.command(service_name)
+                if seq > handled[service_name]:
+                    handled[service_name] = seq
+                    task = asyncio.create_task(run_leader_command(service_name, command, seq))
+                    background_tasks.add(task)
+                    task.add_done_callback(background_tasks.discard)
+
+        await asyncio.sleep(config.SHARED_STATE_SYNC_INTERVAL)
+
+# Close the service breaker and every instance breaker of a service
+def reset_breakers(service_name: str):
+    services[service_name]["breaker"].reset()
+    for instance in services[service_name]["balancer"].instances:
+        instance.breaker.reset()
+
+# Requests routed to services, over all workers
+def total_requests() -> int:
+    if shared_state:
+        return shared_state.proxied_total()
+    return int(proxied_requests.total())
+
+# One-line summary of every service's balancing policy and healthy instances
+def load_balancer_state() -> str:
+    parts = []
+    for service_name, service_info in services.items():
+        balancer = service_info["balancer"]
+        healthy = sum(1 for i in balancer.instances if i.healthy)
+        parts.append(f"{service_name}: {balancer.policy.name} {healthy}/{len(balancer.instances)}")
+    return " | ".join(parts)
 
 # Get current system status and service health
 @app.get("/management/status")
@@ -747,15 +1518,122 @@ def get_status():
             "type": service_info["type"], 
             "healthy": service_info["healthy"],
             "port": service_info["port"],
-            "status": service_info["status"]
+            "status": service_info["status"],
+            "load_balancer": service_info["balancer"].stats(),
+            "breaker": service_info["breaker"].stats(),
+            "hedging": hedge_policies[service_name].stats(),
+            "concurrency": limiters[service_name].stats(),
+            "processes": [i.process.stats() for i in service_info["balancer"].instances if i.process]
         }
     
     return {
         "services": serializable_services,
-        "total_requests": request_count,
-        "load_balancer_state": current_product_instance
+        "total_requests": total_requests(),
+        "load_balancer_state": load_balancer_state(),
+        "upstream_pools": upstream.stats(),
+        "cache": response_cache.stats(),
+        "coalescing": singleflight.stats(),
+        "workers": shared_state.workers() if shared_state else None,
+        "health_checks": health_checker.stats() if health_checker.running else None,
+        "heartbeats": heartbeat_monitor.stats() if heartbeat_monitor.running else None,
+        "registry": registry.stats(),
+        "autoscaler": autoscaler.stats() if config.AUTOSCALE_ENABLED else None,
+        "zygotes": {service_name: zygote.stats() for service_name, zygote in zygotes.items()},
+        "websockets": manager.stats(),
+        "status_stream": status_stream.stats()
     }
 
+# What the dashboards show, streamed as deltas: service state, breakers,
+# instance health and the request counter
+def status_view() -> Dict:
+    return {
+        "services": {
+            service_name: {
+                "status": service_info["status"],
+                "healthy": service_info["healthy"],
+                "breaker": service_info["breaker"].state,
+                "instances": {
+                    instance.url: {"healthy": instance.healthy, "draining": instance.draining}
+                    for instance in service_info["balancer"].instances
+                },
+            }
+            for service_name, service_info in services.items()
+        },
+        "total_requests": total_requests(),
+        "load_balancer_state": load_balancer_state(),
+    }
+
+status_stream = StatusStream(status_view, config.STATUS_STREAM_INTERVAL, config.STATUS_STREAM_MIN_INTERVAL,
+                             config.STATUS_STREAM_KEEPALIVE, config.WS_RECONNECT_MAX_DELAY_MS)
+
+# Server-sent events: the status view once, then only the fields that change
+@app.get("/management/status/stream")
+async def stream_status():
+    return StreamingResponse(status_stream.events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# Last output lines of a service's processes
+@app.get("/management/logs/{service_name}")
+def get_logs(service_name: str, lines: int = 100, stream: Optional[str] = None):
+    if service_name not in services:
+        raise HTTPException(status_code=404, detail="Service not found")
+    if stream not in (None, "stdout", "stderr"):
+        raise HTTPException(status_code=400, detail="stream must be stdout or stderr")
+    lines = max(1, min(lines, config.SERVICE_LOG_LINES))
+    return {
+        "service": service_name,
+        "lines": service_logs[service_name].tail(lines, stream),
+    }
+
+# Body of a registry registration
+class InstanceRegistration(BaseModel):
+    host: str = "localhost"
+    port: int
+    weight: int = 1
+    metadata: Dict = {}
+    ttl: Optional[float] = None
+
+# Register a service instance under a lease (manager role required); it must
+# renew the lease before the TTL runs out or it is removed from the pool
+@app.post("/management/registry/{service_name}")
+async def register_instance(service_name: str, registration: InstanceRegistration, request: Request):
+    if request.headers.get('user-role', 'client') != "manager":
+        raise HTTPException(status_code=403, detail="Only managers can register instances")
+    if service_name not in services:
+        raise HTTPException(status_code=404, detail="Service not found")
+    try:
+        lease = registry.register(service_name, registration.host, registration.port, registration.weight,
+                                  registration.metadata, registration.ttl)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return lease.stats()
+
+# Renew a lease
+@app.put("/management/registry/leases/{lease_id}")
+async def renew_lease(lease_id: str, request: Request):
+    if request.headers.get('user-role', 'client') != "manager":
+        raise HTTPException(status_code=403, detail="Only managers can renew leases")
+    try:
+        return registry.renew(lease_id).stats()
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+
+# Remove a registered instance
+@app.delete("/management/registry/leases/{lease_id}")
+async def deregister_instance(lease_id: str, request: Request):
+    if request.headers.get('user-role', 'client') != "manager":
+        raise HTTPException(status_code=403, detail="Only managers can deregister instances")
+    try:
+        lease = registry.deregister(lease_id)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+    return {"message": f"Deregistered {lease.service} instance http://{lease.host}:{lease.port}"}
+
+# List the registered instances and their leases
+@app.get("/management/registry")
+def list_registry():
+    return registry.stats()
+
 # Start a specific service (manager role required)
 @app.post("/management/start/{service_name}")
 async def start_service(service_name: str, request: Request):
@@ -775,6 +1653,32 @@ async def start_service(service_name: str, request: Request):
             raise HTTPException(status_code=500, detail=message)
     raise HTTPException(status_code=404, detail="Service not found")
 
+# Restart a service, by default one instance at a time (manager role required)
+@app.post("/management/restart/{service_name}")
+async def restart_service_endpoint(service_name: str, request: Request, rolling: bool = True):
+    user_role = request.headers.get('user-role', 'client')
+    if user_role != "manager":
+        raise HTTPException(status_code=403, detail="Only managers can restart services")
+    if service_name not in services:
+        raise HTTPException(status_code=404, detail="Service not found")
+    success, message = await restart_service(service_name, rolling)
+    if not success:
+        raise HTTPException(status_code=500, detail=message)
+    return {"message": message}
+
+# Set the number of instances of a service (manager role required)
+@app.post("/management/scale/{service_name}")
+async def scale_service_endpoint(service_name: str, instances: int, request: Request):
+    user_role = request.headers.get('user-role', 'client')
+    if user_role != "manager":
+        raise HTTPException(status_code=403, detail="Only managers can scale services")
+    if service_name not in services:
+        raise HTTPException(status_code=404, detail="Service not found")
+    success, message = await scale_service(service_name, instances)
+    if not success:
+        raise HTTPException(status_code=400, detail=message)
+    return {"message": message}
+
 # Stop a specific service (manager role required)
 @app.post("/management/stop/{service_name}")
 async def stop_service(service_name: str, request: Request):
@@ -799,6 +1703,7 @@ async def stop_service(service_name: str, request: Request):
 def simulate_failure(service_name: str):
     if service_name in services:
         services[service_name]["healthy"] = False
+        services[service_name]["balancer"].set_healthy(False)
         return {"message": f"Simulated failure for {service_name}"}
     return {"error": "Service not found"}
 
@@ -807,19 +1712,374 @@ def simulate_failure(service_name: str):
 def recover_service(service_name: str):
     if service_name in services:
         services[service_name]["healthy"] = True
+        services[service_name]["balancer"].set_healthy(True)
+        reset_breakers(service_name)
         return {"message": f"Recovered {service_name}"}
     return {"error": "Service not found"}
 
+# Admit a request through the service and instance circuit breakers and pick
+# the instance to serve it, or fail the request with 503
+def pick_instance(service_name: str, exclude: Instance = None) -> Instance:
+    service_breaker = services[service_name]["breaker"]
+    if not service_breaker.try_acquire():
+        raise HTTPException(
+            status_code=503,
+            detail=f"{service_name.capitalize()} service circuit breaker is open",
+            headers={"Retry-After": str(max(1, round(service_breaker.retry_after())))},
+        )
+    instance = services[service_name]["balancer"].pick(exclude)
+    if instance is None or not instance.breaker.try_acquire():
+        service_breaker.cancel()
+        raise HTTPException(status_code=503, detail=f"{service_name.capitalize()} service has no available instances")
+    return instance
+
+# Wait for a slot under the service's concurrency limit, or fail fast with 503
+async def admit(service_name: str):
+    if not await limiters[service_name].acquire(config.CONCURRENCY_QUEUE_TIMEOUT):
+        raise HTTPException(
+            status_code=503,
+            detail=f"{service_name.capitalize()} service is overloaded",
+            headers={"Retry-After": "1"},
+        )
+
+# Pick a second instance for a hedge or retry if one is available and the
+# service's retry budget allows it, otherwise None
+def pick_extra_instance(service_name: str, exclude: Instance):
+    if services[service_name]["balancer"].pick(exclude) is None:
+        return None
+    if not hedge_policies[service_name].allow_extra_attempt():
+        return None
+    try:
+        return pick_instance(service_name, exclude)
+    except HTTPException:
+        return None
+
+# Count an upstream attempt and its latency; status is "error" when no
+# response arrived
+def observe_upstream(service_name: str, instance: Instance, method: str, status, latency: float):
+    upstream_requests.inc(service_name, instance.url, method, str(status))
+    upstream_latency.observe(latency, service_name, instance.url)
+    autoscaler.observe(service_name, latency)
+
+# Record the outcome of a request on the instance and both breakers.
+# Transport errors and 5xx responses count as failures.
+def record_result(service_name: str, instance: Instance, ok: bool, latency: float):
+    instance.end(ok)
+    instance.breaker.record(ok, latency)
+    services[service_name]["breaker"].record(ok, latency)
+
+# Release an instance and its breaker permits without recording an outcome
+# (a hedged attempt that lost the race and was cancelled)
+def release_instance(service_name: str, instance: Instance):
+    instance.end(True)
+    instance.breaker.cancel()
+    services[service_name]["breaker"].cancel()
+
+# Wrap a callback so that only its first call goes through
+def once(callback):
+    called = False
+
+    def call(*args):
+        nonlocal called
+        if not called:
+            called = True
+            callback(*args)
+    return call
+
+# Only idempotent requests without a body can be sent a second time
+def replayable(request: Request) -> bool:
+    return (
+        config.RETRY_ENABLED
+        and request.method == "GET"
+        and "transfer-encoding" not in request.headers
+        and request.headers.get("content-length", "0") == "0"
+    )
+
+# Forward a request to one instance and buffer the response.
+# Raises UpstreamError when the instance could not be reached.
+async def fetch_from_instance(service_name: str, instance: Instance, request: Request, upstream_path: str):
+    started = instance.begin()
+    try:
+        upstream_response = await proxy_engine.fetch(request, instance.url, upstream_path)
+    except asyncio.CancelledError:
+        release_instance(service_name, instance)
+        raise
+    except BaseException:
+        record_result(service_name, instance, False, time.monotonic() - started)
+        observe_upstream(service_name, instance, request.method, "error", time.monotonic() - started)
+        instance.penalize(time.monotonic() - started)
+        raise
+    latency = time.monotonic() - started
+    ok = upstream_response.status_code < 500
+    observe_upstream(service_name, instance, request.method, upstream_response.status_code, latency)
+    instance.observe(latency)
+    record_result(service_name, instance, ok, latency)
+    if ok:
+        hedge_policies[service_name].latency.record(latency)
+    return upstream_response
+
+# Forward a request to a service instance and buffer the response, within
+# the service's concurrency limit
+async def fetch_from_service(service_name: str, request: Request, upstream_path: str, hedge: bool = False):
+    await admit(service_name)
+    admitted = time.monotonic()
+    ok = False
+    try:
+        upstream_response, instance = await hedged_fetch(service_name, request, upstream_path, hedge)
+        ok = upstream_response.status_code < 500
+        return upstream_response, instance
+    finally:
+        limiters[service_name].release(time.monotonic() - admitted, ok)
+
+# Replayable requests that fail are retried once on another instance, and with
+# hedge=True a second copy is sent to another instance when the first is
+# slower than the hedge delay; the first good response wins.
+async def hedged_fetch(service_name: str, request: Request, upstream_path: str, hedge: bool = False):
+    policy = hedge_policies[service_name]
+    can_replay = replayable(request)
+    if can_replay:
+        policy.budget.deposit()
+    hedge_delay = policy.hedge_delay() if can_replay and hedge and config.HEDGE_ENABLED else None
+
+    def send(instance: Instance) -> asyncio.Task:
+        task = asyncio.ensure_future(fetch_from_instance(service_name, instance, request, upstream_path))
+        attempts[task] = instance
+        return task
+
+    attempts = {}
+    first = pick_instance(service_name)
+    send(first)
+    hedged = None
+    extra_sent = False
+    failure = None
+    try:
+        while attempts:
+            timeout = hedge_delay if not extra_sent else None
+            done, _ = await asyncio.wait(attempts, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                # The first attempt is slow: hedge it on another instance
+                extra_sent = True
+                hedged = pick_extra_instance(service_name, first)
+                if hedged is not None:
+                    policy.hedges_sent += 1
+                    send(hedged)
+                continue
+            for task in done:
+                instance = attempts.pop(task)
+                try:
+                    upstream_response = task.result()
+                except UpstreamError as e:
+                    failure = e
+                    continue
+                if upstream_response.status_code < 500:
+                    if instance is hedged:
+                        policy.hedges_won += 1
+                    return upstream_response, instance
+                failure = (upstream_response, instance)
+            if not attempts and not extra_sent and can_replay:
+                extra_sent = True
+                retry = pick_extra_instance(service_name, first)
+                if retry is not None:
+                    policy.retries += 1
+                    send(retry)
+    finally:
+        # Cancel the attempt that lost the race (or every attempt if the
+        # caller went away)
+        for task in attempts:
+            task.cancel()
+            background_tasks.add(task)
+            task.add_done_callback(background_tasks.discard)
+
+    if isinstance(failure, UpstreamError):
+        raise HTTPException(status_code=503, detail=f"{service_name.capitalize()} service error: {failure}")
+    return failure
+
+# Forward a request to one instance and stream the response back
+async def stream_from_instance(service_name: str, instance: Instance, request: Request, upstream_path: str,
+                               on_complete=None):
+    # Gateway annotations are sent as response headers (X-Gateway-Service, ...)
+    annotations = {"gateway_service": service_name, "load_balanced_instance": instance.url}
+    result = {"latency": 0.0, "status_code": 0}
+
+    def response_started(status_code: int):
+        result["latency"] = time.monotonic() - started
+        result["status_code"] = status_code
+        instance.observe(result["latency"])
+        observe_upstream(service_name, instance, request.method, status_code, result["latency"])
+
+    def complete(ok: bool):
+        record_result(service_name, instance, ok and result["status_code"] < 500, result["latency"])
+        if on_complete:
+            on_complete(ok)
+
+    started = instance.begin()
+    try:
+        return await proxy_engine.forward(
+            request, instance.url, upstream_path, annotations,
+            on_response=response_started,
+            on_complete=complete,
+        )
+    except BaseException:
+        record_result(service_name, instance, False, time.monotonic() - started)
+        if not result["status_code"]:
+            observe_upstream(service_name, instance, request.method, "error", time.monotonic() - started)
+            instance.penalize(time.monotonic() - started)
+        raise
+
+# Forward a request to a service instance and stream the response back,
+# within the service's concurrency limit
+async def stream_from_service(service_name: str, request: Request, upstream_path: str, on_complete=None):
+    # The concurrency slot is held until the response head arrives
+    await admit(service_name)
+    admitted = time.monotonic()
+    ok = False
+    try:
+        response = await stream_with_retry(service_name, request, upstream_path, on_complete)
+        ok = response.status_code < 500
+        return response
+    finally:
+        limiters[service_name].release(time.monotonic() - admitted, ok)
+
+# Replayable requests that fail before a response arrives are retried once on
+# another instance
+async def stream_with_retry(service_name: str, request: Request, upstream_path: str, on_complete=None):
+    can_replay = replayable(request)
+    if on_complete:
+        # Once for the request, whichever attempt completes it
+        on_complete = once(on_complete)
+    if can_replay:
+        hedge_policies[service_name].budget.deposit()
+    instance = pick_instance(service_name)
+    try:
+        return await stream_from_instance(service_name, instance, request, upstream_path, on_complete)
+    except UpstreamError as e:
+        retry = pick_extra_instance(service_name, instance) if can_replay else None
+        if retry is None:
+            raise HTTPException(status_code=503, detail=f"{service_name.capitalize()} service error: {e}")
+    hedge_policies[service_name].retries += 1
+    try:
+        return await stream_from_instance(service_name, retry, request, upstream_path, on_complete)
+    except UpstreamError as e:
+        raise HTTPException(status_code=503, detail=f"{service_name.capitalize()} service error: {e}")
+
+# Serve a GET-by-id read from the cache, or fetch it upstream once for all
+# identical concurrent requests (same service, path and query)
+async def buffered_read(service_name: str, request: Request, upstream_path: str, read_rule, hedge: bool = False):
+    cache_key = f"{request.url.path}?{request.url.query}"
+    if config.CACHE_ENABLED:
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            cached_response, origin = cached
+            # The instance that served the cached response, as on a MISS
+            return proxy_engine.respond(cached_response, {"gateway_service": service_name,
+                                                          "load_balanced_instance": origin, "cache": "HIT"})
+
+    # A write to the entity changes its generation: the response of a read
+    # started before is not cached, and later reads do not join its flight
+    generation = response_cache.generation(request.url.path)
+
+    async def fetch():
+        upstream_response, instance = await fetch_from_service(service_name, request, upstream_path, hedge)
+        if config.CACHE_ENABLED and upstream_response.status_code == 200:
+            response_cache.put(cache_key, request.url.path, upstream_response, read_rule.ttl, instance.url,
+                               generation)
+        return upstream_response, instance
+
+    if config.COALESCE_ENABLED:
+        (upstream_response, instance), shared = await singleflight.do((service_name, cache_key, generation), fetch)
+    else:
+        (upstream_response, instance), shared = await fetch(), False
+
+    annotations = {"gateway_service": service_name, "load_balanced_instance": instance.url}
+    if config.CACHE_ENABLED:
+        annotations["cache"] = "MISS"
+    if shared:
+        annotations["coalesced"] = "true"
+    return proxy_engine.respond(upstream_response, annotations)
+
+# Tell the subscribers of a service's events topic (e.g. orders.events) about
+# a write routed to it
+def publish_write_event(service_name: str, method: str, path: str, ok: bool):
+    topic = f"{service_name}s.events"
+    if not manager.has_subscribers(topic):
+        return
+    message = {
+        "type": "system_broadcast",
+        "topic": topic,
+        "message": f"{'📝' if ok else '⚠️'} {method} {path} {'completed' if ok else 'failed'}",
+        "user_id": "system",
+        "timestamp": time.time()
+    }
+    manager.publish((topic,), json.dumps(message))
+
+# Generic reverse proxy for every route in the route table
+# (registered last so gateway-owned routes above take precedence)
+@app.api_route("/{path:path}", methods=PROXY_METHODS)
+async def proxy_request(path: str, request: Request):
+    # Label metrics with the route table prefix instead of the catch-all path
+    request.scope["metrics_route"] = "unmatched"
+    try:
+        route, upstream_path = route_table.resolve(request.method, request.url.path)
+    except MethodNotAllowed as e:
+        raise HTTPException(status_code=405, detail=str(e), headers={"Allow": ", ".join(e.allowed)})
+    if route is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+    request.scope["metrics_route"] = route.prefix
+    proxied_requests.inc(route.service)
+    service = services[route.service]
+    service_label = route.service.capitalize()
+
+    # Check if service is marked as stopped in gateway
+    if service["status"] == "stopped":
+        raise HTTPException(status_code=503, detail=f"{service_label} service has been stopped by manager")
+
+    if not service["healthy"]:
+        raise HTTPException(status_code=503, detail=f"{service_label} service unavailable")
+
+    # Reads of single entities are buffered so they can be cached and shared
+    # between identical concurrent requests
+    read_rule = response_cache.rule_for(request.url.path) if request.method == "GET" else None
+    if read_rule is not None:
+        return await buffered_read(route.service, request, upstream_path, read_rule, route.hedge)
+
+    if request.method == "GET":
+        return await stream_from_service(route.service, request, upstream_path)
+
+    # Writes invalidate the cached reads of the entity they touch, both before
+    # forwarding and once finished so a concurrent read cannot re-cache stale data
+    write_path = request.url.path
+    response_cache.invalidate_for_write(write_path)
+
+    def write_complete(ok: bool):
+        response_cache.invalidate_for_write(write_path)
+        publish_write_event(route.service, request.method, write_path, ok)
+
+    return await stream_from_service(route.service, request, upstream_path, on_complete=write_complete)
+
 # Start the application
 if __name__ == "__main__":
-    # Start health check in background
-    health_thread = threading.Thread(target=health_check, daemon=True)
-    health_thread.start()
-    
     import uvicorn
     print("API Gateway starting on http://localhost:8000")
     print("Frontend available at: http://localhost:8000")
     print("WebSocket ChatOps available at: ws://localhost:8000/ws/chatops")
     print(f"Serving frontend from: {frontend_path}")
     print("Note: Services start in 'stopped' state. Use management controls to start them.")
-    uvicorn.run(app, host="0.0.0.0", port=8000, log_level="info")
\ No newline at end of file
+
+    if config.GATEWAY_WORKERS > 1:
+        # Workers share service state through a shared memory segment; the
+        # elected leader worker runs the health checks
+        state_name = f"micronet_gateway_{os.getpid()}"
+        state = make_shared_state(state_name, create=True)
+        StateSync(state, services).publish()
+        os.environ[SHARED_STATE_ENV] = state_name
+        print(f"Running {config.GATEWAY_WORKERS} gateway workers")
+        try:
+            uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=config.GATEWAY_WORKERS,
+                        app_dir=current_dir, log_level="info",
+                        timeout_graceful_shutdown=config.GATEWAY_SHUTDOWN_TIMEOUT)
+        finally:
+            state.close(unlink=True)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000, log_level="info",
+                    timeout_graceful_shutdown=config.GATEWAY_SHUTDOWN_TIMEOUT)
\ No newline at end of file
@@ -0,0 +1,133 @@
+# OUTBOUND WEBSOCKET QUEUES
+# Every ChatOps connection gets a bounded queue of outgoing messages that its
+# own writer task drains, so a broadcast only appends to the queues and one
+# slow browser no longer holds up the others. When a queue is full the
+# overflow policy decides what gives:
+#   drop_oldest  the oldest queued message is discarded
+#   coalesce     a queued message with the same key (e.g. the state of one
+#                circuit breaker) is replaced by the new one; messages
+#                without a key fall back to drop_oldest
+#   disconnect   the slow consumer is closed (1008) and has to reconnect
+import asyncio
+from collections import deque
+from typing import Dict, Optional
+
+POLICIES = ("drop_oldest", "coalesce", "disconnect")
+
+
+class Outbox:
+    """Outgoing messages of one WebSocket, at most ``size`` queued."""
+
+    def __init__(self, websocket, size: int, policy: str = "drop_oldest", name: str = "", close_timeout: float = 5.0):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown overflow policy {policy!r}, expected one of {POLICIES}")
+        self.websocket = websocket
+        self.size = size
+        self.policy = policy
+        self.name = name
+        self.close_timeout = close_timeout
+        self.queue: deque = deque()  # (key, message)
+        self.closed = False  # no more messages are accepted
+        self.max_depth = 0
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self._close: Optional[tuple] = None  # (code, reason) to close with once the queue is empty
+        self._aborted = False
+        self._wakeup = asyncio.Event()
+        self._writer = asyncio.create_task(self._write())
+
+    @property
+    def depth(self) -> int:
+        return len(self.queue)
+
+    # Queue a message without waiting. Returns False if it was not queued
+    # (the connection is closing, or was closed for falling behind)
+    def put(self, message: str, key: Optional[str] = None) -> bool:
+        if self.closed:
+            return False
+        if len(self.queue) >= self.size:
+            if self.policy == "disconnect":
+                print(f"🐢 WebSocket {self.name} fell {len(self.queue)} messages behind, disconnecting")
+                self.abort(1008, "send queue overflow")
+                return False
+            if not (self.policy == "coalesce" and key is not None and self._coalesce(key)):
+                self.queue.popleft()
+                self.dropped += 1
+        self.queue.append((key, message))
+        self.max_depth = max(self.max_depth, len(self.queue))
+        self._wakeup.set()
+        return True
+
+    # Remove the queued message with this key, if any
+    def _coalesce(self, key: str) -> bool:
+        for index, (queued_key, _) in enumerate(self.queue):
+            if queued_key == key:
+                del self.queue[index]
+                self.coalesced += 1
+                return True
+        return False
+
+    async def _write(self):
+        try:
+            while True:
+                while self.queue:
+                    _, message = self.queue.popleft()
+                    await self.websocket.send_text(message)
+                    self.sent += 1
+                if self._close:
+                    code, reason = self._close
+                    await self.websocket.close(code=code, reason=reason)
+                    return
+                self._wakeup.clear()
+                await self._wakeup.wait()
+        except Exception:
+            # The client went away; its receive loop notices as well
+            pass
+        finally:
+            self.closed = True
+            self.queue.clear()
+
+    # Send what is queued, then close the connection. Gives up after
+    # close_timeout and closes it right away
+    async def close(self, code: int = 1000, reason: str = ""):
+        if not self.closed and not self._close:
+            self._close = (code, reason)
+            self._wakeup.set()
+        await asyncio.wait({self._writer}, timeout=self.close_timeout)
+        if not self._writer.done():
+            self.abort(code, reason)
+            await asyncio.wait({self._writer})
+
+    # Drop what is queued and close the connection without waiting for the
+    # writer, which may be stuck on a client that does not read
+    def abort(self, code: int, reason: str):
+        if self._aborted:
+            return
+        self.cancel()
+        self._aborted = True
+        self._writer = asyncio.create_task(self._close_now(code, reason))
+
+    async def _close_now(self, code: int, reason: str):
+        try:
+            await asyncio.wait_for(self.websocket.close(code=code, reason=reason), self.close_timeout)
+        except Exception:
+            pass
+
+    # Stop the writer (the connection is gone). A close started by abort()
+    # is left to finish
+    def cancel(self):
+        self.closed = True
+        self.queue.clear()
+        if not self._aborted:
+            self._writer.cancel()
+
+    def stats(self) -> Dict:
+        return {
+            "depth": len(self.queue),
+            "max_depth": self.max_depth,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "closed": self.closed,
+        }
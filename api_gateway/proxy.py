@@ -0,0 +1,241 @@
+# DECLARATIVE ROUTE TABLE AND STREAMING REVERSE-PROXY ENGINE
+# Routes map a path prefix and a set of methods to a service; the engine
+# forwards the request and streams both bodies chunk by chunk.
+import json
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+
+from fastapi import Request
+from starlette.background import BackgroundTask
+from starlette.responses import Response, StreamingResponse
+
+from upstream import UpstreamClient, UpstreamResponse
+
+# Headers that describe a single hop and must not be forwarded
+HOP_BY_HOP_HEADERS = {
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "te",
+    "trailer",
+    "trailers",
+    "transfer-encoding",
+    "upgrade",
+    "host",
+}
+
+# Response headers the gateway's own server (uvicorn) always sets itself
+GATEWAY_RESPONSE_HEADERS = {"date", "server"}
+
+
+class MethodNotAllowed(Exception):
+    def __init__(self, allowed: List[str]):
+        super().__init__(f"Method not allowed, expected one of {allowed}")
+        self.allowed = allowed
+
+
+class Route:
+    """Maps requests whose path starts with ``prefix`` to a service.
+
+    ``{name}`` in the prefix matches exactly one path segment, and the prefix
+    ends on a segment boundary (``/stats/user`` does not match
+    ``/stats/userX``). When
+    ``upstream_prefix`` is set, the matched prefix is replaced with it before
+    the request is forwarded (e.g. ``/stats/product`` -> ``/stats``).
+    ``hedge`` opts buffered GETs on the route into hedged requests.
+    """
+
+    def __init__(self, methods: List[str], prefix: str, service: str, upstream_prefix: Optional[str] = None,
+                 hedge: bool = False):
+        self.methods = {m.upper() for m in methods}
+        self.prefix = prefix
+        self.service = service
+        self.upstream_prefix = upstream_prefix
+        self.hedge = hedge
+        pattern = re.sub(r"\\\{\w+\\\}", "[^/]+", re.escape(prefix))
+        # A prefix ending with "/" already ends on a boundary
+        boundary = "" if prefix.endswith("/") else "(?=/|$)"
+        self._regex = re.compile(f"^{pattern}{boundary}")
+
+    def match_path(self, path: str) -> Optional[re.Match]:
+        return self._regex.match(path)
+
+    # Rewrite the gateway path into the upstream path
+    def upstream_path(self, path: str, match: re.Match) -> str:
+        if self.upstream_prefix is None:
+            return path
+        return self.upstream_prefix + path[match.end():]
+
+    def __repr__(self):
+        return f"Route({sorted(self.methods)}, {self.prefix!r} -> {self.service})"
+
+
+class RouteTable:
+    """Ordered list of routes; the first route matching path and method wins."""
+
+    def __init__(self, routes: List[Route]):
+        self.routes = routes
+
+    # Returns (route, upstream_path), or (None, None) when nothing matches.
+    # Raises MethodNotAllowed when the path is known but not for this method.
+    def resolve(self, method: str, path: str) -> Tuple[Optional[Route], Optional[str]]:
+        allowed = set()
+        for route in self.routes:
+            match = route.match_path(path)
+            if match is None:
+                continue
+            if method.upper() in route.methods:
+                return route, route.upstream_path(path, match)
+            allowed |= route.methods
+        if allowed:
+            raise MethodNotAllowed(sorted(allowed))
+        return None, None
+
+
+# Drop hop-by-hop headers, including any named in the Connection header
+def filter_headers(headers: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    extra = set()
+    for key, value in headers:
+        if key == "connection":
+            extra |= {token.strip().lower() for token in value.split(",")}
+    return [(k, v) for k, v in headers if k not in HOP_BY_HOP_HEADERS and k not in extra]
+
+
+def _content_length(request: Request) -> int:
+    try:
+        return int(request.headers.get("content-length", "0"))
+    except ValueError:
+        return 0
+
+
+class ProxyEngine:
+    """Forwards a gateway request to an upstream and streams the response back.
+
+    In passthrough mode the upstream status, headers and body bytes are
+    forwarded unchanged and gateway annotations travel as ``X-`` response
+    headers. With passthrough off, JSON object bodies are decoded and the
+    annotations merged into them (the gateway's original response format).
+    """
+
+    def __init__(self, client: UpstreamClient, passthrough: bool = True):
+        self.client = client
+        self.passthrough = passthrough
+
+    # Build the upstream target, headers and body for a gateway request
+    def _upstream_request(self, request: Request, upstream_path: str):
+        target = upstream_path
+        if request.url.query:
+            target += f"?{request.url.query}"
+        headers = filter_headers([(k.decode("latin-1").lower(), v.decode("latin-1")) for k, v in request.headers.raw])
+        # Only requests that carry a body get one: a bodyless request (e.g. a
+        # GET with Content-Length: 0) can then be replayed by retries and hedges
+        # without reading the consumed request stream again
+        body = None
+        if "transfer-encoding" in request.headers or _content_length(request) > 0:
+            body = request.stream()
+        return target, headers, body
+
+    # on_response(status_code) runs when the upstream response head arrives
+    # and on_complete(ok) runs once after the body was fully sent or abandoned.
+    # When forward() raises, on_complete is not called: the caller records
+    # the failure
+    async def forward(self, request: Request, base_url: str, upstream_path: str,
+                      annotations: Optional[Dict[str, str]] = None,
+                      on_response: Optional[Callable[[int], None]] = None,
+                      on_complete: Optional[Callable[[bool], None]] = None) -> Response:
+        target, headers, body = self._upstream_request(request, upstream_path)
+        upstream_response = await self.client.stream(request.method, base_url, target, headers, body)
+        if on_response:
+            on_response(upstream_response.status_code)
+        complete = _Completion(on_complete)
+        response_headers = response_headers_from(upstream_response.headers)
+
+        if annotations and not self.passthrough and _is_json(response_headers):
+            content = await upstream_response.aread()
+            complete(True)
+            return self.respond(UpstreamResponse(upstream_response.status_code, response_headers, content), annotations)
+
+        response = StreamingResponse(
+            _stream_body(upstream_response, complete),
+            status_code=upstream_response.status_code,
+            background=BackgroundTask(_close_stream, upstream_response, complete),
+        )
+        _set_raw_headers(response, response_headers, annotations)
+        return response
+
+    # Forward a request and buffer the whole response (for cacheable reads)
+    async def fetch(self, request: Request, base_url: str, upstream_path: str) -> UpstreamResponse:
+        target, headers, body = self._upstream_request(request, upstream_path)
+        upstream_response = await self.client.stream(request.method, base_url, target, headers, body)
+        content = await upstream_response.aread()
+        return UpstreamResponse(upstream_response.status_code, response_headers_from(upstream_response.headers), content)
+
+    # Turn a buffered upstream response into a gateway response
+    def respond(self, upstream_response: UpstreamResponse, annotations: Optional[Dict[str, str]] = None) -> Response:
+        content = upstream_response.content
+        if annotations and not self.passthrough and _is_json(upstream_response.headers):
+            # Legacy mode: merge the annotations into the JSON object
+            try:
+                data = json.loads(content)
+            except ValueError:
+                data = None
+            if isinstance(data, dict):
+                data.update(annotations)
+                content = json.dumps(data).encode("utf-8")
+                headers = [(k, v) for k, v in upstream_response.headers if k != "content-length"]
+                return Response(content, status_code=upstream_response.status_code, headers=dict(headers))
+
+        response = Response(content, status_code=upstream_response.status_code)
+        _set_raw_headers(response, upstream_response.headers, annotations)
+        return response
+
+
+# Upstream response headers the gateway passes on to its client
+def response_headers_from(headers: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    return [(k, v) for k, v in filter_headers(headers) if k not in GATEWAY_RESPONSE_HEADERS]
+
+
+# Replace Starlette's default headers with the upstream headers as-is,
+# followed by the gateway annotations
+def _set_raw_headers(response: Response, headers: List[Tuple[str, str]], annotations: Optional[Dict[str, str]]):
+    response.raw_headers = [(k.encode("latin-1"), v.encode("latin-1")) for k, v in headers]
+    for key, value in (annotations or {}).items():
+        response.raw_headers.append((annotation_header(key).encode("latin-1"), str(value).encode("latin-1")))
+
+
+# Calls the completion callback at most once
+class _Completion:
+    def __init__(self, callback: Optional[Callable[[bool], None]]):
+        self.callback = callback
+
+    def __call__(self, ok: bool):
+        if self.callback is not None:
+            callback, self.callback = self.callback, None
+            callback(ok)
+
+
+async def _stream_body(upstream_response, complete: _Completion):
+    ok = False
+    try:
+        async for chunk in upstream_response.aiter_bytes():
+            yield chunk
+        ok = True
+    finally:
+        complete(ok)
+
+
+# Runs after the response was sent (or the client went away)
+async def _close_stream(upstream_response, complete: _Completion):
+    await upstream_response.aclose()
+    complete(False)
+
+
+# Response header used for a gateway annotation, e.g. load_balanced_instance
+# -> x-load-balanced-instance
+def annotation_header(key: str) -> str:
+    return "x-" + key.replace("_", "-")
+
+
+def _is_json(headers: List[Tuple[str, str]]) -> bool:
+    return any(k == "content-type" and "json" in v for k, v in headers)
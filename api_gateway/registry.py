@@ -0,0 +1,218 @@
+# DYNAMIC SERVICE REGISTRY
+# Instances that are not in config.SERVICE_INSTANCES register themselves over
+# the management API under a lease with a TTL and renew it periodically.
+# A lease that is not renewed in time is evicted. Every lease owns one
+# instance slot of its service (slots after the configured instances), so it
+# maps onto the same fixed layout as the shared state of a multi-worker
+# gateway; there the registrations are written to the shared segment and
+# every worker mirrors them in its own pools. The gateway also registers the
+# extra processes it runs when a service is scaled, as managed leases that do
+# not expire.
+import random
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from shared_state import SharedState
+
+
+class Lease:
+    """One registered instance and the time its registration expires."""
+
+    def __init__(self, service: str, slot: int, number: int, host: str, port: int, weight: int,
+                 metadata: Dict, ttl: Optional[float], expires_at: float):
+        self.service = service
+        self.slot = slot
+        self.number = number
+        self.host = host
+        self.port = port
+        self.weight = weight
+        self.metadata = metadata
+        self.ttl = ttl  # None for managed leases
+        self.expires_at = expires_at  # time.time(), comparable between processes; inf for managed leases
+        self.registered_at = time.time()
+
+    @property
+    def managed(self) -> bool:
+        return self.ttl is None
+
+    @property
+    def id(self) -> str:
+        return f"{self.service}-{self.slot}-{self.number:x}"
+
+    def stats(self) -> Dict:
+        return {
+            "lease_id": self.id,
+            "service": self.service,
+            "url": f"http://{self.host}:{self.port}",
+            "weight": self.weight,
+            "metadata": self.metadata,
+            "managed": self.managed,
+            "ttl_s": self.ttl,
+            "expires_in_s": None if self.managed else round(self.expires_at - time.time(), 2),
+        }
+
+
+class ServiceRegistry:
+    """Leases of dynamically registered instances.
+
+    ``first_slots`` maps every service to its first slot after the configured
+    instances; ``capacity`` is the number of leases a service can hold.
+    ``on_add(lease)`` and ``on_remove(lease, reason)`` are called when an
+    instance joins or leaves, and ``on_update(lease)`` when it re-registers
+    with another weight or metadata, so the caller can update its pools.
+    ``configured`` holds the (host, port) of the configured instances, which
+    cannot be registered a second time.
+    """
+
+    def __init__(self, first_slots: Dict[str, int], capacity: int, on_add: Callable[[Lease], None],
+                 on_remove: Callable[[Lease, str], None], on_update: Callable[[Lease], None],
+                 default_ttl: float = 10.0, min_ttl: float = 1.0, max_ttl: float = 300.0,
+                 state: Optional[SharedState] = None, configured: Iterable[Tuple[str, int]] = ()):
+        self.first_slots = first_slots
+        self.configured = set(configured)
+        self.capacity = capacity
+        self.on_add = on_add
+        self.on_remove = on_remove
+        self.on_update = on_update
+        self.default_ttl = default_ttl
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+        self.state = state
+        # service -> slot -> lease
+        self.leases: Dict[str, Dict[int, Lease]] = {service: {} for service in first_slots}
+        self.registered = 0
+        self.evicted = 0
+
+    def _slots(self, service: str) -> range:
+        first = self.first_slots[service]
+        return range(first, first + self.capacity)
+
+    # Register an instance, or renew and update the lease it already holds.
+    # Managed leases (processes run by the gateway) never expire.
+    def register(self, service: str, host: str, port: int, weight: int = 1, metadata: Optional[Dict] = None,
+                 ttl: Optional[float] = None, managed: bool = False) -> Lease:
+        if service not in self.leases:
+            raise KeyError(f"Unknown service '{service}'")
+        if not 1 <= weight <= 100:
+            raise ValueError("weight must be between 1 and 100")
+        if not 0 < port < 65536:
+            raise ValueError("port must be between 1 and 65535")
+        if (host, port) in self.configured:
+            raise ValueError(f"http://{host}:{port} is a configured instance")
+        if managed:
+            ttl, expires_at = None, float("inf")
+        else:
+            ttl = self.default_ttl if ttl is None else ttl
+            if not self.min_ttl <= ttl <= self.max_ttl:
+                raise ValueError(f"ttl must be between {self.min_ttl} and {self.max_ttl} seconds")
+            expires_at = time.time() + ttl
+        metadata = metadata or {}
+
+        self.sync()
+        for lease in self.leases[service].values():
+            if (lease.host, lease.port) == (host, port):
+                lease.weight, lease.metadata, lease.ttl, lease.expires_at = weight, metadata, ttl, expires_at
+                if self.state:
+                    self.state.write_lease(service, lease.slot, lease.number, host, port, weight, metadata, ttl,
+                                           expires_at)
+                self.on_update(lease)
+                return lease
+
+        for slot in self._slots(service):
+            if slot in self.leases[service]:
+                continue
+            number = random.getrandbits(48) or 1
+            if self.state and not self.state.claim_lease(service, slot, number):
+                continue  # taken by another worker since the last sync
+            lease = Lease(service, slot, number, host, port, weight, metadata, ttl, expires_at)
+            if self.state:
+                try:
+                    self.state.write_lease(service, slot, number, host, port, weight, metadata, ttl, expires_at)
+                except ValueError:
+                    self.state.clear_lease(service, slot, number)
+                    raise
+            self.registered += 1
+            self._add(lease)
+            return lease
+        raise ValueError(f"No free registry slot for {service} (capacity {self.capacity})")
+
+    # Extend a lease by its TTL
+    def renew(self, lease_id: str) -> Lease:
+        self.sync()
+        lease = self._find(lease_id)
+        if lease.managed:
+            return lease
+        lease.expires_at = time.time() + lease.ttl
+        if self.state and not self.state.renew_lease(lease.service, lease.slot, lease.number, lease.expires_at):
+            self._remove(lease, "evicted")
+            raise KeyError(f"Lease {lease_id} has expired")
+        return lease
+
+    def deregister(self, lease_id: str) -> Lease:
+        self.sync()
+        lease = self._find(lease_id)
+        if self.state:
+            self.state.clear_lease(lease.service, lease.slot, lease.number)
+        self._remove(lease, "deregistered")
+        return lease
+
+    # Evict every lease that was not renewed in time
+    def expire(self) -> List[Lease]:
+        self.sync()
+        now = time.time()
+        expired = [lease for leases in self.leases.values() for lease in leases.values() if lease.expires_at < now]
+        for lease in expired:
+            if self.state:
+                self.state.clear_lease(lease.service, lease.slot, lease.number)
+            self.evicted += 1
+            self._remove(lease, "expired")
+        return expired
+
+    # Mirror registrations made by other workers (multi-worker mode)
+    def sync(self):
+        if self.state is None:
+            return
+        for service, leases in self.leases.items():
+            for slot in self._slots(service):
+                record = self.state.read_lease(service, slot)
+                local = leases.get(slot)
+                if local and (record is None or record["number"] != local.number):
+                    self._remove(local, "removed")
+                    local = None
+                if record is None:
+                    continue
+                if local:
+                    local.expires_at = record["expires_at"]
+                    if (local.weight, local.metadata) != (record["weight"], record["metadata"]):
+                        local.weight, local.metadata = record["weight"], record["metadata"]
+                        self.on_update(local)
+                else:
+                    self._add(Lease(service, slot, record["number"], record["host"], record["port"],
+                                    record["weight"], record["metadata"], record["ttl"], record["expires_at"]))
+
+    def _find(self, lease_id: str) -> Lease:
+        try:
+            service, slot, _ = lease_id.split("-")
+            lease = self.leases[service][int(slot)]
+        except (ValueError, KeyError):
+            raise KeyError(f"Unknown lease {lease_id}")
+        if lease.id != lease_id:
+            raise KeyError(f"Unknown lease {lease_id}")
+        return lease
+
+    def _add(self, lease: Lease):
+        self.leases[lease.service][lease.slot] = lease
+        self.on_add(lease)
+
+    def _remove(self, lease: Lease, reason: str):
+        if self.leases[lease.service].get(lease.slot) is lease:
+            del self.leases[lease.service][lease.slot]
+            self.on_remove(lease, reason)
+
+    def stats(self) -> Dict:
+        return {
+            "capacity_per_service": self.capacity,
+            "registered": self.registered,
+            "evicted": self.evicted,
+            "leases": [lease.stats() for leases in self.leases.values() for lease in leases.values()],
+        }
@@ -0,0 +1,455 @@
+# SHARED STATE FOR MULTI-WORKER GATEWAY MODE
+# With several uvicorn workers every process has its own copy of the service
+# table. This shared memory segment holds the parts that must agree between
+# workers: service status and health, instance health, breaker state,
+# balancing policies, round-robin cursors, request counters, the leases of
+# dynamically registered instances, the response cache generations and the
+# service log buffers. Each worker
+# syncs its local objects with it; one worker is elected leader and owns
+# health probing and the service processes, the others hand start/stop
+# commands to it. Claiming a lease slot, a worker slot or the leadership is a
+# read followed by a write, done while holding a lock on a file next to the
+# segment so that two workers cannot both succeed.
+import json
+import os
+import tempfile
+import time
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple
+
+from logbuffer import LogBuffer
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+MAGIC = 7340.0
+
+# Status strings and breaker states are stored as their index in these lists
+STATUSES = ["stopped", "starting", "running", "stopping"]
+BREAKER_STATES = ["closed", "open", "half_open"]
+
+# Commands a worker can hand to the leader
+COMMAND_NONE = 0
+COMMAND_START = 1
+COMMAND_STOP = 2
+COMMAND_SCALE = 3  # argument: number of instances
+COMMAND_RESTART = 4  # argument: 1 for a rolling restart
+
+# Slots per record (every slot is one float64)
+HEADER_SLOTS = 3  # magic, leader pid, leader heartbeat
+SERVICE_SLOTS = 10  # status, healthy, policy, command, seq, done seq, result, breaker state, opened_at, command arg
+INSTANCE_SLOTS = 8  # healthy, breaker state, opened_at, lease number, port, weight, ttl, expires_at
+WORKER_SLOTS = 2  # pid, heartbeat
+WORKER_SERVICE_SLOTS = 2  # round-robin cursor, proxied requests
+
+# Bytes per instance for the JSON host and metadata of a lease, stored after
+# the float64 slots
+LEASE_BLOB_SIZE = 512
+
+
+class SegmentLock:
+    """Exclusive lock shared by every process using a segment: flock() on a
+    lock file (msvcrt.locking on Windows). It is only held for a few slot
+    reads and writes, so waiting for it does not stall the event loop."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+
+    def __enter__(self):
+        if fcntl:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+        else:
+            os.lseek(self.fd, 0, os.SEEK_SET)
+            msvcrt.locking(self.fd, msvcrt.LK_LOCK, 1)
+        return self
+
+    def __exit__(self, *exc_info):
+        if fcntl:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        else:
+            os.lseek(self.fd, 0, os.SEEK_SET)
+            msvcrt.locking(self.fd, msvcrt.LK_UNLCK, 1)
+
+    def close(self, unlink: bool = False):
+        os.close(self.fd)
+        if unlink:
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+
+class SharedState:
+    """Fixed-layout float64 array in a named shared memory segment.
+
+    ``layout`` maps every service name to its number of instance slots
+    (configured instances plus registry capacity), in the same order in
+    every worker (they all read it from config). ``log_shape`` is the
+    (lines, bytes per line) of every service's log buffer and
+    ``generation_stripes`` the number of response cache generations.
+    """
+
+    def __init__(self, name: str, layout: Dict[str, int], policies: List[str], max_workers: int,
+                 log_shape: Tuple[int, int] = (0, 0), generation_stripes: int = 0, create: bool = False):
+        self.layout = layout
+        self.policies = policies
+        self.max_workers = max_workers
+        self.service_index = {service: i for i, service in enumerate(layout)}
+        self.instance_base: Dict[str, int] = {}
+        offset = HEADER_SLOTS + SERVICE_SLOTS * len(layout)
+        for service, count in layout.items():
+            self.instance_base[service] = offset
+            offset += INSTANCE_SLOTS * count
+        self.worker_base = offset
+        self.worker_stride = WORKER_SLOTS + WORKER_SERVICE_SLOTS * len(layout)
+        self.generation_base = offset + self.worker_stride * max_workers
+        self.generation_stripes = generation_stripes
+        slots_size = (self.generation_base + generation_stripes * max_workers) * 8
+        self.blob_index = {}
+        for service, count in layout.items():
+            for index in range(count):
+                self.blob_index[service, index] = len(self.blob_index)
+        blobs_end = slots_size + LEASE_BLOB_SIZE * len(self.blob_index)
+        self.log_shape = log_shape
+        log_size = LogBuffer.size(*log_shape) if log_shape[0] else 0
+        size = blobs_end + log_size * len(layout)
+
+        self.shm = shared_memory.SharedMemory(name=name, create=create, size=size if create else 0)
+        self.slots = self.shm.buf[:slots_size].cast("d")
+        self.blobs = self.shm.buf[slots_size:blobs_end]
+        self.logs = {
+            service: self.shm.buf[blobs_end + log_size * i:blobs_end + log_size * (i + 1)]
+            for i, service in enumerate(layout)
+        }
+        if create:
+            for i in range(len(self.slots)):
+                self.slots[i] = 0.0
+            self.slots[0] = MAGIC
+        elif self.slots[0] != MAGIC:
+            raise RuntimeError(f"Shared memory segment {name} is not a gateway state segment")
+        self.worker_slot: Optional[int] = None
+        self.lock = SegmentLock(os.path.join(tempfile.gettempdir(), f"{name}.lock"))
+
+    # Slot offsets
+    def _service(self, service: str) -> int:
+        return HEADER_SLOTS + SERVICE_SLOTS * self.service_index[service]
+
+    def _instance(self, service: str, index: int) -> int:
+        return self.instance_base[service] + INSTANCE_SLOTS * index
+
+    def _worker(self, slot: int) -> int:
+        return self.worker_base + self.worker_stride * slot
+
+    # SERVICE FIELDS
+    def service_status(self, service: str) -> str:
+        return STATUSES[int(self.slots[self._service(service)])]
+
+    def set_service_status(self, service: str, status: str):
+        self.slots[self._service(service)] = STATUSES.index(status)
+
+    def service_healthy(self, service: str) -> bool:
+        return bool(self.slots[self._service(service) + 1])
+
+    def set_service_healthy(self, service: str, healthy: bool):
+        self.slots[self._service(service) + 1] = 1.0 if healthy else 0.0
+
+    def policy(self, service: str) -> str:
+        return self.policies[int(self.slots[self._service(service) + 2])]
+
+    def set_policy(self, service: str, policy: str):
+        self.slots[self._service(service) + 2] = self.policies.index(policy)
+
+    # Ask the leader to run a command; returns its sequence number
+    def send_command(self, service: str, command: int, arg: int = 0) -> int:
+        base = self._service(service)
+        seq = int(self.slots[base + 4]) + 1
+        self.slots[base + 9] = arg
+        self.slots[base + 3] = command
+        self.slots[base + 4] = seq
+        return seq
+
+    # (command, seq) of the latest command for a service
+    def command(self, service: str) -> Tuple[int, int]:
+        base = self._service(service)
+        return int(self.slots[base + 3]), int(self.slots[base + 4])
+
+    def command_arg(self, service: str) -> int:
+        return int(self.slots[self._service(service) + 9])
+
+    # Called by the leader once a command has run
+    def finish_command(self, service: str, seq: int, ok: bool):
+        base = self._service(service)
+        self.slots[base + 6] = 1.0 if ok else 0.0
+        self.slots[base + 5] = seq
+
+    # None while the command is pending, otherwise whether it succeeded
+    def command_result(self, service: str, seq: int) -> Optional[bool]:
+        base = self._service(service)
+        if int(self.slots[base + 5]) < seq:
+            return None
+        return bool(self.slots[base + 6])
+
+    # BREAKERS: key is a service name or (service, instance index)
+    def _breaker(self, key) -> int:
+        if isinstance(key, tuple):
+            return self._instance(*key) + 1
+        return self._service(key) + 7
+
+    # (state, opened_at) of a breaker; opened_at is on the time.monotonic()
+    # clock, which is system-wide
+    def breaker(self, key) -> Tuple[str, float]:
+        base = self._breaker(key)
+        return BREAKER_STATES[int(self.slots[base])], self.slots[base + 1]
+
+    def set_breaker(self, key, state: str, opened_at: float):
+        base = self._breaker(key)
+        self.slots[base + 1] = opened_at
+        self.slots[base] = BREAKER_STATES.index(state)
+
+    # INSTANCE FIELDS
+    def instance_healthy(self, service: str, index: int) -> bool:
+        return bool(self.slots[self._instance(service, index)])
+
+    def set_instance_healthy(self, service: str, index: int, healthy: bool):
+        self.slots[self._instance(service, index)] = 1.0 if healthy else 0.0
+
+    # LEASES: a slot is free while its lease number is 0
+    # Take a free instance slot for a new lease. Returns False if another
+    # worker holds it.
+    def claim_lease(self, service: str, index: int, number: int) -> bool:
+        base = self._instance(service, index)
+        with self.lock:
+            if self.slots[base + 3]:
+                return False
+            self.slots[base + 4] = 0.0  # port 0: not readable until written
+            self.slots[base + 3] = number
+        # A new instance starts healthy with a closed breaker
+        self.slots[base] = 1.0
+        self.slots[base + 1] = 0.0
+        self.slots[base + 2] = 0.0
+        return True
+
+    def write_lease(self, service: str, index: int, number: int, host: str, port: int, weight: int,
+                    metadata: Dict, ttl: Optional[float], expires_at: float):
+        blob = json.dumps({"host": host, "metadata": metadata}).encode()
+        if len(blob) > LEASE_BLOB_SIZE:
+            raise ValueError(f"Host and metadata must fit in {LEASE_BLOB_SIZE} bytes of JSON")
+        start = LEASE_BLOB_SIZE * self.blob_index[service, index]
+        self.blobs[start:start + LEASE_BLOB_SIZE] = blob.ljust(LEASE_BLOB_SIZE, b"\0")
+        base = self._instance(service, index)
+        self.slots[base + 5] = weight
+        self.slots[base + 6] = ttl or 0.0  # 0: managed lease without a TTL
+        self.slots[base + 7] = expires_at
+        self.slots[base + 3] = number
+        self.slots[base + 4] = port
+
+    # Extend a lease if the slot still holds it
+    def renew_lease(self, service: str, index: int, number: int, expires_at: float) -> bool:
+        base = self._instance(service, index)
+        if self.slots[base + 3] != number:
+            return False
+        self.slots[base + 7] = expires_at
+        return True
+
+    def clear_lease(self, service: str, index: int, number: int):
+        base = self._instance(service, index)
+        with self.lock:
+            if self.slots[base + 3] == number:
+                self.slots[base + 4] = 0.0
+                self.slots[base + 3] = 0.0
+
+    # The lease held in a slot, or None if the slot is free
+    def read_lease(self, service: str, index: int) -> Optional[Dict]:
+        base = self._instance(service, index)
+        number, port = int(self.slots[base + 3]), int(self.slots[base + 4])
+        if not number or not port:
+            return None
+        start = LEASE_BLOB_SIZE * self.blob_index[service, index]
+        try:
+            blob = json.loads(bytes(self.blobs[start:start + LEASE_BLOB_SIZE]).rstrip(b"\0"))
+        except ValueError:
+            return None  # being rewritten
+        return {
+            "number": number,
+            "host": blob["host"],
+            "port": port,
+            "weight": int(self.slots[base + 5]),
+            "metadata": blob["metadata"],
+            "ttl": self.slots[base + 6] or None,
+            "expires_at": self.slots[base + 7],
+        }
+
+    # WORKERS
+    # Claim a free (or abandoned) worker slot for this process
+    def register_worker(self, stale_after: float) -> int:
+        pid = os.getpid()
+        with self.lock:
+            now = time.time()
+            for slot in range(self.max_workers):
+                base = self._worker(slot)
+                if self.slots[base] == 0 or now - self.slots[base + 1] > stale_after:
+                    self.slots[base] = pid
+                    self.slots[base + 1] = now
+                    self.worker_slot = slot
+                    # Keep counting on top of a dead worker's counters so
+                    # totals never go backwards
+                    self._proxied_base = {service: self._field(service, 1) for service in self.layout}
+                    return slot
+        raise RuntimeError(f"No free worker slot (max {self.max_workers} workers)")
+
+    def heartbeat(self):
+        self.slots[self._worker(self.worker_slot) + 1] = time.time()
+
+    # Take over leadership when there is no leader or it stopped heartbeating.
+    # Returns True while this worker is the leader.
+    def elect_leader(self, stale_after: float) -> bool:
+        pid = os.getpid()
+        with self.lock:
+            now = time.time()
+            if self.slots[1] == pid:
+                self.slots[2] = now
+                return True
+            if self.slots[1] == 0 or now - self.slots[2] > stale_after:
+                self.slots[1] = pid
+                self.slots[2] = now
+                return True
+            return False
+
+    def leader_pid(self) -> int:
+        return int(self.slots[1])
+
+    # Index of one of this worker's per-service fields
+    def _own(self, service: str, field: int) -> int:
+        return self._worker(self.worker_slot) + WORKER_SLOTS + WORKER_SERVICE_SLOTS * self.service_index[service] + field
+
+    def _field(self, service: str, field: int) -> float:
+        return self.slots[self._own(service, field)]
+
+    # Next value of a round-robin cursor shared by all workers: every worker
+    # advances its own slot and the cursor is the sum over all workers
+    def next_cursor(self, service: str) -> int:
+        self.slots[self._own(service, 0)] += 1
+        return self._sum(service, 0)
+
+    # Publish this worker's proxied request count for a service
+    def set_proxied(self, service: str, count: float):
+        self.slots[self._own(service, 1)] = self._proxied_base[service] + count
+
+    # Proxied requests over all workers
+    def proxied_total(self) -> int:
+        return sum(self._sum(service, 1) for service in self.layout)
+
+    def _sum(self, service: str, field: int) -> int:
+        offset = WORKER_SLOTS + WORKER_SERVICE_SLOTS * self.service_index[service] + field
+        return int(sum(self.slots[self._worker(slot) + offset] for slot in range(self.max_workers)))
+
+    def workers(self) -> List[Dict]:
+        now = time.time()
+        result = []
+        for slot in range(self.max_workers):
+            base = self._worker(slot)
+            if self.slots[base]:
+                result.append({
+                    "slot": slot,
+                    "pid": int(self.slots[base]),
+                    "last_seen_s": round(now - self.slots[base + 1], 2),
+                    "leader": int(self.slots[base]) == self.leader_pid(),
+                })
+        return result
+
+    # CACHE GENERATIONS: every worker bumps its own counter of a stripe and
+    # the generation is the sum over all workers, like the round-robin
+    # cursors, so no bump is lost to a concurrent one
+    def generation(self, stripe: int) -> int:
+        return int(sum(self.slots[self.generation_base + self.generation_stripes * slot + stripe]
+                       for slot in range(self.max_workers)))
+
+    def bump_generation(self, stripe: int):
+        self.slots[self.generation_base + self.generation_stripes * self.worker_slot + stripe] += 1
+
+    # LOGS: the service's log buffer, written by the leader
+    def log_buffer(self, service: str) -> LogBuffer:
+        return LogBuffer(*self.log_shape, buffer=self.logs[service])
+
+    def close(self, unlink: bool = False):
+        self.lock.close(unlink)
+        self.slots.release()
+        self.blobs.release()
+        for view in self.logs.values():
+            view.release()
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+class StateSync:
+    """Keeps one worker's service table in step with the shared segment.
+
+    Every field is merged three ways against the value seen at the previous
+    sync: a local change is published, otherwise a change made by another
+    worker is adopted. The call sites that change health, status, policies
+    and breakers stay unaware of the other workers.
+    """
+
+    def __init__(self, state: SharedState, services: Dict):
+        self.state = state
+        self.services = services
+        self._last: Dict = {}
+
+    def _fields(self):
+        state = self.state
+        for name, info in self.services.items():
+            balancer = info["balancer"]
+            yield (("status", name), info["status"], state.service_status(name),
+                   lambda v, n=name: state.set_service_status(n, v),
+                   lambda v, i=info: i.__setitem__("status", v))
+            yield (("healthy", name), info["healthy"], state.service_healthy(name),
+                   lambda v, n=name: state.set_service_healthy(n, v),
+                   lambda v, i=info: i.__setitem__("healthy", v))
+            yield (("policy", name), balancer.policy.name, state.policy(name),
+                   lambda v, n=name: state.set_policy(n, v),
+                   balancer.set_policy)
+            yield self._breaker_field(name, info["breaker"])
+            for instance in balancer.instances:
+                index = instance.slot
+                yield (("instance", name, index), instance.healthy, state.instance_healthy(name, index),
+                       lambda v, n=name, x=index: state.set_instance_healthy(n, x, v),
+                       lambda v, i=instance: setattr(i, "healthy", v))
+                yield self._breaker_field((name, index), instance.breaker)
+
+    def _breaker_field(self, key, breaker):
+        remote_state, remote_opened_at = self.state.breaker(key)
+        return (("breaker", key), breaker.state, remote_state,
+                lambda v: self.state.set_breaker(key, v, breaker.opened_at),
+                lambda v: breaker.adopt(v, remote_opened_at))
+
+    # Start over for an instance slot that now holds another instance: its
+    # first sync adopts the shared values
+    def forget(self, name: str, index: int):
+        self._last.pop(("instance", name, index), None)
+        self._last.pop(("breaker", (name, index)), None)
+
+    # Publish the whole local table (done once by the process creating the segment)
+    def publish(self):
+        for key, local, _, push, _ in self._fields():
+            push(local)
+            self._last[key] = local
+
+    def sync(self):
+        for key, local, remote, push, pull in self._fields():
+            last = self._last.get(key)
+            if key not in self._last:
+                # First sync: the shared segment is authoritative
+                if local != remote:
+                    pull(remote)
+                self._last[key] = remote
+            elif local != last:
+                push(local)
+                self._last[key] = local
+            elif remote != last:
+                pull(remote)
+                self._last[key] = remote
@@ -0,0 +1,135 @@
+# STATUS STREAM: ONE SNAPSHOT, THEN FIELD-LEVEL DELTAS
+# Dashboards subscribe to GET /management/status/stream (server-sent events)
+# instead of polling /management/status. A single producer builds the status
+# view once per interval, whatever the number of subscribers, and diffs it
+# against the previous one. Every subscriber gets the full view once
+# ("snapshot" event), then "delta" events holding only the fields that
+# changed, as a list of operations applied in order:
+#   [path, value]   set the field at path (a list of keys) to value
+#   [path]          delete the field at path
+# A subscriber receives at most one delta per min_interval: changes made in
+# between are merged, keeping the latest value of each field. While nothing
+# changes, only a keep-alive comment is sent now and then.
+import asyncio
+import json
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+_DELETE = object()
+
+
+# Operations turning old into new (nested dicts are compared field by field)
+def diff(old: Dict, new: Dict, path: Tuple = ()) -> List[Tuple[Tuple, object]]:
+    ops = []
+    for key, value in new.items():
+        if key not in old:
+            ops.append((path + (key,), value))
+        elif isinstance(value, dict) and isinstance(old[key], dict):
+            ops.extend(diff(old[key], value, path + (key,)))
+        elif value != old[key]:
+            ops.append((path + (key,), value))
+    for key in old:
+        if key not in new:
+            ops.append((path + (key,), _DELETE))
+    return ops
+
+
+class StatusSubscriber:
+    """Changes not yet sent to one client, latest value per field."""
+
+    def __init__(self):
+        # path -> value or _DELETE, in the order of the last change of each path
+        self.pending: Dict[Tuple, object] = {}
+        self.changed = asyncio.Event()
+
+    def add(self, ops: List[Tuple[Tuple, object]]):
+        for path, value in ops:
+            # Moved to the end, so a field set after its parent was replaced
+            # is applied after the parent
+            self.pending.pop(path, None)
+            self.pending[path] = value
+        if ops:
+            self.changed.set()
+
+    # The pending changes as a delta event payload, emptying them
+    def take(self) -> List[List]:
+        ops = [[list(path)] if value is _DELETE else [list(path), value] for path, value in self.pending.items()]
+        self.pending.clear()
+        self.changed.clear()
+        return ops
+
+
+class StatusStream:
+    """Status snapshots from ``build()`` pushed to every subscriber as deltas."""
+
+    def __init__(self, build: Callable[[], Dict], interval: float = 1.0, min_interval: float = 1.0,
+                 keepalive: float = 15.0, retry_ms: int = 3000):
+        self.build = build
+        self.interval = interval
+        self.min_interval = min_interval
+        self.keepalive = keepalive
+        self.retry_ms = retry_ms
+        self.subscribers: Set[StatusSubscriber] = set()
+        self.snapshot: Optional[Dict] = None
+        self.closed = False
+        self.deltas = 0
+        self._producer: Optional[asyncio.Task] = None
+
+    # Build the view and hand the changes to every subscriber, while there are any
+    async def _produce(self):
+        try:
+            while self.subscribers and not self.closed:
+                await asyncio.sleep(self.interval)
+                current = self.build()
+                ops = diff(self.snapshot, current)
+                self.snapshot = current
+                if ops:
+                    self.deltas += 1
+                    for subscriber in self.subscribers:
+                        subscriber.add(ops)
+        finally:
+            self._producer = None
+
+    def _subscribe(self) -> StatusSubscriber:
+        subscriber = StatusSubscriber()
+        # The snapshot sent to a new subscriber must be the one later deltas apply to
+        if self._producer is None:
+            self.snapshot = self.build()
+        self.subscribers.add(subscriber)
+        if self._producer is None:
+            self._producer = asyncio.create_task(self._produce())
+        return subscriber
+
+    # Server-sent events for one client, until it goes away or the stream is closed
+    async def events(self):
+        subscriber = self._subscribe()
+        try:
+            yield f"retry: {self.retry_ms}\nevent: snapshot\ndata: {json.dumps(self.snapshot)}\n\n"
+            loop = asyncio.get_running_loop()
+            last_sent = loop.time()
+            while not self.closed:
+                try:
+                    await asyncio.wait_for(subscriber.changed.wait(), self.keepalive)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if self.closed:
+                    break
+                # Rate limit: changes arriving meanwhile go into the same delta
+                wait = last_sent + self.min_interval - loop.time()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                ops = subscriber.take()
+                if ops:
+                    last_sent = loop.time()
+                    yield f"event: delta\ndata: {json.dumps(ops)}\n\n"
+        finally:
+            self.subscribers.discard(subscriber)
+
+    # End every stream (gateway shutdown); clients reconnect after retry_ms
+    def close(self):
+        self.closed = True
+        for subscriber in self.subscribers:
+            subscriber.changed.set()
+
+    def stats(self) -> Dict:
+        return {"subscribers": len(self.subscribers), "deltas": self.deltas}
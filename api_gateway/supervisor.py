@@ -0,0 +1,253 @@
+# PROCESS SUPERVISOR
+# Service processes are spawned as asyncio subprocesses, so starting and
+# stopping them never blocks the event loop. A process is ready once its
+# readiness probe (the service's /health) succeeds, polled with exponential
+# backoff until a deadline. A process that exits without being asked to is
+# restarted with exponential backoff. Its stdout and stderr are read as they
+# arrive and handed over line by line, so a chatty process never blocks on a
+# full pipe. Every process runs in a session of its own, so a Ctrl+C or a
+# SIGTERM sent to the gateway's process group does not reach it: the gateway
+# drains and stops its processes itself.
+import asyncio
+import socket
+import subprocess
+import threading
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+
+class SupervisedProcess:
+    """One service process: spawn, readiness, stop and auto-restart.
+
+    ``ready_probe()`` returns True once the process serves requests;
+    ``on_event(text)`` receives crash and restart notices and
+    ``on_output(stream, line)`` every output line ("stdout" or "stderr").
+    Without ``on_output`` the output is discarded. With a running ``zygote``
+    (see zygote.py) the process is forked from it instead of started cold.
+    """
+
+    def __init__(self, name: str, command: List[str], env: Dict[str, str],
+                 ready_probe: Callable[[], Awaitable[bool]], ready_timeout: float = 15.0,
+                 poll_interval: float = 0.05, max_poll_interval: float = 1.0, restart: bool = True,
+                 restart_backoff: float = 1.0, max_restart_backoff: float = 30.0, stable_after: float = 60.0,
+                 on_event: Optional[Callable[[str], None]] = None,
+                 on_output: Optional[Callable[[str, str], None]] = None, zygote=None):
+        self.name = name
+        self.command = command
+        self.env = env
+        self.ready_probe = ready_probe
+        self.ready_timeout = ready_timeout
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.restart = restart
+        self.restart_backoff = restart_backoff
+        self.max_restart_backoff = max_restart_backoff
+        self.stable_after = stable_after  # seconds up before the restart backoff resets
+        self.on_event = on_event or (lambda text: None)
+        self.on_output = on_output
+        self.zygote = zygote
+
+        self.process = None
+        self.state = "stopped"  # starting, running, restarting, stopping, stopped, failed
+        self.ready = False
+        self.restarts = 0
+        self.start_latency: Optional[float] = None  # seconds from spawn to ready, last start
+        self.spawned_at = 0.0
+        self.last_exit_code: Optional[int] = None
+        self._backoff = restart_backoff
+        self._stopping = False
+        self._watcher: Optional[asyncio.Task] = None
+        self._restarter: Optional[asyncio.Task] = None
+        self._drains: List[asyncio.Task] = []
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self.process.pid if self.alive else None
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.returncode is None
+
+    # Spawn the process and wait until it is ready. Returns False if it exits
+    # or is not ready by the deadline (it keeps running and being supervised).
+    async def start(self) -> bool:
+        self._stopping = False
+        self._backoff = self.restart_backoff
+        return await self._spawn()
+
+    async def stop(self, timeout: float = 5.0):
+        self._stopping = True
+        self.state = "stopping"
+        for task in (self._restarter, self._watcher):
+            if task and task is not asyncio.current_task():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        if self.alive:
+            try:
+                self.process.terminate()
+                await asyncio.wait_for(self.process.wait(), timeout)
+            except ProcessLookupError:
+                pass
+            except asyncio.TimeoutError:
+                self.process.kill()
+                await self.process.wait()
+        self.ready = False
+        self.state = "stopped"
+
+    # No more restarts (the gateway is shutting down); a pending one is cancelled
+    def stop_restarting(self):
+        self.restart = False
+        if self._restarter and not self._restarter.done():
+            self._restarter.cancel()
+
+    async def _spawn(self) -> bool:
+        self.state = "starting"
+        self.ready = False
+        self.spawned_at = time.monotonic()
+        self.process = process = await self._create()
+        self._watcher = asyncio.create_task(self._watch(process))
+        if self.on_output:
+            self._drains = [asyncio.create_task(self._drain(process.stdout, "stdout")),
+                            asyncio.create_task(self._drain(process.stderr, "stderr"))]
+
+        deadline = self.spawned_at + self.ready_timeout
+        delay = self.poll_interval
+        while not self._stopping and process.returncode is None:
+            try:
+                ok = await self.ready_probe()
+            except Exception:
+                ok = False
+            if ok:
+                self.ready = True
+                self.start_latency = time.monotonic() - self.spawned_at
+                self.state = "running"
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.state = "running"  # up but not answering; health checks take over
+                return False
+            await asyncio.sleep(min(delay, remaining))
+            delay = min(delay * 2, self.max_poll_interval)
+        return False
+
+    async def _create(self):
+        capture = self.on_output is not None
+        if self.zygote and await self.zygote.start():
+            try:
+                return await self.zygote.spawn(self.env, capture)
+            except ConnectionError as e:
+                self.on_event(f"⚠️ {self.name}: {e}, starting cold")
+        return await _create_process(self.command, self.env, capture)
+
+    # Hand over output lines until the stream closes
+    async def _drain(self, stream: asyncio.StreamReader, name: str):
+        while True:
+            try:
+                line = await stream.readline()
+            except ValueError:
+                continue  # line longer than the stream buffer; it was dropped
+            if not line:
+                return
+            self.on_output(name, line.decode(errors="replace").rstrip("\r\n"))
+
+    # Wait for the process to exit and restart it unless it was stopped
+    async def _watch(self, process):
+        code = await process.wait()
+        self.last_exit_code = code
+        if self._stopping or process is not self.process:
+            return
+        self.ready = False
+        if not self.restart:
+            self.state = "failed"
+            self.on_event(f"💥 {self.name} exited with code {code}")
+            return
+        if time.monotonic() - self.spawned_at > self.stable_after:
+            self._backoff = self.restart_backoff
+        self.state = "restarting"
+        self.on_event(f"💥 {self.name} exited with code {code}, restarting in {self._backoff:.0f}s")
+        self._restarter = asyncio.create_task(self._restart(self._backoff))
+        self._backoff = min(self._backoff * 2, self.max_restart_backoff)
+
+    async def _restart(self, delay: float):
+        await asyncio.sleep(delay)
+        self.restarts += 1
+        if await self._spawn():
+            self.on_event(f"🔄 {self.name} restarted (ready in {self.start_latency:.2f}s)")
+
+    def stats(self) -> Dict:
+        return {
+            "name": self.name,
+            "state": self.state,
+            "pid": self.pid,
+            "ready": self.ready,
+            "restarts": self.restarts,
+            "start_latency_s": round(self.start_latency, 3) if self.start_latency is not None else None,
+            "uptime_s": round(time.monotonic() - self.spawned_at, 1) if self.alive else None,
+            "last_exit_code": self.last_exit_code,
+        }
+
+
+# A port that is free on this host right now (picked by the OS)
+def free_port(host: str = "127.0.0.1") -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+async def _create_process(command: List[str], env: Dict[str, str], capture: bool):
+    output = subprocess.PIPE if capture else subprocess.DEVNULL
+    try:
+        return await asyncio.create_subprocess_exec(*command, stdout=output, stderr=output, env=env,
+                                                    start_new_session=True)
+    except NotImplementedError:
+        # Event loops without subprocess support (uvicorn runs worker
+        # processes on the selector loop on Windows)
+        return _ThreadedProcess(subprocess.Popen(command, stdout=output, stderr=output, env=env,
+                                                 start_new_session=True))
+
+
+class _ThreadedProcess:
+    """asyncio.subprocess.Process look-alike for a Popen waited on by a thread.
+
+    Output pipes are read by threads and fed into asyncio StreamReaders.
+    """
+
+    def __init__(self, popen: subprocess.Popen):
+        self.popen = popen
+        self.pid = popen.pid
+        loop = asyncio.get_running_loop()
+        self._exited = loop.create_future()
+        threading.Thread(target=self._wait, args=(loop,), daemon=True).start()
+        self.stdout = self._reader(loop, popen.stdout)
+        self.stderr = self._reader(loop, popen.stderr)
+
+    @staticmethod
+    def _reader(loop, pipe) -> Optional[asyncio.StreamReader]:
+        if pipe is None:
+            return None
+        reader = asyncio.StreamReader(loop=loop)
+
+        def pump():
+            for chunk in iter(lambda: pipe.read1(65536), b""):
+                loop.call_soon_threadsafe(reader.feed_data, chunk)
+            loop.call_soon_threadsafe(reader.feed_eof)
+
+        threading.Thread(target=pump, daemon=True).start()
+        return reader
+
+    def _wait(self, loop):
+        code = self.popen.wait()
+        loop.call_soon_threadsafe(lambda: self._exited.done() or self._exited.set_result(code))
+
+    @property
+    def returncode(self) -> Optional[int]:
+        return self.popen.returncode
+
+    async def wait(self) -> int:
+        return await asyncio.shield(self._exited)
+
+    def terminate(self):
+        self.popen.terminate()
+
+    def kill(self):
+        self.popen.kill()
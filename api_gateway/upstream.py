@@ -0,0 +1,358 @@
+# ASYNC UPSTREAM HTTP CLIENT FOR THE API GATEWAY
+# Keeps a pool of keep-alive HTTP/1.1 connections per upstream service so proxy
+# handlers run on the event loop instead of the threadpool and skip the TCP
+# handshake on every request. Built on h11, which already ships with uvicorn.
+import asyncio
+import json
+import time
+from collections import deque
+from typing import AsyncIterable, Dict, List, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+import h11
+
+READ_CHUNK_SIZE = 64 * 1024
+
+# A request body is either buffered bytes or an async stream of chunks
+Body = Union[bytes, AsyncIterable[bytes]]
+
+
+class UpstreamError(Exception):
+    """Raised when an upstream request fails at the transport level."""
+
+
+class UpstreamTimeout(UpstreamError):
+    """Raised when connecting to or reading from an upstream times out."""
+
+
+class UpstreamResponse:
+    """A fully buffered upstream response."""
+
+    def __init__(self, status_code: int, headers: List[Tuple[str, str]], content: bytes = b""):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def text(self) -> str:
+        return self.content.decode("utf-8", errors="replace")
+
+    def header(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        name = name.lower()
+        for key, value in self.headers:
+            if key == name:
+                return value
+        return default
+
+    def json(self):
+        return json.loads(self.content)
+
+
+# A single keep-alive connection to an upstream
+class _Connection:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.h11 = h11.Connection(our_role=h11.CLIENT)
+        self.idle_since = time.monotonic()
+        self.reused = False
+
+    # Send the request line and headers, then the body as bytes or chunk by chunk
+    async def send_request(self, method: str, target: str, headers: List[Tuple[str, str]], body: Optional[Body]):
+        data = self.h11.send(h11.Request(method=method, target=target, headers=headers))
+        if isinstance(body, (bytes, bytearray)):
+            if body:
+                data += self.h11.send(h11.Data(data=body))
+        elif body is not None:
+            self.writer.write(data)
+            async for chunk in body:
+                if chunk:
+                    self.writer.write(self.h11.send(h11.Data(data=chunk)))
+                    await self.writer.drain()
+            data = b""
+        data += self.h11.send(h11.EndOfMessage())
+        self.writer.write(data)
+        await self.writer.drain()
+
+    # Read from the socket until h11 produces the next event
+    async def next_event(self, read_timeout: float):
+        while True:
+            event = self.h11.next_event()
+            if event is not h11.NEED_DATA:
+                return event
+            try:
+                data = await asyncio.wait_for(self.reader.read(READ_CHUNK_SIZE), read_timeout)
+            except asyncio.TimeoutError:
+                raise UpstreamTimeout(f"read timed out after {read_timeout}s")
+            self.h11.receive_data(data)
+
+    # Wait for the response status line and headers
+    async def receive_response(self, read_timeout: float) -> h11.Response:
+        event = await self.next_event(read_timeout)
+        while isinstance(event, h11.InformationalResponse):
+            event = await self.next_event(read_timeout)
+        if not isinstance(event, h11.Response):
+            raise UpstreamError(f"unexpected upstream event: {event!r}")
+        return event
+
+    # Yield body chunks until the end of the response
+    async def iter_body(self, read_timeout: float):
+        while True:
+            event = await self.next_event(read_timeout)
+            if isinstance(event, h11.Data):
+                yield bytes(event.data)
+            elif isinstance(event, h11.EndOfMessage):
+                return
+            else:
+                raise UpstreamError(f"unexpected upstream event: {event!r}")
+
+    # A connection can be reused once both sides finished a clean cycle
+    def is_reusable(self) -> bool:
+        return self.h11.our_state is h11.DONE and self.h11.their_state is h11.DONE
+
+    def reset_for_reuse(self):
+        self.h11.start_next_cycle()
+        self.idle_since = time.monotonic()
+        self.reused = True
+
+    def is_stale(self, keepalive_expiry: float) -> bool:
+        return self.reader.at_eof() or time.monotonic() - self.idle_since > keepalive_expiry
+
+    def close(self):
+        try:
+            self.writer.close()
+        except Exception:
+            pass
+
+
+class UpstreamStream:
+    """An upstream response whose body is read chunk by chunk.
+
+    The connection goes back to the pool once the body has been fully read,
+    or is closed if the stream is abandoned early via ``aclose()``.
+    """
+
+    def __init__(self, pool: "UpstreamPool", conn: _Connection, status_code: int, headers: List[Tuple[str, str]]):
+        self.status_code = status_code
+        self.headers = headers
+        self._pool = pool
+        self._conn = conn
+        self._released = False
+
+    # Yield body chunks as they arrive from the upstream
+    async def aiter_bytes(self):
+        complete = False
+        try:
+            async for chunk in self._conn.iter_body(self._pool.read_timeout):
+                yield chunk
+            complete = True
+        except (OSError, h11.ProtocolError) as e:
+            raise UpstreamError(f"reading body from {self._pool.host}:{self._pool.port} failed: {e}")
+        finally:
+            self._release(complete)
+
+    async def aread(self) -> bytes:
+        return b"".join([chunk async for chunk in self.aiter_bytes()])
+
+    def _release(self, reuse: bool):
+        if not self._released:
+            self._released = True
+            self._pool.release(self._conn, reuse)
+
+    async def aclose(self):
+        self._release(False)
+
+
+class UpstreamPool:
+    """Keep-alive connection pool for one upstream host:port.
+
+    The pool size also caps the number of requests in flight to the upstream;
+    callers beyond that wait up to ``pool_timeout`` for a free slot.
+    """
+
+    def __init__(self, host: str, port: int, max_connections: int = 20, connect_timeout: float = 2.0,
+                 read_timeout: float = 5.0, pool_timeout: float = 5.0, keepalive_expiry: float = 4.0):
+        self.host = host
+        self.port = port
+        self.max_connections = max_connections
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.pool_timeout = pool_timeout
+        self.keepalive_expiry = keepalive_expiry
+        self._slots = asyncio.Semaphore(max_connections)
+        self._idle: deque = deque()
+        self.in_flight = 0
+        self.connections_opened = 0
+
+    # Take a free slot and return an idle connection or open a new one
+    async def acquire(self) -> _Connection:
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.pool_timeout)
+        except asyncio.TimeoutError:
+            raise UpstreamError(f"no free connection to {self.host}:{self.port} after {self.pool_timeout}s")
+        self.in_flight += 1
+        try:
+            while self._idle:
+                conn = self._idle.pop()
+                if conn.is_stale(self.keepalive_expiry):
+                    conn.close()
+                    continue
+                return conn
+            return await self._open()
+        except BaseException:
+            self._release_slot()
+            raise
+
+    async def _open(self) -> _Connection:
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port), self.connect_timeout
+            )
+        except asyncio.TimeoutError:
+            raise UpstreamTimeout(f"connect to {self.host}:{self.port} timed out after {self.connect_timeout}s")
+        except OSError as e:
+            raise UpstreamError(f"connect to {self.host}:{self.port} failed: {e}")
+        self.connections_opened += 1
+        return _Connection(reader, writer)
+
+    # Return a connection to the pool (or close it) and free its slot
+    def release(self, conn: _Connection, reuse: bool = True):
+        if reuse and conn.is_reusable():
+            conn.reset_for_reuse()
+            self._idle.append(conn)
+        else:
+            conn.close()
+        self._release_slot()
+
+    def _release_slot(self):
+        self.in_flight -= 1
+        self._slots.release()
+
+    # Send the request on a connection and wait for the response head
+    async def _send(self, conn: _Connection, method: str, target: str, headers: List[Tuple[str, str]],
+                    body: Optional[Body]) -> h11.Response:
+        try:
+            await conn.send_request(method, target, headers, body)
+            return await conn.receive_response(self.read_timeout)
+        except (OSError, h11.ProtocolError) as e:
+            raise UpstreamError(f"{method} {target} to {self.host}:{self.port} failed: {e}")
+
+    # Send one request and return as soon as the response head arrives; the
+    # caller reads the body through the returned UpstreamStream
+    async def stream(self, method: str, target: str, headers: Optional[List[Tuple[str, str]]] = None,
+                     body: Optional[Body] = None) -> "UpstreamStream":
+        request_headers = [("host", f"{self.host}:{self.port}")]
+        if headers:
+            request_headers.extend(headers)
+        if isinstance(body, (bytes, bytearray)):
+            request_headers.append(("content-length", str(len(body))))
+        elif body is not None and not any(k == "content-length" for k, _ in request_headers):
+            request_headers.append(("transfer-encoding", "chunked"))
+
+        conn = await self.acquire()
+        try:
+            try:
+                response = await self._send(conn, method, target, request_headers, body)
+            except UpstreamTimeout:
+                raise
+            except UpstreamError:
+                # The upstream may have closed an idle keep-alive connection just
+                # as we picked it; that request never ran, so retry once fresh.
+                # A streamed body has already been consumed and cannot be replayed.
+                if not conn.reused or not (body is None or isinstance(body, (bytes, bytearray))):
+                    raise
+                conn.close()
+                conn = await self._open()
+                response = await self._send(conn, method, target, request_headers, body)
+        except BaseException:
+            self.release(conn, reuse=False)
+            raise
+
+        return UpstreamStream(
+            self,
+            conn,
+            response.status_code,
+            [(k.decode("latin-1").lower(), v.decode("latin-1")) for k, v in response.headers],
+        )
+
+    # Send one request and buffer the whole response
+    async def request(self, method: str, target: str, headers: Optional[List[Tuple[str, str]]] = None,
+                      body: Optional[bytes] = None) -> UpstreamResponse:
+        stream = await self.stream(method, target, headers, body)
+        content = await stream.aread()
+        return UpstreamResponse(stream.status_code, stream.headers, content)
+
+    def stats(self) -> Dict:
+        return {
+            "max_connections": self.max_connections,
+            "in_flight": self.in_flight,
+            "idle_connections": len(self._idle),
+            "connections_opened": self.connections_opened,
+        }
+
+    async def aclose(self):
+        while self._idle:
+            self._idle.pop().close()
+
+
+class UpstreamClient:
+    """Routes requests to one UpstreamPool per upstream base URL."""
+
+    def __init__(self, max_connections: int = 20, connect_timeout: float = 2.0, read_timeout: float = 5.0,
+                 pool_timeout: float = 5.0, keepalive_expiry: float = 4.0):
+        self.max_connections = max_connections
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.pool_timeout = pool_timeout
+        self.keepalive_expiry = keepalive_expiry
+        self.pools: Dict[str, UpstreamPool] = {}
+
+    # Get (or lazily create) the pool for a base URL such as http://localhost:8001
+    def pool(self, base_url: str) -> UpstreamPool:
+        pool = self.pools.get(base_url)
+        if pool is None:
+            parts = urlsplit(base_url)
+            pool = UpstreamPool(
+                parts.hostname,
+                parts.port or 80,
+                max_connections=self.max_connections,
+                connect_timeout=self.connect_timeout,
+                read_timeout=self.read_timeout,
+                pool_timeout=self.pool_timeout,
+                keepalive_expiry=self.keepalive_expiry,
+            )
+            self.pools[base_url] = pool
+        return pool
+
+    async def request(self, method: str, url: str, json_body=None, headers: Optional[List[Tuple[str, str]]] = None) -> UpstreamResponse:
+        parts = urlsplit(url)
+        target = parts.path or "/"
+        if parts.query:
+            target += f"?{parts.query}"
+        request_headers = list(headers or [])
+        body = None
+        if json_body is not None:
+            body = json.dumps(json_body).encode("utf-8")
+            request_headers.append(("content-type", "application/json"))
+        return await self.pool(f"{parts.scheme}://{parts.netloc}").request(method, target, request_headers, body)
+
+    # Stream a request to a service base URL; target is the path plus query string
+    async def stream(self, method: str, base_url: str, target: str, headers: Optional[List[Tuple[str, str]]] = None,
+                     body: Optional[Body] = None) -> UpstreamStream:
+        return await self.pool(base_url).stream(method, target, headers, body)
+
+    async def get(self, url: str, **kwargs) -> UpstreamResponse:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, json_body=None, **kwargs) -> UpstreamResponse:
+        return await self.request("POST", url, json_body=json_body, **kwargs)
+
+    async def put(self, url: str, json_body=None, **kwargs) -> UpstreamResponse:
+        return await self.request("PUT", url, json_body=json_body, **kwargs)
+
+    def stats(self) -> Dict:
+        return {base_url: pool.stats() for base_url, pool in self.pools.items()}
+
+    async def aclose(self):
+        for pool in self.pools.values():
+            await pool.aclose()
@@ -0,0 +1,220 @@
+# ZYGOTE CLIENT
+# Gateway side of shared/zygote.py: starts the zygote of a service, asks it to
+# fork new instances and tracks them. A forked instance is not a child of the
+# gateway, so it is represented by a ZygoteProcess that looks like an
+# asyncio.subprocess.Process to the supervisor: its exit code comes from the
+# zygote and it is signalled by pid. If the zygote dies, the instances it
+# forked are killed so the supervisor restarts them.
+import asyncio
+import itertools
+import json
+import os
+import signal
+import socket
+import subprocess
+from typing import Dict, List, Optional
+
+ZYGOTE_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "shared", "zygote.py")
+
+
+class ZygoteProcess:
+    """An instance forked by a zygote."""
+
+    def __init__(self, pid: int, stdout: Optional[asyncio.StreamReader], stderr: Optional[asyncio.StreamReader]):
+        self.pid = pid
+        self.stdout = stdout
+        self.stderr = stderr
+        self.returncode: Optional[int] = None
+        self._exited = asyncio.get_running_loop().create_future()
+
+    def _set_exit(self, code: int):
+        if self.returncode is None:
+            self.returncode = code
+            self._exited.set_result(code)
+
+    async def wait(self) -> int:
+        return await asyncio.shield(self._exited)
+
+    def send_signal(self, sig: int):
+        if self.returncode is None:
+            os.kill(self.pid, sig)
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+
+class Zygote:
+    """The zygote of one service, started from the service's command
+    (``[python, script]``) and kept running until ``stop()``."""
+
+    def __init__(self, name: str, command: List[str], start_timeout: float = 30.0):
+        self.name = name
+        self.command = [command[0], ZYGOTE_SCRIPT, "0", *command[1:]]
+        self.start_timeout = start_timeout
+        self.process = None
+        self.preload_time: Optional[float] = None
+        self.forks = 0
+        self._socket: Optional[socket.socket] = None
+        self._starting: Optional[asyncio.Task] = None
+        self._reader: Optional[asyncio.Task] = None
+        self._ids = itertools.count(1)
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._children: Dict[int, ZygoteProcess] = {}
+
+    # fork() and passing file descriptors over Unix sockets
+    @staticmethod
+    def supported() -> bool:
+        return hasattr(os, "fork") and hasattr(socket, "send_fds")
+
+    @property
+    def alive(self) -> bool:
+        return self._reader is not None and not self._reader.done()
+
+    # Start the zygote and wait until its imports are loaded. Returns False if
+    # it could not be started (callers fall back to cold starts).
+    async def start(self) -> bool:
+        if self.alive:
+            return True
+        if self._starting is None or self._starting.done():
+            self._starting = asyncio.create_task(self._start())
+        return await asyncio.shield(self._starting)
+
+    async def _start(self) -> bool:
+        loop = asyncio.get_running_loop()
+        ours, theirs = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        command = list(self.command)
+        command[2] = str(theirs.fileno())
+        try:
+            self.process = await asyncio.create_subprocess_exec(
+                *command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, pass_fds=(theirs.fileno(),),
+                start_new_session=True)
+        except OSError as e:
+            print(f"⚠️ Zygote for {self.name} not started: {e}")
+            ours.close()
+            return False
+        finally:
+            theirs.close()
+        ours.setblocking(False)
+        try:
+            hello = json.loads(await asyncio.wait_for(loop.sock_recv(ours, 65536), self.start_timeout) or b"{}")
+        except (asyncio.TimeoutError, ValueError, OSError):
+            hello = {}
+        if not hello.get("ready"):
+            print(f"⚠️ Zygote for {self.name} did not become ready")
+            ours.close()
+            if self.process.returncode is None:
+                self.process.kill()
+            await self.process.wait()
+            return False
+        self.preload_time = hello["preload_s"]
+        self._socket = ours
+        self._reader = asyncio.create_task(self._read())
+        print(f"🧬 Zygote for {self.name} ready (pid {self.process.pid}, {hello['modules']} modules "
+              f"preloaded in {self.preload_time:.2f}s)")
+        return True
+
+    async def stop(self):
+        if self._starting and not self._starting.done():
+            await asyncio.gather(self._starting, return_exceptions=True)
+        if self._reader:
+            # Closes the socket; the zygote exits when it sees that
+            self._reader.cancel()
+            await asyncio.gather(self._reader, return_exceptions=True)
+        if self.process and self.process.returncode is None:
+            try:
+                await asyncio.wait_for(self.process.wait(), 2)
+            except asyncio.TimeoutError:
+                self.process.kill()
+                await self.process.wait()
+
+    # Fork a new instance with this environment. Raises ConnectionError if the
+    # zygote is not running.
+    async def spawn(self, env: Dict[str, str], capture: bool) -> ZygoteProcess:
+        if not self.alive:
+            raise ConnectionError(f"zygote for {self.name} is not running")
+        loop = asyncio.get_running_loop()
+        pipes = [os.pipe(), os.pipe()] if capture else []
+        request_id = next(self._ids)
+        reply = self._pending[request_id] = loop.create_future()
+        try:
+            message = json.dumps({"id": request_id, "env": env}).encode()
+            socket.send_fds(self._socket, [message], [write for _, write in pipes])
+        except OSError as e:
+            self._pending.pop(request_id, None)
+            for read, _ in pipes:
+                os.close(read)
+            raise ConnectionError(f"zygote for {self.name}: {e}") from e
+        finally:
+            for _, write in pipes:
+                os.close(write)
+        try:
+            process = await asyncio.wait_for(reply, self.start_timeout)
+        except BaseException:
+            self._pending.pop(request_id, None)
+            for read, _ in pipes:
+                os.close(read)
+            raise
+        if pipes:
+            process.stdout = await self._stream(loop, pipes[0][0])
+            process.stderr = await self._stream(loop, pipes[1][0])
+        self.forks += 1
+        return process
+
+    @staticmethod
+    async def _stream(loop, fd: int) -> asyncio.StreamReader:
+        reader = asyncio.StreamReader()
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(fd, "rb", 0))
+        return reader
+
+    # Replies with the pid of a new instance, and exit codes of instances
+    async def _read(self):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                message = await loop.sock_recv(self._socket, 65536)
+                if not message:
+                    break
+                event = json.loads(message)
+                if "pid" in event:
+                    # Tracked right away, so an instance that exits at once is not missed
+                    process = self._children[event["pid"]] = ZygoteProcess(event["pid"], None, None)
+                    reply = self._pending.pop(event["id"], None)
+                    if reply and not reply.done():
+                        reply.set_result(process)
+                elif "exit" in event:
+                    process = self._children.pop(event["exit"], None)
+                    if process:
+                        process._set_exit(event["code"])
+        except OSError:
+            pass
+        finally:
+            self._lost()
+
+    # The zygote is gone: its instances can no longer be tracked
+    def _lost(self):
+        if self._socket:
+            self._socket.close()
+            self._socket = None
+        for reply in self._pending.values():
+            if not reply.done():
+                reply.set_exception(ConnectionError(f"zygote for {self.name} exited"))
+        self._pending.clear()
+        for process in self._children.values():
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+            process._set_exit(-signal.SIGKILL)
+        self._children.clear()
+
+    def stats(self) -> Dict:
+        return {
+            "pid": self.process.pid if self.alive else None,
+            "alive": self.alive,
+            "preload_s": self.preload_time,
+            "forks": self.forks,
+            "instances": len(self._children),
+        }
@@ -23,7 +23,8 @@ def test_services():
             response = requests.get("http://localhost:8000/products/1")
             if response.status_code == 200:
                 data = response.json()
-                print(f"   Request {i+1}: {data} (Instance: {data.get('load_balanced_instance', 'N/A')})")
+                instance = response.headers.get("X-Load-Balanced-Instance", data.get("load_balanced_instance", "N/A"))
+                print(f"   Request {i+1}: {data} (Instance: {instance})")
             else:
                 print(f"   Request {i+1}: Error {response.status_code}")
         except Exception as e:
@@ -2,6 +2,10 @@
 const API_BASE_URL = 'http://localhost:8000';
 const WS_URL = 'ws://localhost:8000/ws/chatops';
 
+// Status stream (server-sent events) and the status it keeps up to date
+let statusStream = null;
+let systemStatus = null;
+
 // WebSocket variables
 let websocket = null;
 let isConnected = false;
@@ -78,6 +82,13 @@ function connectWebSocket() {
             document.getElementById('chatops-input').disabled = true;
             document.getElementById('send-button').disabled = true;
             document.getElementById('chatops-input').placeholder = "Disconnected - Click Connect";
+
+            // Gateway restarting (1012): reconnect after the delay it suggests
+            const hint = /reconnect_after_ms=(\d+)/.exec(event.reason || '');
+            if (event.code === 1012 && hint) {
+                addChatMessage('system', `Gateway restarting, reconnecting in ${(hint[1] / 1000).toFixed(1)}s...`, 'system');
+                setTimeout(() => { if (!isConnected) connectWebSocket(); }, Number(hint[1]));
+            }
         };
         
         websocket.onerror = function(error) {
@@ -531,18 +542,7 @@ async function fetchSystemStatus() {
         const data = await response.json();
         
         console.log("System status data:", data);
-        
-        // Update service status with better detection
-        for (const [serviceName, serviceInfo] of Object.entries(data.services)) {
-            const isRunning = serviceInfo.status === 'running';
-            const isHealthy = serviceInfo.healthy;
-            
-            updateStatus(serviceName, isHealthy, serviceInfo.status);
-        }
-        
-        document.getElementById('total-requests').textContent = data.total_requests;
-        document.getElementById('lb-state').textContent = data.load_balancer_state;
-        document.getElementById('active-connections').textContent = Object.keys(data.services).length;
+        renderSystemStatus(data);
         
         return data;
     } catch (error) {
@@ -559,6 +559,63 @@ async function fetchSystemStatus() {
     }
 }
 
+function renderSystemStatus(data) {
+    // Update service status with better detection
+    for (const [serviceName, serviceInfo] of Object.entries(data.services)) {
+        updateStatus(serviceName, serviceInfo.healthy, serviceInfo.status);
+    }
+    
+    document.getElementById('total-requests').textContent = data.total_requests;
+    document.getElementById('lb-state').textContent = data.load_balancer_state;
+    document.getElementById('active-connections').textContent = Object.keys(data.services).length;
+}
+
+// Apply a status delta: [path, value] sets a field, [path] deletes it
+function applyStatusDelta(status, ops) {
+    for (const [path, ...value] of ops) {
+        let target = status;
+        for (const key of path.slice(0, -1)) {
+            if (typeof target[key] !== 'object' || target[key] === null) {
+                target[key] = {};
+            }
+            target = target[key];
+        }
+        const last = path[path.length - 1];
+        if (value.length) {
+            target[last] = value[0];
+        } else {
+            delete target[last];
+        }
+    }
+}
+
+// Subscribe to status changes pushed by the gateway instead of polling:
+// a snapshot first, then only the fields that changed. The browser
+// reconnects by itself and gets a fresh snapshot
+function connectStatusStream() {
+    statusStream = new EventSource(`${API_BASE_URL}/management/status/stream`);
+    
+    statusStream.addEventListener('snapshot', function(event) {
+        systemStatus = JSON.parse(event.data);
+        renderSystemStatus(systemStatus);
+    });
+    
+    statusStream.addEventListener('delta', function(event) {
+        if (!systemStatus) {
+            return;
+        }
+        applyStatusDelta(systemStatus, JSON.parse(event.data));
+        renderSystemStatus(systemStatus);
+    });
+    
+    statusStream.onerror = function() {
+        if (systemStatus) {
+            addLog('Status stream interrupted, reconnecting...');
+        }
+        systemStatus = null;
+    };
+}
+
 function updateStatus(service, isHealthy, status) {
     const statusElement = statusElements[service];
     const card = serviceCards[service];
@@ -652,8 +709,10 @@ async function testLoadBalancing() {
                 throw new Error(`HTTP error! status: ${response.status}`);
             }
             const data = await response.json();
-            results.push(`Request ${i + 1}: Instance ${data.load_balanced_instance}`);
-            addLog(`Load balancing request ${i + 1} routed to instance ${data.load_balanced_instance}`);
+            // The gateway reports the serving instance in a response header
+            const instance = response.headers.get('X-Load-Balanced-Instance') ?? data.load_balanced_instance;
+            results.push(`Request ${i + 1}: Instance ${instance}`);
+            addLog(`Load balancing request ${i + 1} routed to instance ${instance}`);
         } catch (error) {
             results.push(`Request ${i + 1}: ERROR - ${error.message}`);
             addLog(`Load balancing request ${i + 1} failed: ${error.message}`);
@@ -756,8 +815,13 @@ async function initializeDashboard() {
     // Initial status check
     await fetchSystemStatus();
     
-    // Update status every 5 seconds
-    setInterval(fetchSystemStatus, 5000);
+    // Status changes are pushed by the gateway; poll every 5 seconds only
+    // in browsers without server-sent events
+    if (window.EventSource) {
+        connectStatusStream();
+    } else {
+        setInterval(fetchSystemStatus, 5000);
+    }
     
     // Auto-connect WebSocket after a delay
     setTimeout(() => {
@@ -12,8 +12,21 @@ project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if project_root not in sys.path:
     sys.path.append(project_root)
 
+from shared.heartbeat import send_heartbeats
+from shared.registration import register_with_gateway
+from shared.metrics import instrument
+
 app = FastAPI(title="Order Service")
 
+# Request count, error and latency metrics served on GET /metrics
+metrics_registry = instrument(app)
+
+# Heartbeats to the gateway (only when started by the gateway), or
+# registration with the gateway's registry (only when GATEWAY_REGISTRY_URL is set)
+service_port = int(os.environ.get("SERVICE_PORT", 8003))
+send_heartbeats(app, "order", service_port)
+register_with_gateway(app, "order", service_port)
+
 # In-memory database
 orders_db = {}
 order_id_counter = 1
@@ -61,6 +74,21 @@ orders_db["3"] = {
 
 order_id_counter = 4
 
+# Orders per status, kept up to date on every status change so /health and
+# /stats don't have to walk every order
+status_counts = {}
+for order in orders_db.values():
+    status_counts[order["status"]] = status_counts.get(order["status"], 0) + 1
+
+# Change an order's status and the status counts
+def set_order_status(order_id: str, status: str):
+    old_status = orders_db[order_id]["status"]
+    status_counts[old_status] -= 1
+    if not status_counts[old_status]:
+        del status_counts[old_status]
+    status_counts[status] = status_counts.get(status, 0) + 1
+    orders_db[order_id]["status"] = status
+
 class OrderItem(BaseModel):
     product_id: str
     quantity: int
@@ -96,6 +124,7 @@ def create_order(order: OrderCreate):
         "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
         "updated_at": time.strftime("%Y-%m-%d %H:%M:%S")
     }
+    status_counts["pending"] = status_counts.get("pending", 0) + 1
     order_id_counter += 1
     print(f"✅ Created order: {order_id} for user {order.user_id}, total: ${total_amount}")
     return orders_db[order_id]
@@ -116,7 +145,7 @@ def update_order(order_id: str, order_update: OrderUpdate):
     if order_update.status:
         if order_update.status not in VALID_STATUSES:
             raise HTTPException(status_code=400, detail=f"Invalid status. Must be one of: {VALID_STATUSES}")
-        orders_db[order_id]["status"] = order_update.status
+        set_order_status(order_id, order_update.status)
     
     if order_update.shipping_address:
         orders_db[order_id]["shipping_address"] = order_update.shipping_address
@@ -130,7 +159,7 @@ def cancel_order(order_id: str):
     if order_id not in orders_db:
         raise HTTPException(status_code=404, detail="Order not found")
     
-    orders_db[order_id]["status"] = "cancelled"
+    set_order_status(order_id, "cancelled")
     orders_db[order_id]["updated_at"] = time.strftime("%Y-%m-%d %H:%M:%S")
     print(f"❌ Cancelled order: {order_id}")
     return {"message": "Order cancelled", "order": orders_db[order_id]}
@@ -164,7 +193,7 @@ def confirm_order(order_id: str):
     if orders_db[order_id]["status"] != "pending":
         raise HTTPException(status_code=400, detail="Order can only be confirmed from pending status")
     
-    orders_db[order_id]["status"] = "confirmed"
+    set_order_status(order_id, "confirmed")
     orders_db[order_id]["updated_at"] = time.strftime("%Y-%m-%d %H:%M:%S")
     print(f"✅ Confirmed order: {order_id}")
     return {"message": "Order confirmed", "order": orders_db[order_id]}
@@ -177,7 +206,7 @@ def ship_order(order_id: str, tracking_number: str = None):
     if orders_db[order_id]["status"] != "confirmed":
         raise HTTPException(status_code=400, detail="Order must be confirmed before shipping")
     
-    orders_db[order_id]["status"] = "shipped"
+    set_order_status(order_id, "shipped")
     orders_db[order_id]["tracking_number"] = tracking_number or f"TRACK{random.randint(100000, 999999)}"
     orders_db[order_id]["updated_at"] = time.strftime("%Y-%m-%d %H:%M:%S")
     print(f"🚚 Shipped order: {order_id} with tracking: {orders_db[order_id]['tracking_number']}")
@@ -191,7 +220,7 @@ def deliver_order(order_id: str):
     if orders_db[order_id]["status"] != "shipped":
         raise HTTPException(status_code=400, detail="Order must be shipped before delivery")
     
-    orders_db[order_id]["status"] = "delivered"
+    set_order_status(order_id, "delivered")
     orders_db[order_id]["delivered_at"] = time.strftime("%Y-%m-%d %H:%M:%S")
     orders_db[order_id]["updated_at"] = time.strftime("%Y-%m-%d %H:%M:%S")
     print(f"🎉 Delivered order: {order_id}")
@@ -209,31 +238,22 @@ def get_user_orders(user_id: str):
 
 @app.get("/health")
 def health():
-    status_counts = {}
-    for order in orders_db.values():
-        status = order["status"]
-        status_counts[status] = status_counts.get(status, 0) + 1
-    
     return {
         "status": "healthy", 
         "service": "order_service",
         "total_orders": len(orders_db),
-        "order_statuses": status_counts,
+        "order_statuses": dict(status_counts),
         "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
     }
 
 @app.get("/stats")
 def get_stats():
     total_revenue = sum(order["total_amount"] for order in orders_db.values() if order["status"] != "cancelled")
-    status_counts = {}
-    for order in orders_db.values():
-        status = order["status"]
-        status_counts[status] = status_counts.get(status, 0) + 1
     
     return {
         "total_orders": len(orders_db),
         "total_revenue": total_revenue,
-        "order_statuses": status_counts,
+        "order_statuses": dict(status_counts),
         "last_order_id": order_id_counter - 1
     }
 
@@ -243,7 +263,9 @@ def test():
     return {"message": "Order Service REST endpoint working"}
 
 if __name__ == "__main__":
-    print("✅ Order Service (REST) starting on port 8003")
+    # The gateway passes SERVICE_PORT when it runs several instances
+    port = service_port
+    print(f"✅ Order Service (REST) starting on port {port}")
     print("📦 Available endpoints:")
     print("   POST /orders/ - Create order")
     print("   GET /orders/{id} - Get order")
@@ -257,4 +279,4 @@ if __name__ == "__main__":
     print("   GET /health - Health check")
     print("   GET /stats - Service statistics")
     print("   GET /test - Test endpoint")
-    uvicorn.run(app, host="0.0.0.0", port=8003, log_level="info")
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=port, log_level="info")
\ No newline at end of file
@@ -11,8 +11,21 @@ project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if project_root not in sys.path:
     sys.path.append(project_root)
 
+from shared.heartbeat import send_heartbeats
+from shared.registration import register_with_gateway
+from shared.metrics import instrument
+
 app = FastAPI(title="Product Service")
 
+# Request count, error and latency metrics served on GET /metrics
+metrics_registry = instrument(app)
+
+# Heartbeats to the gateway (only when started by the gateway), or
+# registration with the gateway's registry (only when GATEWAY_REGISTRY_URL is set)
+service_port = int(os.environ.get("SERVICE_PORT", 8002))
+send_heartbeats(app, "product", service_port)
+register_with_gateway(app, "product", service_port)
+
 # In-memory database
 products_db = {}
 product_id_counter = 1
@@ -217,7 +230,9 @@ def test():
     return {"message": "Product Service REST endpoint working"}
 
 if __name__ == "__main__":
-    print("✅ Product Service (REST) starting on port 8002")
+    # The gateway passes SERVICE_PORT when it runs several instances
+    port = service_port
+    print(f"✅ Product Service (REST) starting on port {port}")
     print("🛍️ Available endpoints:")
     print("   POST /products/ - Create product")
     print("   GET /products/{id} - Get product")
@@ -230,4 +245,4 @@ if __name__ == "__main__":
     print("   GET /health - Health check")
     print("   GET /stats - Service statistics")
     print("   GET /test - Test endpoint")
-    uvicorn.run(app, host="0.0.0.0", port=8002, log_level="info")
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=port, log_level="info")
\ No newline at end of file
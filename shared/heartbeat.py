@@ -0,0 +1,132 @@
+# HEARTBEATS FROM SERVICES TO THE GATEWAY
+# A service started by the gateway gets HEARTBEAT_ADDR ("host:port") in its
+# environment and sends a small JSON datagram there every HEARTBEAT_INTERVAL
+# seconds: its port, pid, in-flight requests, queue depth, RSS and version.
+# The gateway marks the instance down after a few missed beats, so it no
+# longer has to poll /health to notice a dead process.
+import asyncio
+import json
+import os
+import socket
+import sys
+import time
+from typing import Dict, Optional
+
+HEARTBEAT_ADDR_ENV = "HEARTBEAT_ADDR"
+HEARTBEAT_INTERVAL_ENV = "HEARTBEAT_INTERVAL"
+
+
+# ASGI middleware counting HTTP requests being served
+class InFlightMiddleware:
+    def __init__(self, app, sender: "HeartbeatSender"):
+        self.app = app
+        self.sender = sender
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        self.sender.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.sender.in_flight -= 1
+
+
+class HeartbeatSender:
+    """Sends one UDP datagram per interval from the service's event loop."""
+
+    def __init__(self, service: str, port: int, addr: str, interval: float = 0.5, version: str = ""):
+        host, _, target_port = addr.rpartition(":")
+        self.service = service
+        self.port = port
+        self.target = (host or "127.0.0.1", int(target_port))
+        self.interval = interval
+        self.version = version
+        self.in_flight = 0
+        self.seq = 0
+        self._sock: Optional[socket.socket] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def payload(self) -> Dict:
+        self.seq += 1
+        return {
+            "service": self.service,
+            "port": self.port,
+            "pid": os.getpid(),
+            "seq": self.seq,
+            "in_flight": self.in_flight,
+            "queue_depth": _queue_depth(),
+            "rss_bytes": _rss_bytes(),
+            "version": self.version,
+            "sent_at": time.time(),
+        }
+
+    async def start(self):
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.setblocking(False)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._sock:
+            self._sock.close()
+            self._sock = None
+
+    async def _run(self):
+        while True:
+            try:
+                self._sock.sendto(json.dumps(self.payload()).encode(), self.target)
+            except OSError:
+                pass  # nobody listening (gateway restarting); keep beating
+            await asyncio.sleep(self.interval)
+
+
+# Send heartbeats while the app runs, if the gateway asked for them
+def send_heartbeats(app, service: str, port: int) -> Optional[HeartbeatSender]:
+    addr = os.environ.get(HEARTBEAT_ADDR_ENV)
+    if not addr:
+        return None
+    sender = HeartbeatSender(service, port, addr, float(os.environ.get(HEARTBEAT_INTERVAL_ENV, 0.5)), app.version)
+    app.add_middleware(InFlightMiddleware, sender=sender)
+    app.add_event_handler("startup", sender.start)
+    app.add_event_handler("shutdown", sender.stop)
+    return sender
+
+
+# Requests waiting for a worker thread (sync endpoints run in anyio's pool)
+def _queue_depth() -> int:
+    try:
+        from anyio.to_thread import current_default_thread_limiter
+        return current_default_thread_limiter().statistics().tasks_waiting
+    except Exception:
+        return 0
+
+
+# Resident set size of this process in bytes, or None if unknown
+def _rss_bytes() -> Optional[int]:
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                        ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                        ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                        ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        handle = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+            return counters.WorkingSetSize
+        return None
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
@@ -0,0 +1,249 @@
+# PROMETHEUS-STYLE METRICS SHARED BY THE GATEWAY AND THE SERVICES
+# Counters and histograms are recorded into per-thread shards so the hot path
+# never takes a lock; shards are only merged when /metrics is scraped.
+import bisect
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Latency buckets in seconds, doubling from 0.5 ms to ~33 s
+LATENCY_BUCKETS = tuple(0.0005 * 2 ** i for i in range(17))
+
+
+class _Sharded:
+    """Base for metrics whose values live in one dict per thread."""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards: List[Dict] = []
+        self._shards_lock = threading.Lock()
+
+    # This thread's shard, registered on first use
+    def _shard(self) -> Dict:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._shards_lock:
+                self._shards.append(shard)
+            return shard
+
+    # Snapshot of every shard's (labels, value) pairs
+    def _collect(self) -> List[Tuple[Tuple, object]]:
+        with self._shards_lock:
+            shards = list(self._shards)
+        items = []
+        for shard in shards:
+            while True:
+                try:
+                    items.extend(list(shard.items()))
+                    break
+                except RuntimeError:
+                    # The owning thread added a label set while we copied
+                    continue
+        return items
+
+    def _labels(self, labelvalues: Tuple) -> str:
+        return _format_labels(self.labelnames, labelvalues)
+
+
+class Counter(_Sharded):
+    """Monotonic counter with optional labels."""
+
+    def inc(self, *labelvalues, amount: float = 1):
+        shard = self._shard()
+        shard[labelvalues] = shard.get(labelvalues, 0) + amount
+
+    # Merged value per label set
+    def values(self) -> Dict[Tuple, float]:
+        merged: Dict[Tuple, float] = {}
+        for labels, value in self._collect():
+            merged[labels] = merged.get(labels, 0) + value
+        return merged
+
+    def total(self) -> float:
+        return sum(self.values().values())
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.values().items()):
+            lines.append(f"{self.name}{self._labels(labels)} {_number(value)}")
+        return lines
+
+
+class Histogram(_Sharded):
+    """Histogram with fixed (log-spaced by default) bucket upper bounds."""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labelvalues):
+        shard = self._shard()
+        entry = shard.get(labelvalues)
+        if entry is None:
+            # Per-bucket counts (last one is +Inf), then the sum
+            entry = shard[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+        entry[bisect.bisect_left(self.buckets, value)] += 1
+        entry[-1] += value
+
+    def render(self) -> List[str]:
+        merged: Dict[Tuple, List] = {}
+        for labels, entry in self._collect():
+            total = merged.get(labels)
+            if total is None:
+                merged[labels] = list(entry)
+            else:
+                for i, value in enumerate(entry):
+                    total[i] += value
+
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, entry in sorted(merged.items()):
+            label_text = self._labels(labels)
+            prefix = label_text[:-1] + "," if label_text else "{"
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), entry[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{self.name}_bucket{prefix}le="{le}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{label_text} {entry[-1]}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """Value read from a callback at scrape time.
+
+    The callback returns a number, or a dict mapping label value tuples to
+    numbers.
+    """
+
+    def __init__(self, name: str, help_text: str, callback: Callable, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        value = self.callback()
+        if not isinstance(value, dict):
+            value = {(): value}
+        for labels, number in sorted(value.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_number(number)}")
+        return lines
+
+
+class Registry:
+    """Collection of metrics rendered together in the text exposition format."""
+
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def gauge(self, name: str, help_text: str, callback: Callable, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, help_text, callback, labelnames))
+
+    def _register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Request count, error count and latency metrics of an HTTP app
+class HttpMetrics:
+    def __init__(self, registry: Registry, prefix: str = "http"):
+        self.requests = registry.counter(
+            f"{prefix}_requests_total", "HTTP requests by route, method and status",
+            ("route", "method", "status"))
+        self.errors = registry.counter(
+            f"{prefix}_request_errors_total", "HTTP requests that failed with a 5xx status or an exception",
+            ("route", "method"))
+        self.latency = registry.histogram(
+            f"{prefix}_request_duration_seconds", "Time to serve HTTP requests by route, method and status",
+            ("route", "method", "status"))
+
+
+# ASGI middleware recording count, errors and latency of every HTTP request.
+# The route label is the matched route template (e.g. /orders/{order_id}), or
+# scope["metrics_route"] when the app sets one, so unknown paths cannot blow up
+# the number of label sets.
+class MetricsMiddleware:
+    def __init__(self, app, metrics: HttpMetrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = _route_label(scope)
+            method = scope["method"]
+            code = str(status["code"])
+            self.metrics.requests.inc(route, method, code)
+            self.metrics.latency.observe(time.perf_counter() - started, route, method, code)
+            if status["code"] >= 500:
+                self.metrics.errors.inc(route, method)
+
+
+def _route_label(scope) -> str:
+    override: Optional[str] = scope.get("metrics_route")
+    if override:
+        return override
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+# Add GET /metrics and the request middleware to a FastAPI app
+def instrument(app, registry: Optional[Registry] = None, prefix: str = "http") -> Registry:
+    from fastapi.responses import PlainTextResponse
+
+    registry = registry or Registry()
+    app.add_middleware(MetricsMiddleware, metrics=HttpMetrics(registry, prefix))
+
+    @app.get("/metrics", include_in_schema=False)
+    def metrics():
+        return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+    return registry
+
+
+def _format_labels(labelnames: Tuple, labelvalues: Tuple) -> str:
+    if not labelnames:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in zip(labelnames, labelvalues)) + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
@@ -0,0 +1,89 @@
+# SELF-REGISTRATION WITH THE GATEWAY REGISTRY
+# A service started outside the gateway (e.g. extra product_service capacity)
+# joins the gateway's pool when GATEWAY_REGISTRY_URL is set, for example
+#   GATEWAY_REGISTRY_URL=http://localhost:8000/management/registry SERVICE_PORT=8010 python product_service/server.py
+# It registers on startup, renews its lease at a third of the TTL, registers
+# again if the lease was lost, and deregisters on shutdown. The registry
+# endpoints are management endpoints, so it calls them with the manager role.
+import asyncio
+import json
+import os
+import urllib.error
+import urllib.request
+from typing import Dict, Optional
+
+REGISTRY_URL_ENV = "GATEWAY_REGISTRY_URL"
+
+
+class GatewayRegistration:
+    """Keeps one instance registered with the gateway."""
+
+    def __init__(self, registry_url: str, service: str, host: str, port: int, weight: int = 1,
+                 metadata: Optional[Dict] = None, ttl: float = 10.0):
+        self.registry_url = registry_url.rstrip("/")
+        self.service = service
+        self.body = {"host": host, "port": port, "weight": weight, "metadata": metadata or {}, "ttl": ttl}
+        self.ttl = ttl
+        self.lease_id: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _call(self, method: str, url: str, body: Optional[Dict] = None) -> Dict:
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(url, data=data, method=method, headers={"Content-Type": "application/json", "user-role": "manager"})
+        with urllib.request.urlopen(request, timeout=2) as response:
+            return json.loads(response.read() or b"{}")
+
+    async def _request(self, method: str, url: str, body: Optional[Dict] = None) -> Dict:
+        return await asyncio.to_thread(self._call, method, url, body)
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.lease_id:
+            try:
+                await self._request("DELETE", f"{self.registry_url}/leases/{self.lease_id}")
+            except (OSError, ValueError):
+                pass
+            self.lease_id = None
+
+    async def _run(self):
+        while True:
+            try:
+                if self.lease_id is None:
+                    lease = await self._request("POST", f"{self.registry_url}/{self.service}", self.body)
+                    self.lease_id = lease["lease_id"]
+                    print(f"📝 Registered with the gateway (lease {self.lease_id})")
+                else:
+                    await self._request("PUT", f"{self.registry_url}/leases/{self.lease_id}")
+            except urllib.error.HTTPError as e:
+                if e.code == 404 and self.lease_id:
+                    self.lease_id = None  # lease expired; register again right away
+                    continue
+                print(f"⚠️ Gateway registration failed: {e}")
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Gateway registration failed: {e}")
+            await asyncio.sleep(self.ttl / 3)
+
+
+# Register with the gateway while the app runs, if GATEWAY_REGISTRY_URL is set.
+# SERVICE_HOST, SERVICE_WEIGHT and REGISTRY_TTL override the defaults.
+def register_with_gateway(app, service: str, port: int) -> Optional[GatewayRegistration]:
+    registry_url = os.environ.get(REGISTRY_URL_ENV)
+    if not registry_url:
+        return None
+    registration = GatewayRegistration(
+        registry_url, service,
+        host=os.environ.get("SERVICE_HOST", "localhost"),
+        port=port,
+        weight=int(os.environ.get("SERVICE_WEIGHT", 1)),
+        metadata={"version": app.version, "pid": os.getpid()},
+        ttl=float(os.environ.get("REGISTRY_TTL", 10)),
+    )
+    app.add_event_handler("startup", registration.start)
+    app.add_event_handler("shutdown", registration.stop)
+    return registration
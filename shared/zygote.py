@@ -0,0 +1,144 @@
+# ZYGOTE: A WARM INTERPRETER THAT FORKS SERVICE PROCESSES
+# Importing fastapi, pydantic and uvicorn takes most of a service's start
+# time. The gateway runs one zygote per service instead:
+#   python shared/zygote.py <control fd> product_service/server.py
+# It imports everything the service script imports at top level, then waits
+# on a SOCK_SEQPACKET control socket shared with the gateway. Every request
+# carries the environment of a new instance and the pipes for its stdout and
+# stderr; the zygote forks, and the child runs the script as __main__ with
+# the imports already loaded. The zygote reports the pid of every child and
+# its exit code when it exits. Like the zygote, every child starts a session
+# of its own, out of reach of signals sent to the gateway's process group.
+# POSIX only (fork, fd passing).
+import ast
+import importlib
+import io
+import json
+import os
+import runpy
+import select
+import signal
+import socket
+import sys
+import time
+import traceback
+
+# Imported by uvicorn.run() on demand rather than at import time
+UVICORN_MODULES = [
+    "uvicorn.loops.auto",
+    "uvicorn.protocols.http.auto",
+    "uvicorn.protocols.websockets.auto",
+    "uvicorn.lifespan.on",
+]
+
+
+# Top-level absolute imports of a script
+def script_imports(script: str):
+    with open(script, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), script)
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                yield alias.name
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            yield node.module
+
+
+def preload(script: str) -> int:
+    loaded = 0
+    for module in [*script_imports(script), *UVICORN_MODULES]:
+        try:
+            importlib.import_module(module)
+            loaded += 1
+        except Exception as e:
+            print(f"⚠️ Zygote could not preload {module}: {e}", file=sys.stderr)
+    return loaded
+
+
+# In the child: become the service process (never returns)
+def run_child(script: str, env: dict, fds: list, control: socket.socket):
+    code = 1
+    try:
+        os.setsid()
+        control.close()
+        devnull = os.open(os.devnull, os.O_RDWR)
+        os.dup2(devnull, 0)
+        for target, fd in zip((1, 2), fds or (devnull, devnull)):
+            os.dup2(fd, target)
+        for fd in {devnull, *fds}:
+            os.close(fd)
+        os.environ.clear()
+        os.environ.update(env)
+        encoding = env.get("PYTHONIOENCODING", "utf-8")
+        sys.stdout = io.TextIOWrapper(io.FileIO(1, "w", closefd=False), encoding, line_buffering=True,
+                                      write_through=True)
+        sys.stderr = io.TextIOWrapper(io.FileIO(2, "w", closefd=False), encoding, "backslashreplace",
+                                      line_buffering=True, write_through=True)
+        sys.argv = [script]
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        runpy.run_path(script, run_name="__main__")
+        code = 0
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(code)
+
+
+def serve(control: socket.socket, script: str):
+    children = set()
+    while True:
+        readable, _, _ = select.select([control], [], [], 0.05)
+        if readable:
+            message, fds, _, _ = socket.recv_fds(control, 65536, 2)
+            if not message:
+                break  # the gateway went away
+            request = json.loads(message)
+            pid = os.fork()
+            if pid == 0:
+                run_child(script, request["env"], fds, control)
+            for fd in fds:
+                os.close(fd)
+            children.add(pid)
+            control.send(json.dumps({"id": request["id"], "pid": pid}).encode())
+
+        while children:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                break
+            children.discard(pid)
+            control.send(json.dumps({"exit": pid, "code": os.waitstatus_to_exitcode(status)}).encode())
+
+    for pid in children:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+
+def main():
+    control = socket.socket(fileno=int(sys.argv[1]))
+    script = os.path.abspath(sys.argv[2])
+    # The same import path the script gets when run directly, plus the
+    # project root for the shared modules
+    sys.path[0] = os.path.dirname(script)
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if project_root not in sys.path:
+        sys.path.append(project_root)
+    # The gateway stops the zygote by closing the control socket
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    started = time.monotonic()
+    loaded = preload(script)
+    control.send(json.dumps({"ready": True, "modules": loaded,
+                             "preload_s": round(time.monotonic() - started, 3)}).encode())
+    serve(control, script)
+
+
+if __name__ == "__main__":
+    main()
@@ -11,8 +11,21 @@ project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if project_root not in sys.path:
     sys.path.append(project_root)
 
+from shared.heartbeat import send_heartbeats
+from shared.registration import register_with_gateway
+from shared.metrics import instrument
+
 app = FastAPI(title="User Service")
 
+# Request count, error and latency metrics served on GET /metrics
+metrics_registry = instrument(app)
+
+# Heartbeats to the gateway (only when started by the gateway), or
+# registration with the gateway's registry (only when GATEWAY_REGISTRY_URL is set)
+service_port = int(os.environ.get("SERVICE_PORT", 8001))
+send_heartbeats(app, "user", service_port)
+register_with_gateway(app, "user", service_port)
+
 # In-memory database (replace with real DB in production)
 users_db = {}
 user_id_counter = 1
@@ -140,7 +153,9 @@ def test():
     return {"message": "User Service REST endpoint working"}
 
 if __name__ == "__main__":
-    print("✅ User Service (REST) starting on port 8001")
+    # The gateway passes SERVICE_PORT when it runs several instances
+    port = service_port
+    print(f"✅ User Service (REST) starting on port {port}")
     print("📝 Available endpoints:")
     print("   POST /users/ - Create user")
     print("   GET /users/{id} - Get user")
@@ -151,4 +166,4 @@ if __name__ == "__main__":
     print("   GET /health - Health check")
     print("   GET /stats - Service statistics")
     print("   GET /test - Test endpoint")
-    uvicorn.run(app, host="0.0.0.0", port=8001, log_level="info")
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=port, log_level="info")
\ No newline at end of file